@@ -1,136 +1,351 @@
 import streamlit as st
-from assistant.graph import assistant
+from assistant.graph import builder
+from assistant.tools import get_job_queue, merge_processed_files, save_report
+from assistant.search import case_search_index, read_sections
+from assistant.serialization import dump_json, validate
+from assistant.ingest import spool_upload, UploadTooLarge
+from assistant.checkpointer import StoreCheckpointer, config_for_case
 from assistant.state import State, CaseData, UserData
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, ToolMessage
-from assistant.configuration import firebase_app, firestore_db
-from assistant import prompts
+from assistant.configuration import firebase_app, firestore_db, store
+from assistant.report import shared_builder
+from assistant.message_log import MessageLog
+from assistant import planner, prompts, telemetry
 import asyncio
 from typing import List, Dict, Any
 import json
 import os
 from dotenv import load_dotenv
 from datetime import date, datetime
+from pydantic import BaseModel
+import hashlib
+import uuid
 
 # Load environment variables
 load_dotenv()
 
+# Number of latest messages rendered in full, and page size of the collapsed history
+CHAT_WINDOW = 20
+CHAT_PAGE = 20
+
 # Set up the page
 st.set_page_config(page_title="Legal Case Intake Assistant", layout="wide")
 st.title("Legal Case Intake Assistant")
 
+@st.cache_resource
+def start_job_queue():
+    """Start the document processing workers once per server process."""
+    job_queue = get_job_queue()
+    job_queue.start_in_thread()
+    return job_queue
+
+job_queue = start_job_queue()
+
+@st.cache_resource
+def get_assistant():
+    """Compile the graph with the store-backed checkpointer once per server process."""
+    return builder.compile(checkpointer=StoreCheckpointer(store))
+
+assistant = get_assistant()
+
+message_log = MessageLog(store, page_size=CHAT_PAGE)
+
+def stream_report(case_id: str, case_data: CaseData):
+    """Drive the async report stream from Streamlit's synchronous script."""
+    loop = asyncio.new_event_loop()
+    # The builder is shared with end_interview, sections built by either are reused
+    sections = shared_builder(store).stream(case_id, case_data)
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(sections.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(sections.aclose())
+        loop.close()
+
+async def load_case(case_id: str) -> State:
+    """Resume the interview of a case: its data from the store, the latest messages and summary from the log."""
+    state = State(case_id=case_id)
+    # Older messages are paged in from the log on demand, see the chat history below
+    resumed = await message_log.resume(case_id, CHAT_WINDOW)
+    st.session_state.history_cursor = resumed.cursor
+    st.session_state.log_summary = resumed.summary
+    state.messages.extend(resumed.messages)
+    if resumed.summary:
+        state.summary = resumed.summary.text
+    if case_doc := await store.get(("case-data", case_id)):
+        state.case_data = validate(CaseData, await read_sections(store, case_id, case_doc.data))
+    if user_doc := await store.get(("users", case_id)):
+        state.user_data = validate(UserData, user_doc.data)
+    return state
+
 # Initialize session state
+if "queued_uploads" not in st.session_state:
+    st.session_state.queued_uploads = set()
+    st.session_state.uploaded_bytes = 0
+
 if "state" not in st.session_state:
-    st.session_state.state = State()
+    if case_id := st.query_params.get("case_id"):
+        st.session_state.state = asyncio.run(load_case(case_id))
+    else:
+        st.session_state.state = State()
+        st.query_params["case_id"] = st.session_state.state.case_id
     st.session_state.messages = st.session_state.state.messages
     st.session_state.case_data = st.session_state.state.case_data
     st.session_state.user_data = st.session_state.state.user_data
-    
+    # Messages up to this index are already part of the checkpointed thread
+    st.session_state.synced_messages = len(st.session_state.messages)
+
     # Add initial disclaimer message
-    st.session_state.messages.append(
-        AIMessage(content=prompts.DISCLAIMER)
+    if not st.session_state.messages:
+        st.session_state.messages.append(
+            AIMessage(content=prompts.DISCLAIMER, id=str(uuid.uuid4()))
+        )
+
+def section_version(*parts: Any) -> str:
+    """Hash of a sidebar section's content, the render cache key of the section."""
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(dump_json(part) if isinstance(part, BaseModel) else repr(part).encode())
+    return digest.hexdigest()
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def render_basic_info(version: str, case_id: str, _case_data: CaseData) -> str:
+    """Render the basic information section."""
+    lines = [f"**Case ID:** {case_id}", f"**Intake Date:** {_case_data.intake_date}"]
+    if _case_data.user_data:
+        lines.append("#### 👤 Client Information")
+        user = _case_data.user_data
+        if user.first_name or user.last_name:
+            lines.append(f"**Name:** {user.first_name} {user.last_name}")
+        if user.email:
+            lines.append(f"**Email:** {user.email}")
+        if user.phone:
+            lines.append(f"**Phone:** {user.phone}")
+        if user.preferred_contact_method:
+            lines.append(f"**Preferred Contact:** {user.preferred_contact_method}")
+    return "\n\n".join(lines)
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def render_incident(version: str, _incident: Any) -> str:
+    """Render the incident section."""
+    lines = [
+        f"**Date:** {_incident.incident_date or 'Unknown'}",
+        f"**Type:** {_incident.incident_type}",
+        f"**Location:** {_incident.incident_location}",
+    ]
+    if _incident.incident_description:
+        lines += ["**Description:**", _incident.incident_description]
+    return "\n\n".join(lines)
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def render_medical(version: str, _medical: Any) -> str:
+    """Render the medical section."""
+    lines = []
+    if _medical.initial_treatment:
+        lines.append(f"**Initial Treatment:** {_medical.initial_treatment}")
+    if _medical.treatment_facilities:
+        lines.append("**Facilities:**\n" + "\n".join(f"- {facility}" for facility in _medical.treatment_facilities))
+    if _medical.current_treatment:
+        lines.append(f"**Current Treatment:** {_medical.current_treatment}")
+    return "\n\n".join(lines)
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def render_damages(version: str, _damages: Any) -> str:
+    """Render the damages section."""
+    lines = []
+    if _damages.medical_expenses:
+        lines.append(f"**Medical Expenses:** ${_damages.medical_expenses:,.2f}")
+    if _damages.lost_wages:
+        lines.append(f"**Lost Wages:** ${_damages.lost_wages:,.2f}")
+    if _damages.property_damage:
+        lines.append(f"**Property Damage:** ${_damages.property_damage:,.2f}")
+    return "\n\n".join(lines)
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def render_insurance(version: str, _insurance: Any) -> str:
+    """Render the insurance section."""
+    if not _insurance.client_insurance:
+        return ""
+    return (
+        "**Insurance Information:**\n"
+        f"- Company: {_insurance.client_insurance.company_name}\n"
+        f"- Policy #: {_insurance.client_insurance.policy_number}"
     )
 
-# Sidebar for file uploads and case info
-with st.sidebar:
-    st.header("Case Documents")
-    uploaded_files = st.file_uploader("Upload relevant documents", 
-                                    accept_multiple_files=True,
-                                    type=['pdf', 'png', 'jpg', 'jpeg'])
-    
-    if uploaded_files:
-        for file in uploaded_files:
-            try:
-                file_content = file.read()
-                human_msg = HumanMessage(content=f"I'm uploading a file named {file.name}")
-                st.session_state.messages.append(human_msg)
-            except Exception as e:
-                st.error(f"Error processing file {file.name}: {str(e)}")
+@st.cache_data(max_entries=256, show_spinner=False)
+def render_documents(version: str, _listing: List[tuple]) -> str:
+    """Render the document listing."""
+    return "\n".join(f"- {file_name} ({file_type})" for _, file_name, file_type in _listing)
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def render_legal(version: str, _legal: Any) -> str:
+    """Render the legal section."""
+    lines = []
+    if _legal.prior_attorneys:
+        lines.append(f"**Prior Attorneys:** {_legal.prior_attorneys}")
+    if _legal.legal_deadlines:
+        lines.append(f"**Important Deadlines:** {_legal.legal_deadlines}")
+    return "\n\n".join(lines)
 
-    # Display current case data
+# The sidebar panels are fragments: their own widgets rerun only the panel, not the
+# chat and the other panels. A chat turn or an upload still reruns them all, then
+# each section is served from the render cache unless its content hash changed.
+@st.fragment
+def case_info() -> None:
+    """The current case data, section by section, and the case report."""
     st.header("Case Information")
+    case_id = st.session_state.state.case_id
     case_data = st.session_state.case_data
 
     with st.expander("📋 Basic Information", expanded=True):
-        st.write(f"**Case ID:** {case_data.case_id}")
-        st.write(f"**Intake Date:** {case_data.intake_date}")
-        
-        if case_data.user_data:
-            st.subheader("👤 Client Information")
-            user = case_data.user_data
-            if user.first_name or user.last_name:
-                st.write(f"**Name:** {user.first_name} {user.last_name}")
-            if user.email:
-                st.write(f"**Email:** {user.email}")
-            if user.phone:
-                st.write(f"**Phone:** {user.phone}")
-            if user.preferred_contact_method:
-                st.write(f"**Preferred Contact:** {user.preferred_contact_method}")
+        st.markdown(render_basic_info(
+            section_version(case_id, case_data.intake_date, case_data.user_data), case_id, case_data
+        ))
 
     with st.expander("🚨 Incident Details"):
         if case_data.incident_details:
-            incident = case_data.incident_details
-            st.write(f"**Date:** {incident.incident_date}")
-            st.write(f"**Type:** {incident.incident_type}")
-            st.write(f"**Location:** {incident.incident_location}")
-            if incident.incident_description:
-                st.write("**Description:**")
-                st.write(incident.incident_description)
+            st.markdown(render_incident(section_version(case_data.incident_details), case_data.incident_details))
         else:
             st.info("No incident details provided yet")
 
     with st.expander("🏥 Medical Information"):
         if case_data.medical_info:
-            medical = case_data.medical_info
-            if medical.initial_treatment:
-                st.write(f"**Initial Treatment:** {medical.initial_treatment}")
-            if medical.treatment_facilities:
-                st.write("**Facilities:**")
-                for facility in medical.treatment_facilities:
-                    st.write(f"- {facility}")
-            if medical.current_treatment:
-                st.write(f"**Current Treatment:** {medical.current_treatment}")
+            st.markdown(render_medical(section_version(case_data.medical_info), case_data.medical_info))
         else:
             st.info("No medical information provided yet")
 
     with st.expander("💰 Damages & Insurance"):
         if case_data.damages_info:
-            damages = case_data.damages_info
-            if damages.medical_expenses:
-                st.write(f"**Medical Expenses:** ${damages.medical_expenses:,.2f}")
-            if damages.lost_wages:
-                st.write(f"**Lost Wages:** ${damages.lost_wages:,.2f}")
-            if damages.property_damage:
-                st.write(f"**Property Damage:** ${damages.property_damage:,.2f}")
+            st.markdown(render_damages(section_version(case_data.damages_info), case_data.damages_info))
         else:
             st.info("No damages information provided yet")
         
         if case_data.insurance_info:
-            insurance = case_data.insurance_info
-            if insurance.client_insurance:
-                st.write("**Insurance Information:**")
-                st.write(f"- Company: {insurance.client_insurance.company_name}")
-                st.write(f"- Policy #: {insurance.client_insurance.policy_number}")
+            st.markdown(render_insurance(section_version(case_data.insurance_info), case_data.insurance_info))
         else:
             st.info("No insurance information provided yet")
 
     with st.expander("📄 Documents"):
         if case_data.documents:
-            for doc in case_data.documents:
-                st.write(f"- {doc.file_name} ({doc.file_type})")
+            listing = [(doc.file_id, doc.file_name, doc.file_type) for doc in case_data.documents]
+            # Only the listing is hashed, never the documents' texts
+            st.markdown(render_documents(section_version(listing), listing))
         else:
             st.info("No documents uploaded yet")
 
     with st.expander("⚖️ Legal Status"):
         st.write(f"**Report Status:** {case_data.report_status}")
         if case_data.legal_info:
-            legal = case_data.legal_info
-            if legal.prior_attorneys:
-                st.write(f"**Prior Attorneys:** {legal.prior_attorneys}")
-            if legal.legal_deadlines:
-                st.write(f"**Important Deadlines:** {legal.legal_deadlines}")
+            st.markdown(render_legal(section_version(case_data.legal_info), case_data.legal_info))
         else:
             st.info("No legal information provided yet")
 
+    with st.expander("📄 Case Report"):
+        if st.button("Build Report"):
+            report = st.write_stream(stream_report(case_id, case_data))
+            # The report is stored with the case and its checkpoint, not only in this session
+            case_data = asyncio.run(save_report(assistant, case_id, report.strip()))
+            st.session_state.case_data = case_data
+            st.session_state.state.case_data = case_data
+        elif case_data.case_report:
+            st.markdown(case_data.case_report)
+        else:
+            st.info("The report is built when the interview ends")
+
+@st.fragment
+def case_search() -> None:
+    """Search across all stored cases."""
+    with st.expander("🔎 Search Cases"):
+        if query := st.text_input("Search all cases", key="case_search"):
+            # The stored search entries are loaded on the first search of the server process
+            asyncio.run(case_search_index.load(store))
+            hits = case_search_index.search(query, limit=10)
+            if not hits:
+                st.info("No matching cases")
+            for hit in hits:
+                st.markdown(f"[{hit.case_id}](?case_id={hit.case_id}) · score {hit.score:.2f}")
+                for label, terms in hit.highlights.items():
+                    st.caption(f"{label}: " + ", ".join(terms))
+
+@st.fragment
+def debug_panel() -> None:
+    """Per-turn timing breakdown, spans of this session's turns are only recorded while the panel is on."""
+    if not st.checkbox("🐞 Debug panel", key="debug_panel"):
+        st.session_state.pop("trace_exporter", None)
+        st.session_state.pop("turn_traces", None)
+        return
+    exporter = st.session_state.setdefault("trace_exporter", telemetry.InMemoryExporter(max_traces=20))
+    traces = st.session_state.get("turn_traces", [])
+    counts = planner.stats.as_dict()
+    st.caption(
+        f"Templated turns: {counts['planner_turns']} · LLM turns: {counts['llm_turns']} "
+        f"· planner ratio {counts['planner_ratio']:.0%}"
+    )
+    if not traces:
+        st.caption("Send a message to record a turn")
+    for number, trace_id in reversed(list(enumerate(traces[-5:], max(len(traces) - 4, 1)))):
+        spans = exporter.trace(trace_id)
+        if not spans:
+            continue
+        with st.expander(f"Turn {number}: {spans[0].duration_ms:,.0f} ms", expanded=number == len(traces)):
+            depth = {}
+            rows = []
+            for span in spans:
+                depth[span.span_id] = depth.get(span.parent_id, -1) + 1
+                counters = ", ".join(f"{k}={v:,.0f}" for k, v in span.counters.items())
+                rows.append(f"{'&nbsp;' * 4 * depth[span.span_id]}`{span.name}` {span.duration_ms:,.1f} ms {counters}")
+            st.markdown("  \n".join(rows))
+            st.json(telemetry.summarize(spans), expanded=False)
+
+# Sidebar for file uploads and case info
+with st.sidebar:
+    st.header("Case Documents")
+    uploaded_files = st.file_uploader("Upload relevant documents", 
+                                    accept_multiple_files=True,
+                                    type=['pdf', 'png', 'jpg', 'jpeg'])
+    
+    case_id = st.session_state.state.case_id
+    if uploaded_files:
+        for file in uploaded_files:
+            try:
+                if file.file_id in st.session_state.queued_uploads:
+                    continue
+                # Hash, size-check and spool the upload in one streaming pass
+                upload = spool_upload(
+                    file, file.name, file.type,
+                    session_bytes=st.session_state.uploaded_bytes,
+                    spool_dir=job_queue.spool_dir
+                )
+                job_queue.submit(case_id, [upload.as_job_file()])
+                st.session_state.queued_uploads.add(file.file_id)
+                st.session_state.uploaded_bytes += upload.size
+                human_msg = HumanMessage(content=f"I'm uploading a file named {file.name}")
+                st.session_state.messages.append(human_msg)
+            except UploadTooLarge as e:
+                st.error(str(e))
+            except Exception as e:
+                st.error(f"Error processing file {file.name}: {str(e)}")
+
+    # Per-file progress of the background processing
+    for job in job_queue.progress(case_id):
+        if job["status"] == "done":
+            st.caption(f"✅ {job['file_name']}")
+        elif job["status"] == "failed":
+            st.caption(f"❌ {job['file_name']}: {job['error']}")
+        else:
+            st.caption(f"⏳ {job['file_name']} ({job['status']})")
+    # Finished uploads go into the stored case and the interview checkpoint, not just this session
+    if merged_case := asyncio.run(merge_processed_files(assistant, case_id)):
+        st.session_state.case_data = merged_case
+        st.session_state.state.case_data = merged_case
+
+    case_info()
+    case_search()
+    debug_panel()
+
 # Chat interface
 chat_container = st.container()
 
@@ -151,24 +366,75 @@ div[data-testid="stHorizontalBlock"] {
 </style>
 """, unsafe_allow_html=True)
 
-# Display chat messages
-with chat_container:
-    if st.session_state.messages:
-        for msg in st.session_state.messages:
-            if isinstance(msg, HumanMessage):
-                col1, col2 = st.columns([4, 1])
-                with col2:
-                    with st.chat_message("user", avatar="👤"):
-                        st.markdown(msg.content)
-            elif isinstance(msg, AIMessage):
-                col1, col2 = st.columns([1, 4])
-                with col1:
-                    with st.chat_message("assistant", avatar="🤖"):
-                        st.markdown(msg.content)
-            elif isinstance(msg, ToolMessage):
-                continue
-    else:
+def render_message(msg: Any) -> None:
+    """Render one chat message in its column."""
+    if isinstance(msg, HumanMessage):
+        col1, col2 = st.columns([4, 1])
+        with col2:
+            with st.chat_message("user", avatar="👤"):
+                st.markdown(msg.content)
+    elif isinstance(msg, AIMessage):
+        col1, col2 = st.columns([1, 4])
+        with col1:
+            with st.chat_message("assistant", avatar="🤖"):
+                st.markdown(msg.content)
+
+def render_history_page(messages: List[Any]) -> str:
+    """Render a page of older messages as a single markdown transcript."""
+    lines = []
+    for msg in messages:
+        if isinstance(msg, HumanMessage):
+            lines.append(f"**👤 You:** {msg.content}")
+        elif isinstance(msg, AIMessage):
+            lines.append(f"**🤖 Assistant:** {msg.content}")
+    return "\n\n---\n\n".join(lines)
+
+@st.fragment
+def chat_history() -> None:
+    """The latest window of messages in full, older messages collapsed in pages.
+
+    Paging through the history reruns only this fragment, not the sidebar.
+    """
+    if not st.session_state.messages:
         st.info("Start a conversation by typing a message below! 👇")
+        return
+    # Tool calls and their results are not shown, the follow-up question answers the client
+    messages = [
+        msg for msg in st.session_state.messages
+        if isinstance(msg, HumanMessage) or (isinstance(msg, AIMessage) and msg.content and not msg.tool_calls)
+    ]
+    window_start = max(len(messages) - CHAT_WINDOW, 0)
+    pages = [
+        messages[max(end - CHAT_PAGE, 0):end]
+        for end in range(window_start, 0, -CHAT_PAGE)
+    ]
+    shown_pages = st.session_state.get("history_pages", 0)
+    if shown_pages < len(pages):
+        hidden = sum(len(page) for page in pages[shown_pages:])
+        if st.button(f"Show earlier messages ({hidden} hidden)"):
+            st.session_state.history_pages = shown_pages + 1
+            st.rerun(scope="fragment")
+    elif st.session_state.get("history_cursor"):
+        if st.button("Load earlier messages"):
+            # The next older page of the case's message log goes in front of the loaded messages
+            older, st.session_state.history_cursor = asyncio.run(message_log.page(
+                st.session_state.state.case_id, st.session_state.history_cursor
+            ))
+            st.session_state.messages[0:0] = older
+            st.session_state.synced_messages += len(older)
+            st.session_state.history_pages = shown_pages + 1
+            st.rerun(scope="fragment")
+    if summary := st.session_state.get("log_summary"):
+        with st.expander("Summary of the earlier conversation"):
+            st.markdown(summary.text)
+    for page in reversed(pages[:shown_pages]):
+        with st.expander(f"Earlier messages ({len(page)})"):
+            st.markdown(render_history_page(page))
+    for msg in messages[window_start:]:
+        render_message(msg)
+
+with chat_container:
+    chat_history()
 
 # User input area with placeholder text
 user_input = st.chat_input("Type your message here...", key="user_input")
@@ -177,14 +443,24 @@ async def process_message(message: str) -> None:
     """Process a message through the assistant."""
     try:
         # Add user message
-        human_msg = HumanMessage(content=message)
+        human_msg = HumanMessage(content=message, id=str(uuid.uuid4()))
         st.session_state.messages.append(human_msg)
         
-        # Get response from assistant
-        result = await assistant.ainvoke(st.session_state.state)
+        # Only send the messages the checkpointed thread has not seen yet
+        state = st.session_state.state
+        exporter = st.session_state.get("trace_exporter")
+        with telemetry.collect(exporter), telemetry.span("turn", case_id=state.case_id) as turn:
+            result = await assistant.ainvoke(
+                {"messages": state.messages[st.session_state.synced_messages:], "case_id": state.case_id},
+                config_for_case(state.case_id)
+            )
+        if exporter is not None:
+            st.session_state.setdefault("turn_traces", []).append(turn.trace_id)
         
-        # Update session state with new messages
-        st.session_state.messages.extend(result["messages"])
+        # Only the messages after the one just sent are new, a resumed session holds just the latest ones
+        sent = next(i for i, msg in enumerate(result["messages"]) if msg.id == human_msg.id)
+        st.session_state.messages.extend(result["messages"][sent + 1:])
+        st.session_state.synced_messages = len(st.session_state.messages)
         
         # Update case data if present
         if "case_data" in result:
@@ -215,6 +491,11 @@ if st.button("Clear Chat"):
         st.session_state.messages = st.session_state.state.messages
         st.session_state.case_data = st.session_state.state.case_data
         st.session_state.user_data = st.session_state.state.user_data
+        st.session_state.synced_messages = 0
+        st.session_state.history_pages = 0
+        st.session_state.history_cursor = None
+        st.session_state.log_summary = None
+        st.query_params["case_id"] = st.session_state.state.case_id
         st.rerun()
     except Exception as e:
         st.error(f"Error clearing chat: {str(e)}")
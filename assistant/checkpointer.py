@@ -0,0 +1,443 @@
+"""Delta-based LangGraph checkpointer persisted through the project store."""
+
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from pydantic import BaseModel
+from assistant.configuration import DocumentExists, Memory
+from collections import OrderedDict
+import logging
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOTS = "checkpoints"
+DELTAS = "checkpoint-deltas"
+WRITES = "checkpoint-writes"
+# Documents deleted per batch, below Firestore's 500 writes per batch
+DELETE_BATCH = 400
+STATE_MODELS = [
+    ("assistant.state", name) for name in (
+        "UserData", "IncidentDetails", "WitnessInfo", "InjuryDetails", "MedicalInfo", "InsurancePolicy",
+        "InsuranceInfo", "EmployerInfo", "EmploymentInfo", "DamagesInfo", "LegalInfo", "CaseFiles", "CaseData",
+    )
+]
+
+def config_for_case(case_id: str, checkpoint_ns: str = "") -> RunnableConfig:
+    """Return the run config that resumes the interview thread of a case."""
+    return {"configurable": {"thread_id": case_id, "checkpoint_ns": checkpoint_ns, "case_id": case_id}}
+
+class StoreCheckpointer(BaseCheckpointSaver):
+    """Checkpointer that writes one small delta document per checkpoint.
+
+    Instead of a full snapshot, every checkpoint stores only what changed since
+    its parent: messages appended to list channels, the changed top-level
+    fields of pydantic channels (the CaseData sections) and any other channel
+    that was replaced. Every `compact_every` deltas the thread is folded into a
+    single snapshot document and the older deltas are deleted.
+
+    Threads are keyed by `thread_id`, which the app sets to the case ID. The
+    heads of the `max_heads` most recently used threads are kept in memory,
+    others are rebuilt from the store when they are used again.
+    """
+
+    def __init__(
+        self, store: Any, compact_every: int = 50, max_attempts: int = 5, max_heads: int = 256, **kwargs: Any
+    ):
+        # The state models are our own, allow them through the msgpack allowlist
+        kwargs.setdefault("serde", JsonPlusSerializer(allowed_msgpack_modules=STATE_MODELS))
+        super().__init__(**kwargs)
+        self.store = store
+        self.compact_every = compact_every
+        self.max_attempts = max_attempts
+        self.max_heads = max_heads
+        # thread key -> {"checkpoint_id", "seq", "base_seq", "values", "sections", "record"}, least recently used first
+        self._heads: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    @staticmethod
+    def _thread_key(thread_id: str, checkpoint_ns: str) -> str:
+        key = f"{thread_id}:{checkpoint_ns}" if checkpoint_ns else str(thread_id)
+        return key.replace("/", "_")
+
+    def _dump(self, value: Any) -> Dict[str, Any]:
+        # Firestore rejects nested arrays, so typed payloads are stored as maps
+        type_, payload = self.serde.dumps_typed(value)
+        return {"type": type_, "data": payload}
+
+    def _load(self, typed: Dict[str, Any]) -> Any:
+        return self.serde.loads_typed((typed["type"], typed["data"]))
+
+    def _sections(self, value: BaseModel) -> Dict[str, Dict[str, Any]]:
+        return {name: self._dump(getattr(value, name)) for name in type(value).model_fields}
+
+    def _encode_channel(self, head: Dict[str, Any], channel: str, value: Any) -> Dict[str, Any]:
+        """Encode a channel value as a delta against the thread head."""
+        previous = head["values"].get(channel)
+        if isinstance(value, list) and isinstance(previous, list) and value[:len(previous)] == previous:
+            head["values"][channel] = list(value)
+            return {"op": "append", "items": [self._dump(item) for item in value[len(previous):]]}
+        if isinstance(value, BaseModel) and type(previous) is type(value):
+            sections = self._sections(value)
+            cached = head["sections"].get(channel, {})
+            changed = {name: typed for name, typed in sections.items() if cached.get(name) != typed}
+            head["values"][channel] = value
+            head["sections"][channel] = sections
+            return {"op": "sections", "sections": changed}
+        head["values"][channel] = list(value) if isinstance(value, list) else value
+        if isinstance(value, BaseModel):
+            head["sections"][channel] = self._sections(value)
+        else:
+            head["sections"].pop(channel, None)
+        return {"op": "set", "value": self._dump(value)}
+
+    def _apply_channel(self, values: Dict[str, Any], channel: str, delta: Dict[str, Any]) -> None:
+        """Apply an encoded channel delta to materialized channel values."""
+        op = delta["op"]
+        if op == "append":
+            values[channel] = [*values.get(channel, []), *(self._load(item) for item in delta["items"])]
+        elif op == "sections":
+            update = {name: self._load(typed) for name, typed in delta["sections"].items()}
+            values[channel] = values[channel].model_copy(update=update)
+        elif op == "set":
+            values[channel] = self._load(delta["value"])
+        elif op == "delete":
+            values.pop(channel, None)
+
+    async def _load_records(self, key: str) -> Tuple[Optional[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Load the snapshot and the ordered deltas of a thread."""
+        snapshot = await self.store.get((SNAPSHOTS, key))
+        base_seq = snapshot.data["seq"] if snapshot else -1
+        deltas = await self.store.query(DELTAS, [("data.thread", "==", key)])
+        records = sorted((m.data for m in deltas if m.data["seq"] > base_seq), key=lambda d: d["seq"])
+        return (snapshot.data if snapshot else None), records
+
+    def _replay(
+        self, snapshot: Optional[Dict[str, Any]], records: List[Dict[str, Any]], until: Optional[str] = None
+    ) -> Iterator[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        """Yield (record, materialized values) for each checkpoint, oldest first."""
+        values: Dict[str, Any] = {}
+        if snapshot is not None:
+            values = {channel: self._load(typed) for channel, typed in snapshot["values"].items()}
+            yield snapshot, values
+            if snapshot["checkpoint_id"] == until:
+                return
+        for record in records:
+            values = dict(values)
+            for channel, delta in record["channels"].items():
+                self._apply_channel(values, channel, delta)
+            yield record, values
+            if record["checkpoint_id"] == until:
+                return
+
+    def _to_tuple(
+        self, thread_id: str, checkpoint_ns: str, record: Dict[str, Any], values: Dict[str, Any],
+        writes: List[Dict[str, Any]]
+    ) -> CheckpointTuple:
+        checkpoint = self._load(record["checkpoint"])
+        return CheckpointTuple(
+            config={"configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": record["checkpoint_id"],
+            }},
+            checkpoint={**checkpoint, "channel_values": dict(values)},
+            metadata=self._load(record["metadata"]),
+            parent_config=(
+                {"configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": record["parent_id"],
+                }}
+                if record.get("parent_id") else None
+            ),
+            pending_writes=[
+                (w["task_id"], w["channel"], self._load_write(values, w))
+                for w in sorted(writes, key=lambda w: (w["task_id"], w["idx"]))
+            ],
+        )
+
+    def _load_write(self, values: Dict[str, Any], write: Dict[str, Any]) -> Any:
+        """Materialize a pending write against the channel values of its checkpoint."""
+        channel = write["channel"]
+        written = {channel: values.get(channel)}
+        self._apply_channel(written, channel, write["value"])
+        return written[channel]
+
+    async def _rebuild(self, key: str) -> Dict[str, Any]:
+        """Rebuild the head of a thread from its snapshot and deltas."""
+        head = {"checkpoint_id": None, "seq": -1, "base_seq": -1, "values": {}, "sections": {}, "record": None}
+        snapshot, records = await self._load_records(key)
+        for record, values in self._replay(snapshot, records):
+            head.update(checkpoint_id=record["checkpoint_id"], seq=record["seq"], values=values, record=record)
+        if snapshot is not None:
+            head["base_seq"] = snapshot["seq"]
+        head["sections"] = {
+            channel: self._sections(value)
+            for channel, value in head["values"].items() if isinstance(value, BaseModel)
+        }
+        self._cache_head(key, head)
+        return head
+
+    def _cache_head(self, key: str, head: Dict[str, Any]) -> None:
+        self._heads[key] = head
+        self._heads.move_to_end(key)
+        while len(self._heads) > self.max_heads:
+            self._heads.popitem(last=False)
+
+    async def _head(self, key: str, refresh: bool = False) -> Dict[str, Any]:
+        """Return the cached head of a thread, rebuilding it from the store on a cold start.
+
+        With `refresh` the deltas other processes appended since are applied
+        first; when some of them were already compacted away the head is
+        rebuilt.
+        """
+        head = self._heads.get(key)
+        if head is None:
+            return await self._rebuild(key)
+        self._heads.move_to_end(key)
+        if not refresh:
+            return head
+        newer = await self.store.query(DELTAS, [("data.thread", "==", key), ("data.seq", ">", head["seq"])])
+        records = sorted((m.data for m in newer), key=lambda d: d["seq"])
+        if records and records[0]["seq"] != head["seq"] + 1:
+            return await self._rebuild(key)
+        for record in records:
+            values = dict(head["values"])
+            for channel, delta in record["channels"].items():
+                self._apply_channel(values, channel, delta)
+                if isinstance(values.get(channel), BaseModel):
+                    head["sections"][channel] = self._sections(values[channel])
+                else:
+                    head["sections"].pop(channel, None)
+            head.update(checkpoint_id=record["checkpoint_id"], seq=record["seq"], values=values, record=record)
+        return head
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        """Materialize the requested (or latest) checkpoint of a thread.
+
+        The latest checkpoint comes from the head, brought up to date with any
+        newer deltas; only older checkpoints are replayed from the store.
+        """
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        key = self._thread_key(thread_id, checkpoint_ns)
+        checkpoint_id = get_checkpoint_id(config)
+        head = await self._head(key, refresh=True)
+        if head["checkpoint_id"] is None:
+            return None
+        if checkpoint_id in (None, head["checkpoint_id"]):
+            # Lists are copied so callers extending them cannot change the head
+            record = head["record"]
+            values = {channel: list(v) if isinstance(v, list) else v for channel, v in head["values"].items()}
+        else:
+            snapshot, records = await self._load_records(key)
+            found = None
+            for record, values in self._replay(snapshot, records, until=checkpoint_id):
+                found = (record, values)
+            if found is None or found[0]["checkpoint_id"] != checkpoint_id:
+                return None
+            record, values = found
+        writes = await self.store.query(WRITES, [
+            ("data.thread", "==", key),
+            ("data.checkpoint_id", "==", record["checkpoint_id"]),
+        ])
+        return self._to_tuple(thread_id, checkpoint_ns, record, values, [w.data for w in writes])
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        """List the retained checkpoints of a thread, newest first."""
+        if config is None:
+            raise ValueError("StoreCheckpointer.alist requires a thread_id")
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        key = self._thread_key(thread_id, checkpoint_ns)
+        snapshot, records = await self._load_records(key)
+        history = list(self._replay(snapshot, records))
+        before_id = get_checkpoint_id(before) if before else None
+        for record, values in reversed(history):
+            if before_id and record["checkpoint_id"] >= before_id:
+                continue
+            if filter:
+                metadata = self._load(record["metadata"])
+                if not all(metadata.get(k) == v for k, v in filter.items()):
+                    continue
+            if limit is not None:
+                if limit <= 0:
+                    break
+                limit -= 1
+            yield self._to_tuple(thread_id, checkpoint_ns, record, values, [])
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        """Persist a checkpoint as a delta against its parent."""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        key = self._thread_key(thread_id, checkpoint_ns)
+        parent_id = config["configurable"].get("checkpoint_id")
+        head = await self._head(key)
+        if head["checkpoint_id"] != parent_id:
+            # Another process may have advanced the thread, catch up before writing
+            head = await self._head(key, refresh=True)
+
+        c = checkpoint.copy()
+        values: Dict[str, Any] = c.pop("channel_values")
+        metadata_dump = self._dump(get_checkpoint_metadata(config, metadata))
+        for _ in range(self.max_attempts):
+            work = {"values": dict(head["values"]), "sections": dict(head["sections"])}
+            versions = new_versions
+            if head["checkpoint_id"] != parent_id:
+                # Forked from an older checkpoint: write every channel in full, drop the ones it lacks
+                versions = {channel: None for channel in {*values, *work["values"]}}
+                work = {"values": {}, "sections": {}}
+            channels = {}
+            for channel in versions:
+                if channel in values:
+                    channels[channel] = self._encode_channel(work, channel, values[channel])
+                else:
+                    work["values"].pop(channel, None)
+                    work["sections"].pop(channel, None)
+                    channels[channel] = {"op": "delete"}
+
+            seq = head["seq"] + 1
+            record = {
+                "thread": key,
+                "seq": seq,
+                "checkpoint_id": checkpoint["id"],
+                "parent_id": parent_id,
+                "checkpoint": self._dump(c),
+                "metadata": metadata_dump,
+                "channels": channels,
+            }
+            try:
+                # Sequence numbers are claimed with a create-only write, never overwritten
+                await self.store.create((DELTAS, f"{key}:{seq:010d}"), Memory(
+                    database="checkpoints", collection=DELTAS, document_id=f"{key}:{seq:010d}", data=record
+                ))
+            except DocumentExists:
+                logger.info(f"Checkpoint seq {seq} of {key} was taken by another writer, retrying")
+                head = await self._head(key, refresh=True)
+                continue
+            head.update(values=work["values"], sections=work["sections"],
+                        checkpoint_id=checkpoint["id"], seq=seq, record=record)
+            break
+        else:
+            raise RuntimeError(f"Could not append a checkpoint to {key} after {self.max_attempts} attempts")
+
+        await self._prune_writes(key, checkpoint["id"])
+        if seq - head["base_seq"] >= self.compact_every:
+            await self._compact(key, head, record)
+
+        return {"configurable": {
+            "thread_id": thread_id,
+            "checkpoint_ns": checkpoint_ns,
+            "checkpoint_id": checkpoint["id"],
+        }}
+
+    async def _compact(self, key: str, head: Dict[str, Any], record: Dict[str, Any]) -> None:
+        """Fold the thread into a snapshot and drop the deltas it covers."""
+        snapshot = {
+            **{k: v for k, v in record.items() if k != "channels"},
+            "values": {channel: self._dump(value) for channel, value in head["values"].items()},
+        }
+        await self.store.set((SNAPSHOTS, key), Memory(
+            database="checkpoints", collection=SNAPSHOTS, document_id=key, data=snapshot
+        ))
+        deltas = await self.store.query(DELTAS, [("data.thread", "==", key)])
+        # The latest delta stays, so other processes can tell their head was compacted away
+        await self._delete_all(DELTAS, [m.document_id for m in deltas if m.data["seq"] < record["seq"]])
+        head["base_seq"] = record["seq"]
+        logger.info(f"Compacted checkpoints of {key} at seq {record['seq']}")
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        """Persist the pending writes of a task in one batch.
+
+        Writes to a pydantic channel of the head checkpoint are stored as the
+        sections they change, like checkpoint deltas.
+        """
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        key = self._thread_key(thread_id, checkpoint_ns)
+        head = await self._head(key)
+        batch = self.store.new_batch()
+        for idx, (channel, value) in enumerate(writes):
+            idx = WRITES_IDX_MAP.get(channel, idx)
+            doc_id = f"{key}:{checkpoint_id}:{task_id}:{idx}"
+            if head["checkpoint_id"] == checkpoint_id:
+                # Encoded against a scratch copy, the head only moves on with the next checkpoint
+                work = {"values": {channel: head["values"].get(channel)}, "sections": dict(head["sections"])}
+                delta = self._encode_channel(work, channel, value)
+                if delta["op"] == "append":
+                    delta = {"op": "set", "value": self._dump(value)}
+            else:
+                delta = {"op": "set", "value": self._dump(value)}
+            batch.set((WRITES, doc_id), Memory(
+                database="checkpoints", collection=WRITES, document_id=doc_id, data={
+                    "thread": key,
+                    "checkpoint_id": checkpoint_id,
+                    "task_id": task_id,
+                    "task_path": task_path,
+                    "idx": idx,
+                    "channel": channel,
+                    "value": delta,
+                }
+            ))
+        await batch.commit()
+
+    async def _prune_writes(self, key: str, checkpoint_id: str) -> None:
+        """Delete the pending writes of every checkpoint of a thread but `checkpoint_id`.
+
+        Pending writes only matter for resuming from the latest checkpoint.
+        """
+        stale = [
+            memory.document_id for memory in await self.store.query(WRITES, [("data.thread", "==", key)])
+            if memory.data["checkpoint_id"] != checkpoint_id
+        ]
+        await self._delete_all(WRITES, stale)
+
+    async def _delete_all(self, collection: str, document_ids: Sequence[str]) -> None:
+        for start in range(0, len(document_ids), DELETE_BATCH):
+            batch = self.store.new_batch()
+            for document_id in document_ids[start:start + DELETE_BATCH]:
+                batch.delete((collection, document_id))
+            await batch.commit()
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        """Delete every checkpoint and write of a thread, in all of its namespaces."""
+        root = self._thread_key(thread_id, "")
+        # Namespaced keys are "{root}:{namespace}", i.e. from "{root}:" up to "{root};"
+        filters = [[("data.thread", "==", root)], [("data.thread", ">=", f"{root}:"), ("data.thread", "<", f"{root};")]]
+        for collection in (SNAPSHOTS, DELTAS, WRITES):
+            for thread_filters in filters:
+                memories = await self.store.query(collection, thread_filters)
+                await self._delete_all(collection, [memory.document_id for memory in memories])
+        for key in [key for key in self._heads if key == root or key.startswith(f"{root}:")]:
+            del self._heads[key]
+
+__all__ = ["StoreCheckpointer", "config_for_case"]
@@ -0,0 +1,88 @@
+"""Compression codecs for stored Memory payloads.
+
+zstandard is used when installed, otherwise the codecs fall back to zlib from
+the standard library.
+"""
+
+from typing import Any, Callable, Dict, Optional
+import logging
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+MARKER = "__codec__"
+
+class Compressor:
+    """A named byte compressor."""
+
+    def __init__(self, code: int, name: str, compress: Callable[[bytes], bytes], decompress: Callable[[bytes], bytes]):
+        self.code = code
+        self.name = name
+        self.compress = compress
+        self.decompress = decompress
+
+NONE = Compressor(0, "none", lambda b: b, lambda b: b)
+ZLIB = Compressor(1, "zlib", lambda b: zlib.compress(b, 6), zlib.decompress)
+COMPRESSORS: Dict[int, Compressor] = {NONE.code: NONE, ZLIB.code: ZLIB}
+if zstandard is not None:
+    _zstd_compressor = zstandard.ZstdCompressor(level=3)
+    _zstd_decompressor = zstandard.ZstdDecompressor()
+    ZSTD = Compressor(2, "zstd", _zstd_compressor.compress, _zstd_decompressor.decompress)
+    COMPRESSORS[ZSTD.code] = ZSTD
+
+def best_compressor() -> Compressor:
+    """Return the best installed compressor."""
+    return COMPRESSORS.get(2) or ZLIB
+
+class PayloadCodec:
+    """Codec used by the store backends for Memory payloads.
+
+    `pack`/`unpack` keep the payload a document (so Firestore can still query
+    its small fields) and only replace text or bytes values of at least
+    `threshold` bytes, measured UTF-8 encoded, by a compressed blob.
+    """
+
+    def __init__(self, threshold: int = 4096, compressor: Optional[Compressor] = None):
+        self.threshold = threshold
+        self.compressor = compressor or best_compressor()
+
+    def pack(self, value: Any) -> Any:
+        """Compress the large text fields of a payload."""
+        if isinstance(value, dict):
+            return {k: self.pack(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self.pack(v) for v in value]
+        # A character can take up to four bytes, shorter strings are below the threshold either way
+        if isinstance(value, (str, bytes)) and len(value) * 4 >= self.threshold:
+            raw = value.encode("utf-8") if isinstance(value, str) else value
+            if len(raw) < self.threshold:
+                return value
+            compressed = self.compressor.compress(raw)
+            if len(compressed) < len(raw):
+                return {
+                    MARKER: self.compressor.name,
+                    "text": isinstance(value, str),
+                    "data": compressed,
+                }
+        return value
+
+    def unpack(self, value: Any) -> Any:
+        """Restore the fields compressed by `pack`."""
+        if isinstance(value, dict):
+            if MARKER in value:
+                compressor = next(c for c in COMPRESSORS.values() if c.name == value[MARKER])
+                raw = compressor.decompress(value["data"])
+                return raw.decode("utf-8") if value["text"] else raw
+            return {k: self.unpack(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self.unpack(v) for v in value]
+        return value
+
+default_codec = PayloadCodec()
+
+__all__ = ["PayloadCodec", "Compressor", "default_codec", "best_compressor"]
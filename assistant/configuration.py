@@ -1,10 +1,19 @@
 from firebase_admin import firestore, credentials, initialize_app, get_app
+from google.cloud.firestore_v1.field_path import FieldPath
+from google.api_core.exceptions import Conflict, NotFound
 from dataclasses import dataclass, field, fields
 from typing_extensions import Annotated
 from assistant import prompts
+from assistant.diff import DELETE, apply_changes
+from assistant.codecs import PayloadCodec, default_codec
+from assistant import telemetry
 from langgraph.store.base import BaseStore
-from typing import Any, Optional, Dict, List, TypedDict
+from typing import Any, AsyncIterator, Optional, Dict, List, Tuple, TypedDict
+import threading
+import asyncio
 import logging
+import json
+import copy
 import uuid
 import os
 import time
@@ -15,7 +24,7 @@ class ConfigDict(TypedDict, total=False):
     """Type definition for configuration dictionary"""
     configurable: Dict[str, Any]
 
-@dataclass
+@dataclass(slots=True)
 class Memory:
     """A class to represent a memory in the database."""
     database: str  # name of the database
@@ -26,6 +35,7 @@ class Memory:
     
     def to_dict(self) -> Dict[str, Any]:
         return {
+            "database": self.database,
             "collection": self.collection,
             "document_id": self.document_id,
             "data": self.data,
@@ -63,39 +73,222 @@ class Configuration:
         return cls(**{k: v for k, v in values.items() if v is not None})
 
 
+class DocumentExists(Exception):
+    """Raised by `create` when the document already exists."""
+
+class DocumentMissing(Exception):
+    """Raised by `update` when the document does not exist."""
+
+def _size(value: Any) -> int:
+    """Approximate stored size of a document, only computed while tracing."""
+    return len(json.dumps(value, default=str))
+
+class FireStoreBatch:
+    """Writes committed atomically together, independent of any other batch on the store."""
+
+    def __init__(self, store: "FireStore"):
+        self.store = store
+        self._batch = store.db.batch()
+        self.writes = 0
+
+    def set(self, namespace: tuple[str, str], memory: Memory) -> None:
+        document = memory.to_dict()
+        document["data"] = self.store.codec.pack(document["data"])
+        self._batch.set(self.store.db.collection(namespace[0]).document(namespace[1]), document)
+        self.writes += 1
+
+    def delete(self, namespace: tuple[str, str]) -> None:
+        self._batch.delete(self.store.db.collection(namespace[0]).document(namespace[1]))
+        self.writes += 1
+
+    async def commit(self) -> None:
+        with telemetry.span("firestore.commit", writes=self.writes):
+            await asyncio.to_thread(self._batch.commit)
+
 class FireStore(BaseStore):
-    def __init__(self, db: Any):
+    """The Firestore-backed store; the client is synchronous, so every call runs in a worker thread."""
+
+    def __init__(self, db: Any, codec: PayloadCodec = default_codec):
         self.db = db
+        self.codec = codec
         self._batch = None
 
     async def get(self, namespace: tuple[str, str]) -> Optional[Memory]:
         """Get data from Firestore."""
         collection, doc_id = namespace
-        doc_ref = self.db.collection(collection).document(doc_id)
-        doc = doc_ref.get()
-        return Memory.from_dict(doc.to_dict()) if doc.exists else None
+        with telemetry.span("firestore.get", collection=collection) as span:
+            doc_ref = self.db.collection(collection).document(doc_id)
+            doc = await asyncio.to_thread(doc_ref.get)
+            if not doc.exists:
+                return None
+            if telemetry.active():
+                span.add("bytes_read", _size(doc.to_dict()))
+            return self._to_memory(collection, doc)
 
     async def set(self, namespace: tuple[str, str], memory: Memory) -> None:
         """Set data in Firestore."""
         collection, doc_id = namespace
-        doc_ref = self.db.collection(collection).document(doc_id)
-        doc_ref.set(memory.to_dict())
+        with telemetry.span("firestore.set", collection=collection) as span:
+            doc_ref = self.db.collection(collection).document(doc_id)
+            document = memory.to_dict()
+            # Large text fields (OCR output) are stored compressed
+            document["data"] = self.codec.pack(document["data"])
+            if telemetry.active():
+                span.add("bytes_written", _size(document))
+            await asyncio.to_thread(doc_ref.set, document)
         return None
 
-    async def query(self, collection: str, filters: List[tuple]) -> List[Memory]:
-        """Query Firestore with filters."""
+    async def create(self, namespace: tuple[str, str], memory: Memory) -> None:
+        """Write a document only if it does not exist yet, raising DocumentExists otherwise."""
+        collection, doc_id = namespace
+        with telemetry.span("firestore.create", collection=collection) as span:
+            doc_ref = self.db.collection(collection).document(doc_id)
+            document = memory.to_dict()
+            document["data"] = self.codec.pack(document["data"])
+            if telemetry.active():
+                span.add("bytes_written", _size(document))
+            try:
+                await asyncio.to_thread(doc_ref.create, document)
+            except Conflict as e:
+                raise DocumentExists(f"{collection}/{doc_id}") from e
+        return None
+
+    async def update(self, namespace: tuple[str, str], changes: Dict[Tuple[str, ...], Any]) -> None:
+        """Apply field-path changes (see assistant.diff) to the data of an existing document.
+
+        Raises DocumentMissing when there is no document, field changes alone
+        would create a partial one.
+        """
+        collection, doc_id = namespace
+        with telemetry.span("firestore.update", collection=collection, fields=len(changes)) as span:
+            doc_ref = self.db.collection(collection).document(doc_id)
+            fields = {
+                FieldPath("data", *path).to_api_repr(): (
+                    firestore.DELETE_FIELD if value is DELETE else self.codec.pack(value)
+                )
+                for path, value in changes.items()
+            }
+            fields["timestamp"] = time.time()
+            if telemetry.active():
+                span.add("bytes_written", _size(fields))
+            try:
+                await asyncio.to_thread(doc_ref.update, fields)
+            except NotFound as e:
+                raise DocumentMissing(f"{collection}/{doc_id}") from e
+        return None
+
+    def _filtered(self, collection: str, filters: List[tuple]) -> Any:
         query = self.db.collection(collection)
         for field, op, value in filters:
             query = query.where(field, op, value)
-        docs = query.stream()
-        return [Memory.from_dict(doc.to_dict()) for doc in docs]
+        return query
+
+    def _to_memory(self, collection: str, doc: Any) -> Memory:
+        """Build a Memory from a snapshot that may only hold a projection of the fields."""
+        values = doc.to_dict() or {}
+        return Memory(
+            database=values.get("database", "default"),
+            collection=values.get("collection", collection),
+            document_id=values.get("document_id", doc.id),
+            data=self.codec.unpack(values.get("data", {})),
+            timestamp=values.get("timestamp", 0.0)
+        )
+
+    async def query(self, collection: str, filters: List[tuple]) -> List[Memory]:
+        """Query Firestore with filters."""
+        return [memory async for memory in self.stream(collection, filters)]
+
+    async def stream(
+        self,
+        collection: str,
+        filters: List[tuple] = (),
+        *,
+        select: Optional[List[str]] = None,
+        order_by: Optional[str] = None,
+        descending: bool = False,
+        page_size: int = 100,
+        limit: Optional[int] = None,
+        start_after: Optional[str] = None,
+    ) -> AsyncIterator[Memory]:
+        """Stream query results page by page, holding at most one page in memory.
+
+        `select` projects the documents to the given field paths (e.g.
+        "data.intake_date"), `order_by` defaults to the document ID so cursors are
+        stable, and `start_after` resumes after the given document ID.
+        """
+        query = self._filtered(collection, filters)
+        if select is not None:
+            query = query.select(["document_id", "timestamp", *select])
+        direction = firestore.Query.DESCENDING if descending else firestore.Query.ASCENDING
+        query = query.order_by(order_by or FieldPath.document_id(), direction=direction)
+
+        cursor = None
+        if start_after is not None:
+            cursor = await asyncio.to_thread(self.db.collection(collection).document(start_after).get)
+        remaining = limit
+        while remaining is None or remaining > 0:
+            size = page_size if remaining is None else min(page_size, remaining)
+            page_query = query.limit(size)
+            if cursor is not None:
+                page_query = page_query.start_after(cursor)
+            # Only the page fetch is timed, a span must not stay open across yields
+            with telemetry.span("firestore.page", collection=collection) as span:
+                docs = await asyncio.to_thread(lambda: list(page_query.stream()))
+                span.add("documents", len(docs))
+            for doc in docs:
+                yield self._to_memory(collection, doc)
+            if len(docs) < size:
+                break
+            cursor = docs[-1]
+            if remaining is not None:
+                remaining -= len(docs)
+
+    async def page(
+        self, collection: str, filters: List[tuple] = (), page_size: int = 50,
+        cursor: Optional[str] = None, **kwargs: Any
+    ) -> Tuple[List[Memory], Optional[str]]:
+        """Return one page of results and the cursor of the next page (None on the last page)."""
+        items = [
+            memory async for memory in self.stream(
+                collection, filters, page_size=page_size + 1, limit=page_size + 1,
+                start_after=cursor, **kwargs
+            )
+        ]
+        if len(items) > page_size:
+            return items[:page_size], items[page_size - 1].document_id
+        return items, None
+
+    async def count(self, collection: str, filters: List[tuple] = ()) -> int:
+        """Count matching documents server-side without downloading them."""
+        with telemetry.span("firestore.count", collection=collection):
+            result = await asyncio.to_thread(self._filtered(collection, filters).count(alias="count").get)
+        return int(result[0][0].value)
+
+    async def aggregate(
+        self, collection: str, filters: List[tuple] = (),
+        sums: List[str] = (), averages: List[str] = ()
+    ) -> Dict[str, float]:
+        """Run a server-side count/sum/avg aggregation, keyed by alias."""
+        aggregation = self._filtered(collection, filters).count(alias="count")
+        for field_path in sums:
+            aggregation = aggregation.sum(field_path, alias=f"sum:{field_path}")
+        for field_path in averages:
+            aggregation = aggregation.avg(field_path, alias=f"avg:{field_path}")
+        with telemetry.span("firestore.aggregate", collection=collection):
+            results = (await asyncio.to_thread(aggregation.get))[0]
+        return {result.alias: result.value for result in results}
 
     async def delete(self, namespace: tuple[str, str]) -> None:
         """Delete data from Firestore."""
-        doc_ref = self.db.collection(namespace[0]).document(namespace[1])
-        doc_ref.delete()  
+        with telemetry.span("firestore.delete", collection=namespace[0]):
+            doc_ref = self.db.collection(namespace[0]).document(namespace[1])
+            await asyncio.to_thread(doc_ref.delete)
         return None
 
+    def new_batch(self) -> FireStoreBatch:
+        """Return a batch of its own, safe to use alongside other batches."""
+        return FireStoreBatch(self)
+
     async def batch(self) -> None:
         """Start a new batch operation."""
         self._batch = self.db.batch()
@@ -114,7 +307,201 @@ class FireStore(BaseStore):
     async def commit(self) -> None:
         """Commit the current batch operation."""
         if self._batch is not None:
-            self._batch.commit()  
+            with telemetry.span("firestore.commit", writes=len(self._batch)):
+                await asyncio.to_thread(self._batch.commit)
+            self._batch = None
+
+_OPERATORS = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a is not None and a < b,
+    "<=": lambda a, b: a is not None and a <= b,
+    ">": lambda a, b: a is not None and a > b,
+    ">=": lambda a, b: a is not None and a >= b,
+    "in": lambda a, b: a in b,
+    "not-in": lambda a, b: a not in b,
+    "array_contains": lambda a, b: isinstance(a, list) and b in a,
+    "array_contains_any": lambda a, b: isinstance(a, list) and any(v in a for v in b),
+}
+
+def _lookup(document: Dict[str, Any], field_path: str) -> Any:
+    value: Any = document
+    for part in field_path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+class MemoryStoreBatch:
+    """Writes applied to a MemoryStore together on commit."""
+
+    def __init__(self, store: "MemoryStore"):
+        self.store = store
+        self._writes: List[Tuple[str, str, Optional[Dict[str, Any]]]] = []
+
+    def set(self, namespace: tuple[str, str], memory: Memory) -> None:
+        document = memory.to_dict()
+        document["data"] = self.store.codec.pack(copy.deepcopy(document["data"]))
+        self._writes.append((namespace[0], namespace[1], document))
+
+    def delete(self, namespace: tuple[str, str]) -> None:
+        self._writes.append((namespace[0], namespace[1], None))
+
+    async def commit(self) -> None:
+        with self.store._lock:
+            for collection, key, document in self._writes:
+                if document is None:
+                    self.store.collections.get(collection, {}).pop(key, None)
+                else:
+                    self.store.collections.setdefault(collection, {})[key] = document
+        self._writes = []
+
+class MemoryStore(BaseStore):
+    """In-process store with the FireStore interface, for local runs and benchmarks.
+
+    Documents are kept as FireStore would store them (packed by the codec), so
+    codec costs are the same; nothing is persisted.
+    """
+
+    def __init__(self, codec: PayloadCodec = default_codec):
+        self.codec = codec
+        self.collections: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._lock = threading.RLock()
+        self._batch: Optional[List[Tuple[str, str, Dict[str, Any]]]] = None
+
+    def _to_memory(self, collection: str, doc_id: str, document: Dict[str, Any]) -> Memory:
+        return Memory(
+            database=document.get("database", "default"),
+            collection=document.get("collection", collection),
+            document_id=document.get("document_id", doc_id),
+            data=self.codec.unpack(copy.deepcopy(document.get("data", {}))),
+            timestamp=document.get("timestamp", 0.0)
+        )
+
+    async def get(self, namespace: tuple[str, str]) -> Optional[Memory]:
+        collection, doc_id = namespace
+        with telemetry.span("memorystore.get", collection=collection), self._lock:
+            document = self.collections.get(collection, {}).get(doc_id)
+            return self._to_memory(collection, doc_id, document) if document is not None else None
+
+    async def set(self, namespace: tuple[str, str], memory: Memory) -> None:
+        collection, doc_id = namespace
+        with telemetry.span("memorystore.set", collection=collection), self._lock:
+            document = memory.to_dict()
+            document["data"] = self.codec.pack(copy.deepcopy(document["data"]))
+            self.collections.setdefault(collection, {})[doc_id] = document
+        return None
+
+    async def create(self, namespace: tuple[str, str], memory: Memory) -> None:
+        collection, doc_id = namespace
+        with telemetry.span("memorystore.create", collection=collection), self._lock:
+            documents = self.collections.setdefault(collection, {})
+            if doc_id in documents:
+                raise DocumentExists(f"{collection}/{doc_id}")
+            document = memory.to_dict()
+            document["data"] = self.codec.pack(copy.deepcopy(document["data"]))
+            documents[doc_id] = document
+        return None
+
+    async def update(self, namespace: tuple[str, str], changes: Dict[Tuple[str, ...], Any]) -> None:
+        collection, doc_id = namespace
+        with telemetry.span("memorystore.update", collection=collection, fields=len(changes)), self._lock:
+            documents = self.collections.setdefault(collection, {})
+            document = documents.get(doc_id)
+            if document is None:
+                raise DocumentMissing(f"{collection}/{doc_id}")
+            packed = {path: v if v is DELETE else self.codec.pack(copy.deepcopy(v)) for path, v in changes.items()}
+            document["data"] = apply_changes(document["data"], packed)
+            document["timestamp"] = time.time()
+            documents[doc_id] = document
+        return None
+
+    async def query(self, collection: str, filters: List[tuple]) -> List[Memory]:
+        return [memory async for memory in self.stream(collection, filters)]
+
+    async def stream(
+        self,
+        collection: str,
+        filters: List[tuple] = (),
+        *,
+        select: Optional[List[str]] = None,
+        order_by: Optional[str] = None,
+        descending: bool = False,
+        page_size: int = 100,
+        limit: Optional[int] = None,
+        start_after: Optional[str] = None,
+    ) -> AsyncIterator[Memory]:
+        """Same contract as FireStore.stream; `select` is accepted but documents are returned whole."""
+        with self._lock:
+            items = [
+                (doc_id, document) for doc_id, document in self.collections.get(collection, {}).items()
+                if all(_OPERATORS[op](_lookup(document, f), value) for f, op, value in filters)
+            ]
+        key = (lambda item: (_lookup(item[1], order_by) is None, _lookup(item[1], order_by), item[0])) if order_by else (lambda item: item[0])
+        items.sort(key=key, reverse=descending)
+        if start_after is not None:
+            ids = [doc_id for doc_id, _ in items]
+            items = items[ids.index(start_after) + 1:] if start_after in ids else []
+        for doc_id, document in items[:limit]:
+            yield self._to_memory(collection, doc_id, document)
+
+    async def page(
+        self, collection: str, filters: List[tuple] = (), page_size: int = 50,
+        cursor: Optional[str] = None, **kwargs: Any
+    ) -> Tuple[List[Memory], Optional[str]]:
+        items = [
+            memory async for memory in self.stream(
+                collection, filters, limit=page_size + 1, start_after=cursor, **kwargs
+            )
+        ]
+        if len(items) > page_size:
+            return items[:page_size], items[page_size - 1].document_id
+        return items, None
+
+    async def count(self, collection: str, filters: List[tuple] = ()) -> int:
+        return len(await self.query(collection, filters))
+
+    async def aggregate(
+        self, collection: str, filters: List[tuple] = (),
+        sums: List[str] = (), averages: List[str] = ()
+    ) -> Dict[str, float]:
+        with self._lock:
+            documents = [
+                document for document in self.collections.get(collection, {}).values()
+                if all(_OPERATORS[op](_lookup(document, f), value) for f, op, value in filters)
+            ]
+        result: Dict[str, float] = {"count": len(documents)}
+        for field_path in sums:
+            result[f"sum:{field_path}"] = sum(_lookup(d, field_path) or 0 for d in documents)
+        for field_path in averages:
+            values = [v for d in documents if isinstance(v := _lookup(d, field_path), (int, float))]
+            result[f"avg:{field_path}"] = sum(values) / len(values) if values else None
+        return result
+
+    async def delete(self, namespace: tuple[str, str]) -> None:
+        with self._lock:
+            self.collections.get(namespace[0], {}).pop(namespace[1], None)
+        return None
+
+    def new_batch(self) -> MemoryStoreBatch:
+        return MemoryStoreBatch(self)
+
+    async def batch(self) -> None:
+        self._batch = []
+
+    async def abatch(self) -> None:
+        await self.batch()
+
+    def put(self, namespace: tuple[str, str], key: str, value: Dict[str, Any]) -> None:
+        if self._batch is None:
+            raise RuntimeError("No batch operation in progress")
+        self._batch.append((namespace[0], key, copy.deepcopy(value)))
+
+    async def commit(self) -> None:
+        if self._batch is not None:
+            with self._lock:
+                for collection, key, value in self._batch:
+                    self.collections.setdefault(collection, {})[key] = value
             self._batch = None
 
 def get_or_create_firebase_app():
@@ -129,10 +516,34 @@ def get_or_create_firebase_app():
             'storageBucket': os.getenv("FIREBASE_STORAGE_BUCKET")
         })
 
-# Initialize Firebase and get Firestore client
-firebase_app = get_or_create_firebase_app()
-firestore_db = firestore.client()
-store = FireStore(firestore_db)
+# ASSISTANT_STORE=memory runs without Firebase (local development, benchmarks)
+if os.getenv("ASSISTANT_STORE", "firestore") == "memory":
+    firebase_app = None
+    firestore_db = None
+    store = MemoryStore()
+else:
+    firebase_app = get_or_create_firebase_app()
+    firestore_db = firestore.client()
+    store = FireStore(firestore_db)
+
+# Process-wide defaults; the case ID of each run comes from its RunnableConfig/State
+CONFIG = Configuration.from_runnable_config()
+_llm = None
+
+def get_llm() -> Any:
+    """Return the process-wide chat model, initialized on first use."""
+    global _llm
+    if _llm is None:
+        from langchain.chat_models import init_chat_model
+        from assistant.utils import split_model_and_provider
+        spec = split_model_and_provider(CONFIG.model)
+        _llm = init_chat_model(spec["model"], model_provider=spec["provider"])
+    return _llm
+
+def set_llm(llm: Any) -> None:
+    """Replace the process-wide chat model (e.g. with a fake one in benchmarks)."""
+    global _llm
+    _llm = llm
 
 # Export the initialized app and database client
-__all__ = ["store", "firebase_app", "firestore_db"]
+__all__ = ["store", "firebase_app", "firestore_db", "CONFIG", "get_llm", "set_llm", "FireStore", "MemoryStore", "Memory", "DocumentExists", "DocumentMissing"]
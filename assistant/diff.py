@@ -0,0 +1,64 @@
+"""Field-level diffs between stored documents, used for partial updates."""
+
+from typing import Any, Dict, List, Tuple
+import copy
+
+FieldPath = Tuple[str, ...]
+
+class _Delete:
+    """Sentinel marking a field that was removed."""
+
+    def __repr__(self) -> str:
+        return "DELETE"
+
+DELETE = _Delete()
+
+def diff(previous: Any, current: Any, prefix: FieldPath = ()) -> Dict[FieldPath, Any]:
+    """Return the minimal {field path: new value} mapping that turns `previous` into `current`.
+
+    Nested dicts are diffed key by key; lists and scalars are replaced as a
+    whole. Removed keys map to DELETE. An empty result means nothing changed.
+    """
+    if isinstance(previous, dict) and isinstance(current, dict):
+        changes: Dict[FieldPath, Any] = {}
+        for key, value in current.items():
+            if key not in previous:
+                changes[prefix + (key,)] = value
+            else:
+                changes.update(diff(previous[key], value, prefix + (key,)))
+        for key in previous.keys() - current.keys():
+            changes[prefix + (key,)] = DELETE
+        return changes
+    if previous == current and type(previous) is type(current):
+        return {}
+    return {prefix: current}
+
+def apply_changes(document: Dict[str, Any], changes: Dict[FieldPath, Any]) -> Dict[str, Any]:
+    """Return a copy of `document` with the field changes applied."""
+    result = copy.deepcopy(document)
+    for path, value in changes.items():
+        if not path:
+            return copy.deepcopy(value)
+        target = result
+        for key in path[:-1]:
+            if not isinstance(target.get(key), dict):
+                target[key] = {}
+            target = target[key]
+        if value is DELETE:
+            target.pop(path[-1], None)
+        else:
+            target[path[-1]] = copy.deepcopy(value)
+    return result
+
+def split_sections(changes: Dict[FieldPath, Any], sections: List[str]) -> Tuple[Dict[FieldPath, Any], Dict[str, Dict[FieldPath, Any]]]:
+    """Split changes into top-level changes and per-section changes relative to each section."""
+    top: Dict[FieldPath, Any] = {}
+    nested: Dict[str, Dict[FieldPath, Any]] = {}
+    for path, value in changes.items():
+        if len(path) > 1 and path[0] in sections:
+            nested.setdefault(path[0], {})[path[1:]] = value
+        else:
+            top[path] = value
+    return top, nested
+
+__all__ = ["DELETE", "diff", "apply_changes", "split_sections"]
@@ -0,0 +1,315 @@
+"""Local extraction of the fields that can be recognized without an LLM.
+
+Emails, phone numbers, dates, policy and claim numbers and dollar amounts are
+matched with compiled patterns, normalized, and assigned to a field from the
+keywords of the clause they appear in. Every match carries a confidence; only
+matches at or above MIN_CONFIDENCE are written, the rest (and all narrative
+fields) are left to the LLM extraction.
+
+    matches = extract("My email is jane@example.com, policy no. PN-48213")
+    case_data, user_data, filled = apply(case_data, user_data, matches, confidence)
+"""
+
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Pattern, Sequence, Tuple
+from assistant.retrieval import tokenize
+from assistant.serialization import dump, validate
+from assistant.state import CaseData, UserData
+import re
+
+FieldPath = Tuple[str, ...]
+
+MIN_CONFIDENCE = 0.8
+# Matches in OCR'd document text are less reliable than what the client typed
+DOCUMENT_CONFIDENCE = 0.9
+# Contact details and dates of birth in a document are usually the provider's or insurer's
+# (letterheads, billing lines), so documents only fill case fields
+DOCUMENT_SECTIONS = ("case_data",)
+
+@dataclass
+class FieldMatch:
+    """A field value recognized in a piece of text."""
+    path: FieldPath
+    value: Any
+    confidence: float
+    start: int
+    end: int
+    source: str = "message"
+
+    @property
+    def key(self) -> str:
+        return ".".join(self.path)
+
+MONTHS = {
+    name: number
+    for number, names in enumerate((
+        ("jan", "january"), ("feb", "february"), ("mar", "march"), ("apr", "april"),
+        ("may",), ("jun", "june"), ("jul", "july"), ("aug", "august"),
+        ("sep", "sept", "september"), ("oct", "october"), ("nov", "november"), ("dec", "december"),
+    ), start=1)
+    for name in names
+}
+_MONTH = r"(?P<month>jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|sept?(?:ember)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)\.?"
+_DAY = r"(?P<day>\d{1,2})(?:st|nd|rd|th)?"
+
+DATE_PATTERNS: List[Pattern] = [
+    re.compile(r"\b(?P<year>\d{4})-(?P<month>\d{1,2})-(?P<day>\d{1,2})\b"),
+    re.compile(r"\b(?P<month>\d{1,2})[/.-](?P<day>\d{1,2})[/.-](?P<year>\d{4}|\d{2})\b"),
+    re.compile(rf"\b{_MONTH}\s+{_DAY},?\s+(?P<year>\d{{4}})\b", re.IGNORECASE),
+    re.compile(rf"\b{_DAY}\s+(?:of\s+)?{_MONTH},?\s+(?P<year>\d{{4}})\b", re.IGNORECASE),
+]
+EMAIL_PATTERN = re.compile(r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b")
+PHONE_PATTERN = re.compile(r"(?<![\w-])(?:\+?1[\s.-]?)?\(?(\d{3})\)?[\s.-]?(\d{3})[\s.-]?(\d{4})(?![\w-])")
+AMOUNT_PATTERN = re.compile(
+    r"(?:\$\s?(?P<dollars>\d{1,3}(?:,\d{3})+|\d+)(?:\.(?P<cents>\d{1,2}))?(?:\s?(?P<scale>k|thousand|million)\b)?"
+    r"|\b(?P<number>\d{1,3}(?:,\d{3})+|\d+)(?:\.(?P<fraction>\d{1,2}))?\s?(?P<words>k|thousand|million)?\s?(?:dollars|usd)\b)",
+    re.IGNORECASE,
+)
+IDENTIFIER_PATTERNS: List[Tuple[FieldPath, Pattern]] = [
+    (("case_data", "insurance_info", "client_insurance", "policy_number"),
+     re.compile(r"\bpolicy\s*(?:number|num|no\.?|#)?\s*(?:is|was|:|#)?\s*(?P<value>(?=[A-Z0-9-]*\d)[A-Z0-9][A-Z0-9-]{4,})\b", re.IGNORECASE)),
+    (("case_data", "insurance_info", "claim_number"),
+     re.compile(r"\bclaim\s*(?:number|num|no\.?|#)?\s*(?:is|was|:|#)?\s*(?P<value>(?=[A-Z0-9-]*\d)[A-Z0-9][A-Z0-9-]{4,})\b", re.IGNORECASE)),
+]
+
+# Which field a date or amount belongs to is decided by the keywords around it
+DATE_FIELDS: List[Tuple[FieldPath, Tuple[str, ...], float]] = [
+    (("user_data", "date_of_birth"), ("born", "birth", "dob", "birthday"), 0.9),
+    (("case_data", "insurance_info", "client_insurance", "policy_start_date"),
+     ("effective", "policy start", "policy began", "coverage began", "coverage started"), 0.85),
+    (("case_data", "insurance_info", "client_insurance", "policy_end_date"),
+     ("expire", "expiration", "policy end", "coverage end", "renewal"), 0.85),
+    (("case_data", "insurance_info", "notification_date"), ("notified", "reported it", "filed a claim", "called my insurance"), 0.8),
+    (("case_data", "incident_details", "incident_date"),
+     ("accident", "incident", "crash", "collision", "happened", "injured", "fell", "slipped"), 0.8),
+]
+AMOUNT_FIELDS: List[Tuple[FieldPath, Tuple[str, ...], float]] = [
+    (("case_data", "damages_info", "medical_expenses"),
+     ("medical", "hospital", "doctor", "er bill", "treatment", "ambulance", "therapy"), 0.85),
+    (("case_data", "damages_info", "lost_wages"), ("wages", "paycheck", "income", "salary", "pay", "missed work"), 0.85),
+    (("case_data", "damages_info", "property_damage"),
+     ("repair", "property", "car", "vehicle", "totaled", "body shop", "bike"), 0.85),
+]
+# Contact details of someone other than the client are left to the LLM
+OTHER_PARTY = ("witness", "attorney", "lawyer", "adjuster", "doctor's office", "his ", "her ", "their ")
+EMPLOYER = ("employer", "work number", "office number", "boss")
+
+# Words that may surround recognized values in a message without adding anything the LLM must read
+FILLER = frozenset(
+    "number num no phone cell mobile email e-mail mail address reach call text contact born birth dob "
+    "date birthday policy claim insurance expenses bills medical wages lost damage repair cost costs "
+    "total came about around so far yes sure ok okay here thanks thank just also can best mine "
+    "do don't not am i'm it's that's".split()
+)
+
+CLAUSE_BREAK = re.compile(r"[.;!?\n]|\band\b|\bbut\b", re.IGNORECASE)
+
+def parse_date(text: str) -> Optional[date]:
+    """Normalize a date written as ISO, M/D/Y or with a month name."""
+    for pattern in DATE_PATTERNS:
+        if match := pattern.fullmatch(text.strip()):
+            return _build_date(match)
+    return None
+
+def _build_date(match: "re.Match") -> Optional[date]:
+    month = match["month"]
+    month = int(month) if month.isdigit() else MONTHS.get(month.lower().rstrip("."))
+    year = int(match["year"])
+    if year < 100:
+        # Two-digit years are in the past: 24 -> 2024, 85 -> 1985
+        year += 2000 if year <= date.today().year % 100 else 1900
+    try:
+        return date(year, month, int(match["day"]))
+    except (TypeError, ValueError):
+        return None
+
+def parse_amount(text: str) -> Optional[float]:
+    """Normalize a dollar amount such as "$12,500.50", "$5k" or "3,000 dollars"."""
+    match = AMOUNT_PATTERN.search(text)
+    return _build_amount(match) if match else None
+
+def _build_amount(match: "re.Match") -> float:
+    whole = match["dollars"] or match["number"]
+    cents = match["cents"] or match["fraction"] or "0"
+    scale = (match["scale"] or match["words"] or "").lower()
+    value = float(whole.replace(",", "")) + float(f"0.{cents}")
+    return value * {"k": 1e3, "thousand": 1e3, "million": 1e6}.get(scale, 1)
+
+def normalize_phone(text: str) -> Optional[str]:
+    """Format a North American phone number as (555) 123-4567."""
+    match = PHONE_PATTERN.search(text)
+    return f"({match[1]}) {match[2]}-{match[3]}" if match else None
+
+def _clause(text: str, start: int, end: int) -> Tuple[int, str]:
+    """The lowercased clause around a match and its offset in the text."""
+    left = max((m.end() for m in CLAUSE_BREAK.finditer(text, 0, start)), default=0)
+    right = CLAUSE_BREAK.search(text, end)
+    return left, text[left:right.start() if right else len(text)].lower()
+
+def _assign(
+    text: str, start: int, end: int, fields: Sequence[Tuple[FieldPath, Tuple[str, ...], float]]
+) -> Optional[Tuple[FieldPath, float]]:
+    """Pick the field whose keyword is closest to a value in its clause.
+
+    The confidence drops when keywords of several fields share the clause.
+    """
+    offset, clause = _clause(text, start, end)
+    position = start - offset
+    candidates = []
+    for path, keywords, confidence in fields:
+        distances = [
+            abs(index - position)
+            for keyword in keywords
+            for index in (m.start() for m in re.finditer(re.escape(keyword), clause))
+        ]
+        if distances:
+            candidates.append((min(distances), path, confidence))
+    if not candidates:
+        return None
+    candidates.sort(key=lambda c: c[0])
+    _, path, confidence = candidates[0]
+    if len(candidates) > 1:
+        confidence -= 0.25
+    return path, confidence
+
+def extract(text: str, source: str = "message") -> List[FieldMatch]:
+    """Recognize field values in a message or a document's text.
+
+    Values in a document are only assigned to case fields, never to the
+    client's own details.
+    """
+    document = source != "message"
+    scale = DOCUMENT_CONFIDENCE if document else 1.0
+    matches: List[FieldMatch] = []
+    taken: List[Tuple[int, int]] = []
+
+    def add(path: FieldPath, value: Any, confidence: float, start: int, end: int) -> None:
+        taken.append((start, end))
+        if document and path[0] not in DOCUMENT_SECTIONS:
+            return
+        matches.append(FieldMatch(path, value, round(confidence * scale, 3), start, end, source))
+
+    def free(start: int, end: int) -> bool:
+        return all(end <= s or start >= e for s, e in taken)
+
+    for path, pattern in IDENTIFIER_PATTERNS:
+        for m in pattern.finditer(text):
+            add(path, m["value"].upper(), 0.9, m.start(), m.end())
+    for m in EMAIL_PATTERN.finditer(text):
+        _, clause = _clause(text, m.start(), m.end())
+        if not any(word in clause for word in OTHER_PARTY):
+            add(("user_data", "email"), m.group().lower(), 0.95, m.start(), m.end())
+    for pattern in DATE_PATTERNS:
+        for m in pattern.finditer(text):
+            if not free(m.start(), m.end()) or (value := _build_date(m)) is None:
+                continue
+            if assigned := _assign(text, m.start(), m.end(), DATE_FIELDS):
+                add(assigned[0], value, assigned[1], m.start(), m.end())
+    for m in PHONE_PATTERN.finditer(text):
+        if not free(m.start(), m.end()):
+            continue
+        _, clause = _clause(text, m.start(), m.end())
+        if any(word in clause for word in OTHER_PARTY):
+            continue
+        # Ten bare digits may as well be an account number
+        confidence = 0.9 if re.search(r"[\s().-]", m.group()) else 0.7
+        path = ("case_data", "employment_info", "current_employer", "phone") if any(
+            word in clause for word in EMPLOYER
+        ) else ("user_data", "phone")
+        add(path, f"({m[1]}) {m[2]}-{m[3]}", confidence, m.start(), m.end())
+    for m in AMOUNT_PATTERN.finditer(text):
+        if not free(m.start(), m.end()):
+            continue
+        if assigned := _assign(text, m.start(), m.end(), AMOUNT_FIELDS):
+            add(assigned[0], _build_amount(m), assigned[1], m.start(), m.end())
+    return matches
+
+def covers(text: str, matches: Iterable[FieldMatch], threshold: float = MIN_CONFIDENCE) -> bool:
+    """Whether the confident matches account for everything a message says.
+
+    True when at least one value was recognized and what is left of the text
+    outside the matches is stopwords and field keywords, so an LLM extraction
+    of the message would have nothing to add.
+    """
+    matches = list(matches)
+    if not matches or any(m.confidence < threshold for m in matches):
+        return False
+    rest, last = [], 0
+    for m in sorted(matches, key=lambda m: m.start):
+        rest.append(text[last:m.start])
+        last = max(last, m.end)
+    rest.append(text[last:])
+    return all(token in FILLER for token in tokenize(" ".join(rest)))
+
+def _get(data: Dict[str, Any], path: Sequence[str]) -> Any:
+    for key in path:
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data
+
+def _set(data: Dict[str, Any], path: Sequence[str], value: Any) -> None:
+    for key in path[:-1]:
+        if not isinstance(data.get(key), dict):
+            data[key] = {}
+        data = data[key]
+    data[path[-1]] = value
+
+def holds(case_data: CaseData, user_data: UserData, match: FieldMatch) -> bool:
+    """Whether a field of the models currently has the matched value."""
+    data = {"case_data": case_data, "user_data": user_data}[match.path[0]]
+    for name in match.path[1:]:
+        data = getattr(data, name, None)
+    if isinstance(data, datetime) and not isinstance(match.value, datetime):
+        data = data.date()
+    return data is not None and dump(data) == dump(match.value)
+
+def apply(
+    case_data: CaseData,
+    user_data: UserData,
+    matches: Iterable[FieldMatch],
+    confidence: Dict[str, float],
+    threshold: float = MIN_CONFIDENCE,
+) -> Tuple[CaseData, UserData, Dict[str, float]]:
+    """Write confident matches into the case and user models.
+
+    A field is filled when it is empty, or when it was filled locally before
+    with no more confidence than the new match (a correction in a later
+    message replaces it; a document cannot override what the client typed).
+    Values set by the LLM extraction are never overwritten. Returns the
+    updated models and the confidences of the fields that were filled.
+    """
+    data = {"case_data": dump(case_data), "user_data": dump(user_data)}
+    filled: Dict[str, float] = {}
+    for m in sorted(matches, key=lambda m: m.confidence):
+        if m.confidence < threshold:
+            continue
+        current = _get(data, m.path)
+        previous = {**confidence, **filled}.get(m.key)
+        if current not in (None, "", []) and (previous is None or m.confidence < previous):
+            continue
+        value = dump(m.value)
+        if current == value and previous is not None:
+            continue
+        _set(data, m.path, value)
+        filled[m.key] = m.confidence
+    if not filled:
+        return case_data, user_data, filled
+    if any(key.startswith("case_data.") for key in filled):
+        case_data = validate(CaseData, data["case_data"])
+    if any(key.startswith("user_data.") for key in filled):
+        user_data = validate(UserData, data["user_data"])
+    return case_data, user_data, filled
+
+__all__ = [
+    "FieldMatch",
+    "MIN_CONFIDENCE",
+    "extract",
+    "covers",
+    "holds",
+    "apply",
+    "parse_date",
+    "parse_amount",
+    "normalize_phone",
+]
@@ -1,15 +1,19 @@
 from langchain_core.messages import AIMessage, SystemMessage, HumanMessage, ToolMessage
-from assistant.state import State, CaseData, UserData, CaseFiles, get_schema_json
+from assistant.state import State, CaseData, UserData, CaseFiles, get_schema_json, PROMPT_EXCLUDE
 from langchain_core.runnables import RunnableConfig
 from assistant.configuration import FireStore, Memory, store
 from assistant import configuration
 from langgraph.graph import END, StateGraph
-from assistant.tools import process_files, update_case, update_user
+from assistant.tools import extract_fields, log_messages, process_files, store_report, update_case, update_user
+from assistant.retrieval import document_context
+from assistant.routing import get_case_id, case_lock
+from assistant.report import shared_builder
+from assistant.utils import prompt_messages
 from trustcall import create_extractor
 from langchain_core.tools import tool
 from pydantic import BaseModel
-from typing import List, Dict, Any
-from assistant import prompts
+from typing import List, Dict, Any, Optional, Union
+from assistant import planner, prompts, telemetry
 from datetime import datetime       
 import logging
 import uuid
@@ -17,81 +21,113 @@ import json
 import os
 
 # Initialize the configuration
-CONFIG = configuration.Configuration.from_runnable_config({
-    "configurable": {
-        "model": os.getenv("OPENAI_API_KEY", "gpt-4")
-    }
-})
-CASE_ID = CONFIG.case_id
-LLM = CONFIG.model
+CONFIG = configuration.CONFIG
+EXTRACTION_TOOLS = {"UserData": UserData, "CaseData": CaseData}
 TOOLS = [
     process_files,
     update_case,
     update_user
 ]
 
-async def case_manager(state: State, store: FireStore = store) -> dict:
+def _last_human_text(state: State) -> str:
+    """Return the text of the latest user message, used as the retrieval query."""
+    for msg in reversed(state.messages):
+        if isinstance(msg, HumanMessage) and isinstance(msg.content, str):
+            return msg.content
+    return ""
+
+@telemetry.traced("node.case_manager")
+async def case_manager(state: State, config: RunnableConfig) -> dict:
     """Manages the case intake interview process."""
-    namespace = ("case_data", CASE_ID)
-    if existing_data := store.get(*namespace):
-        existing_data = {
-            "case_data": existing_data
-        }
-    else:
-        existing_data = {
-            "case_data": CaseData.model_validate({})
-        }
+    case_id = get_case_id(state, config)
+    # Back from the update nodes, the extraction is stored and only the next question is missing
+    follow_up = isinstance(state.messages[-1], ToolMessage)
+    # Simple missing fields are asked for from a template, without a model call
+    if not follow_up and (planned := planner.plan_question(state)):
+        step, question = planned
+        planner.stats.record(True)
+        telemetry.count("planner_turns")
+        return {"messages": [AIMessage(content=question, response_metadata={"planner_field": step.key})]}
+    if not follow_up:
+        planner.stats.record(False)
+    # The checkpointed state holds the current case data; document text is left out
+    existing_data = {
+        "case_data": state.case_data.model_dump(mode="json", exclude=PROMPT_EXCLUDE),
+        "user_data": state.user_data.model_dump(mode="json"),
+    }
 
-    case_manager_prompt = CONFIG.case_manager_prompt.format(
+    case_manager_prompt = prompts.CASE_MANAGER_SYSTEM_PROMPT.format(
         data_schema=get_schema_json(CaseData),
-        existing_data=existing_data
+        existing_case_data=existing_data,
+        tools=", ".join(EXTRACTION_TOOLS)
     )
-    filtered_messages = [
-        msg for msg in state.messages 
-        if isinstance(msg, (HumanMessage, AIMessage))
-    ]
-    next_question = await LLM.ainvoke(
-        [SystemMessage(content=case_manager_prompt), *filtered_messages]
-    )
-    return {"messages":[
-        AIMessage(content=next_question)
-    ]}
+    filtered_messages = prompt_messages(state.messages)
+    system_messages = [SystemMessage(content=case_manager_prompt)]
+    # Messages older than the state's window are only in the log, their summary stands in for them
+    if state.summary:
+        system_messages.append(SystemMessage(content=prompts.CONVERSATION_SUMMARY.format(summary=state.summary)))
+    # Ground the question in the uploaded documents, top-k excerpts only
+    if excerpts := document_context(case_id, state.case_data.documents, _last_human_text(state)):
+        system_messages.append(SystemMessage(
+            content=prompts.DOCUMENT_CONTEXT.format(document_excerpts=excerpts)
+        ))
+    with telemetry.span("llm.case_manager") as span:
+        # The extraction schemas are offered as tools, the router dispatches on the ones called.
+        # None are offered when local extraction already stored everything the message said.
+        llm = configuration.get_llm()
+        if not follow_up and not state.fields_covered:
+            llm = llm.bind_tools(list(EXTRACTION_TOOLS.values()))
+        next_question = await llm.ainvoke([*system_messages, *filtered_messages])
+        telemetry.record_usage(next_question)
+    return {"messages": [next_question]}
     
-async def end_interview(state: State) -> dict:
-    """Ends the interview session."""
-    return {"messages": [
-        *state.messages, 
-        AIMessage(
-            content="Thank you for your time. The interview is now complete."
-        )
-    ]}
+@telemetry.traced("node.end_interview")
+async def end_interview(state: State, config: RunnableConfig, store: Optional[FireStore] = None) -> dict:
+    """Ends the interview session and builds the case report."""
+    store = store or configuration.store
+    case_id = get_case_id(state, config)
+    # Only sections whose data changed since the last build are regenerated
+    with telemetry.span("report.build", case_id=case_id):
+        report = await shared_builder(store).build(case_id, state.case_data)
+    async with case_lock(case_id):
+        case_data = await store_report(store, case_id, state.case_data, report)
+    return {
+        "case_data": case_data,
+        "messages": [
+            *state.messages, 
+            AIMessage(
+                content="Thank you for your time. The interview is now complete."
+            )
+        ]
+    }
 
-async def router_node(state: State) -> str:
-    """Routes the conversation flow."""
+async def router_node(state: State) -> Union[str, List[str]]:
+    """Routes the conversation flow, to every update node whose tool was called."""
     msg = state.messages[-1]
     
-    if isinstance(msg, HumanMessage) and msg.content.lower() in ["quit", "exit", "terminate"]:
+    if _last_human_text(state).strip().lower() in ["quit", "exit", "terminate"]:
         return "end_interview"
     
-    if msg.additional_kwargs.get("tool_calls"):
+    tool_names = [tc["name"] for tc in getattr(msg, "tool_calls", None) or []]
+    if not tool_names and msg.additional_kwargs.get("tool_calls"):
         tool_names = [tc["function"]["name"] for tc in msg.additional_kwargs["tool_calls"]]
-        if "UserData" in tool_names:
-            return "update_user"
-        if "CaseData" in tool_names:
-            return "update_case"
-    return "case_manager"
+    updates = [node for name, node in (("UserData", "update_user"), ("CaseData", "update_case")) if name in tool_names]
+    return updates or END
 
 # Create the graph
 builder = StateGraph(State, config_schema=configuration.Configuration)
 
 # Add nodes
+builder.add_node("extract_fields", extract_fields)
 builder.add_node("case_manager", case_manager)
 builder.add_node("update_case", update_case)
 builder.add_node("update_user", update_user)
 builder.add_node("end_interview", end_interview)
+builder.add_node("log_messages", log_messages)
 
 # Set the entry point
-builder.add_edge("__start__", "case_manager")
+builder.add_edge("__start__", "extract_fields")
+builder.add_edge("extract_fields", "case_manager")
 
 # Add conditional edges
 builder.add_conditional_edges(
@@ -101,12 +137,17 @@ builder.add_conditional_edges(
         "update_case": "update_case",
         "update_user": "update_user",
         "end_interview": "end_interview",
-        END: END
+        END: "log_messages"
     }
 )
 
-# Add edge from end_interview to END
-builder.add_edge("end_interview", END)
+# Tool results go back to the case manager for the next question
+builder.add_edge("update_case", "case_manager")
+builder.add_edge("update_user", "case_manager")
+
+# Every turn ends by appending its messages to the message log
+builder.add_edge("end_interview", "log_messages")
+builder.add_edge("log_messages", END)
 
 # Compile the graph
 assistant = builder.compile()
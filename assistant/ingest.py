@@ -0,0 +1,99 @@
+"""Streaming ingestion of uploads: size limits, hashing and spooling in one pass."""
+
+from dataclasses import dataclass
+from typing import Any, BinaryIO, Dict, Optional
+import tempfile
+import hashlib
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+class UploadTooLarge(ValueError):
+    """Raised when an upload exceeds the per-file or per-session limit."""
+
+@dataclass
+class IngestLimits:
+    """Size limits and the threshold above which uploads are spooled to disk."""
+    max_file_bytes: int = int(os.getenv("MAX_UPLOAD_BYTES", 50 * 1024 * 1024))
+    max_session_bytes: int = int(os.getenv("MAX_SESSION_UPLOAD_BYTES", 250 * 1024 * 1024))
+    spool_threshold: int = int(os.getenv("UPLOAD_SPOOL_THRESHOLD", 2 * 1024 * 1024))
+
+@dataclass
+class SpooledUpload:
+    """An upload read once: either small enough to keep in memory or spooled to a temp file."""
+    name: str
+    type: str
+    size: int
+    file_hash: str
+    content: Optional[bytes] = None
+    path: Optional[str] = None
+
+    def as_job_file(self) -> Dict[str, Any]:
+        """Return the file dict accepted by JobQueue.submit."""
+        return {
+            "name": self.name,
+            "type": self.type,
+            "size": self.size,
+            "hash": self.file_hash,
+            "content": self.content,
+            "path": self.path,
+        }
+
+    def discard(self) -> None:
+        """Remove the spooled file, if any."""
+        if self.path and os.path.exists(self.path):
+            os.unlink(self.path)
+
+def spool_upload(
+    stream: BinaryIO,
+    name: str,
+    file_type: str,
+    limits: IngestLimits = IngestLimits(),
+    session_bytes: int = 0,
+    spool_dir: Optional[str] = None,
+) -> SpooledUpload:
+    """Read an upload in chunks, hashing it and enforcing limits as it streams.
+
+    Uploads up to `limits.spool_threshold` stay in memory; larger ones are
+    written to a temporary file while being read, so the full content is never
+    held in memory.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    buffer = bytearray()
+    spooled = None
+    try:
+        while chunk := stream.read(CHUNK_SIZE):
+            size += len(chunk)
+            if size > limits.max_file_bytes:
+                raise UploadTooLarge(
+                    f"{name} is larger than the {limits.max_file_bytes // (1024 * 1024)} MB per-file limit"
+                )
+            if session_bytes + size > limits.max_session_bytes:
+                raise UploadTooLarge(
+                    f"{name} exceeds the {limits.max_session_bytes // (1024 * 1024)} MB upload limit of this session"
+                )
+            digest.update(chunk)
+            if spooled is None and len(buffer) + len(chunk) > limits.spool_threshold:
+                spooled = tempfile.NamedTemporaryFile(dir=spool_dir, prefix="upload-", delete=False)
+                spooled.write(buffer)
+                buffer = bytearray()
+            if spooled is not None:
+                spooled.write(chunk)
+            else:
+                buffer += chunk
+    except BaseException:
+        if spooled is not None:
+            spooled.close()
+            os.unlink(spooled.name)
+        raise
+
+    if spooled is not None:
+        spooled.close()
+        return SpooledUpload(name, file_type, size, digest.hexdigest(), path=spooled.name)
+    return SpooledUpload(name, file_type, size, digest.hexdigest(), content=bytes(buffer))
+
+__all__ = ["IngestLimits", "SpooledUpload", "UploadTooLarge", "spool_upload"]
@@ -0,0 +1,520 @@
+"""Durable background job queue for document ingestion and analysis."""
+
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from assistant.state import CaseData, CaseFiles
+from assistant.serialization import validate_json
+from assistant import telemetry
+from assistant.utils import VISION_MAX_IMAGES, KnownImage, extract_text, extract_text_from_path
+import threading
+import tempfile
+import shutil
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import uuid
+import json
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Stored upload bytes are split into chunks below Firestore's 1 MiB document limit,
+# committed a few chunks per batch to stay below its request size limit
+CONTENT_CHUNK = 512 * 1024
+CONTENT_BATCH = 8
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    case_id TEXT NOT NULL,
+    file_hash TEXT NOT NULL,
+    file_name TEXT NOT NULL,
+    file_type TEXT NOT NULL,
+    file_size INTEGER NOT NULL,
+    content BLOB,
+    content_path TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    result TEXT,
+    merged INTEGER NOT NULL DEFAULT 0,
+    image_hash TEXT,
+    run_after REAL NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    UNIQUE (case_id, file_hash)
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, run_after);
+CREATE INDEX IF NOT EXISTS jobs_case ON jobs (case_id);
+"""
+
+@dataclass
+class Job:
+    """A single file-processing job as stored in the queue."""
+    job_id: str
+    case_id: str
+    file_hash: str
+    file_name: str
+    file_type: str
+    file_size: int
+    status: str = PENDING
+    attempts: int = 0
+    error: Optional[str] = None
+    result: Optional[Dict[str, Any]] = None
+    content: Optional[bytes] = field(default=None, repr=False)
+    content_path: Optional[str] = None
+
+    def progress(self) -> Dict[str, Any]:
+        """Return the UI-facing progress entry for this job."""
+        return {
+            "job_id": self.job_id,
+            "file_name": self.file_name,
+            "status": self.status,
+            "attempts": self.attempts,
+            "error": self.error,
+        }
+
+Processor = Callable[[Job], Awaitable[CaseFiles]]
+Analyzer = Callable[[str], Awaitable[str]]
+# (case_id, image files, file_id -> bytes or path, the case's earlier images) -> file_id -> perceptual hash
+ImageAnalyzer = Callable[[str, List[CaseFiles], Dict[str, Any], List[KnownImage]], Awaitable[Dict[str, int]]]
+
+def is_image(job: Job) -> bool:
+    return job.file_type.startswith("image")
+
+def file_hash(content: bytes) -> str:
+    """Return the content hash used to deduplicate uploads."""
+    return hashlib.sha256(content).hexdigest()
+
+def content_collection(file_id: str) -> str:
+    return f"files/{file_id}/content"
+
+def _read_chunks(job: Job) -> Iterator[bytes]:
+    if job.content_path:
+        with open(job.content_path, "rb") as f:
+            while chunk := f.read(CONTENT_CHUNK):
+                yield chunk
+    else:
+        for start in range(0, len(job.content or b""), CONTENT_CHUNK):
+            yield job.content[start:start + CONTENT_CHUNK]
+
+async def store_content(store: Any, job: Job) -> int:
+    """Write the uploaded bytes of a job to the store and return the number of chunks.
+
+    The bytes are split into chunk documents (`files/{file_id}/content`) below
+    Firestore's document size limit, and a spooled upload is read chunk by
+    chunk rather than whole.
+    """
+    from assistant.configuration import Memory
+    collection = content_collection(job.job_id)
+    chunks = 0
+    batch = store.new_batch()
+    with telemetry.span("job.store_content", bytes=job.file_size):
+        for chunk in _read_chunks(job):
+            document_id = f"{chunks:06d}"
+            batch.set((collection, document_id), Memory(
+                database="default", collection=collection, document_id=document_id, data={"content": chunk}
+            ))
+            chunks += 1
+            if chunks % CONTENT_BATCH == 0:
+                await batch.commit()
+                batch = store.new_batch()
+        await batch.commit()
+    return chunks
+
+async def read_content(store: Any, file_id: str) -> Optional[bytes]:
+    """The uploaded bytes of a file written by `store_content`, None when none were stored."""
+    file_doc = await store.get(("files", file_id))
+    if not file_doc or not file_doc.data.get("content_chunks"):
+        return None
+    chunks = [memory.data["content"] async for memory in store.stream(content_collection(file_id))]
+    return b"".join(chunks)
+
+def make_processor(analyzer: Optional[Analyzer] = None, store: Any = None) -> Processor:
+    """Build the default processor: store write, OCR/PDF extraction, optional LLM analysis.
+
+    With a `store`, the uploaded bytes are stored before anything else, the
+    queue deletes its copy once the job finishes. Images are not given to
+    `analyzer`, their analysis comes from the queue's batched image stage.
+    """
+    @telemetry.traced("job.process")
+    async def process(job: Job) -> CaseFiles:
+        chunks = await store_content(store, job) if store is not None else 0
+        # OCR and PDF parsing are blocking, keep them off the event loop
+        if job.content_path:
+            text = await asyncio.to_thread(extract_text_from_path, job.content_path, job.file_type)
+        else:
+            text = await asyncio.to_thread(extract_text, job.content, job.file_type)
+        file_metadata = CaseFiles(
+            file_id=job.job_id,
+            file_type=job.file_type,
+            file_name=job.file_name,
+            file_size=job.file_size,
+            file_label=f"Uploaded {job.file_type} document",
+            uploaded_at=datetime.now(),
+            file_contents=text
+        )
+        if analyzer is not None and text and not is_image(job):
+            file_metadata.file_analysis = await analyzer(text)
+        if store is not None:
+            from assistant.configuration import Memory
+            memory = Memory(
+                database="default",
+                collection="files",
+                document_id=job.job_id,
+                data={
+                    "case_id": job.case_id,
+                    "metadata": file_metadata.model_dump(mode="json"),
+                    "content_chunks": chunks,
+                }
+            )
+            await store.set(("files", job.job_id), memory)
+        return file_metadata
+    return process
+
+class JobQueue:
+    """SQLite-backed queue that processes uploads outside of the chat turn.
+
+    Jobs are idempotent per (case_id, file hash): re-uploading the same file
+    returns the existing job instead of processing it again, unless that job
+    failed, in which case it is queued again. With an
+    `image_analyzer`, a worker that claims an image also claims the case's
+    other waiting images and analyzes them in shared vision requests, skipping
+    near-duplicates of images the case already has.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        processor: Optional[Processor] = None,
+        workers: int = 2,
+        max_attempts: int = 3,
+        retry_delay: float = 2.0,
+        poll_interval: float = 0.5,
+        spool_dir: Optional[str] = None,
+        lease: Optional[float] = None,
+        image_analyzer: Optional[ImageAnalyzer] = None,
+        image_batch: int = VISION_MAX_IMAGES,
+    ):
+        self.path = path or os.getenv("JOB_QUEUE_PATH", "jobs.db")
+        # Large uploads wait on disk next to the queue database rather than in it
+        self.spool_dir = spool_dir or os.getenv("JOB_SPOOL_DIR") or (
+            os.path.join(tempfile.gettempdir(), "case-agent-uploads")
+            if self.path == ":memory:" else f"{self.path}.files"
+        )
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self.processor = processor or make_processor()
+        self.image_analyzer = image_analyzer
+        self.image_batch = image_batch
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.poll_interval = poll_interval
+        # A running job whose worker has not renewed it for this long is treated as abandoned
+        self.lease = lease if lease is not None else float(os.getenv("JOB_LEASE_SECONDS", 300))
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "content_path" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN content_path TEXT")
+        if "image_hash" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN image_hash TEXT")
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = asyncio.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _execute(self, sql: str, params: tuple = ()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    @staticmethod
+    def _row_to_job(row: sqlite3.Row, with_content: bool = False) -> Job:
+        return Job(
+            job_id=row["job_id"],
+            case_id=row["case_id"],
+            file_hash=row["file_hash"],
+            file_name=row["file_name"],
+            file_type=row["file_type"],
+            file_size=row["file_size"],
+            status=row["status"],
+            attempts=row["attempts"],
+            error=row["error"],
+            result=json.loads(row["result"]) if row["result"] else None,
+            content=row["content"] if with_content else None,
+            content_path=row["content_path"],
+        )
+
+    def submit(self, case_id: str, files: List[Dict[str, Any]]) -> List[Job]:
+        """Enqueue uploaded files and return their jobs immediately.
+
+        Each file carries either its `content` bytes or the `path` of a spooled
+        upload (see assistant.ingest) together with its `hash` and `size`.
+        Spooled files are moved into the queue's spool directory, or deleted
+        when the same file is already queued or done for the case.
+        """
+        jobs = []
+        now = time.time()
+        for file in files:
+            content = file.get("content")
+            spooled_path = file.get("path")
+            digest = file.get("hash") or file_hash(content)
+            size = file.get("size") or len(content)
+            job_id = str(uuid.uuid4())
+            content_path = os.path.join(self.spool_dir, job_id) if spooled_path else None
+            with self._lock:
+                # A file whose job failed for good is queued again when it is uploaded again
+                inserted = self._conn.execute(
+                    """INSERT INTO jobs
+                       (job_id, case_id, file_hash, file_name, file_type, file_size,
+                        content, content_path, status, created_at, updated_at)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                       ON CONFLICT (case_id, file_hash) DO UPDATE SET
+                           file_name = excluded.file_name, file_type = excluded.file_type,
+                           content = excluded.content, content_path = excluded.content_path,
+                           status = excluded.status, attempts = 0, error = NULL, run_after = 0,
+                           updated_at = excluded.updated_at
+                       WHERE jobs.status = ?""",
+                    (job_id, case_id, digest, file.get("name", ""), file.get("type", ""),
+                     size, content, content_path, PENDING, now, now, FAILED)
+                ).rowcount
+            if spooled_path:
+                if inserted:
+                    shutil.move(spooled_path, content_path)
+                else:
+                    os.unlink(spooled_path)
+            row = self._execute(
+                "SELECT * FROM jobs WHERE case_id = ? AND file_hash = ?", (case_id, digest)
+            )[0]
+            jobs.append(self._row_to_job(row))
+        return jobs
+
+    def progress(self, case_id: str) -> List[Dict[str, Any]]:
+        """Return the per-file progress of every job of a case."""
+        rows = self._execute(
+            "SELECT * FROM jobs WHERE case_id = ? ORDER BY created_at", (case_id,)
+        )
+        return [self._row_to_job(row).progress() for row in rows]
+
+    def pending_count(self, case_id: str) -> int:
+        """Return how many jobs of a case are still waiting or running."""
+        rows = self._execute(
+            "SELECT COUNT(*) FROM jobs WHERE case_id = ? AND status IN (?, ?)",
+            (case_id, PENDING, RUNNING)
+        )
+        return rows[0][0]
+
+    def merge_results(self, case_data: CaseData, case_id: str) -> Tuple[CaseData, List[CaseFiles]]:
+        """Return the case with the finished, not yet merged jobs added to its files.
+
+        The extracted text is kept once, in `documents`; `case_files` lists the
+        same files without it. `case_data` is not modified; the copy is
+        returned together with the finished files. The jobs stay unmerged
+        until `mark_merged` is called once the caller has stored the case.
+        """
+        rows = self._execute(
+            "SELECT * FROM jobs WHERE case_id = ? AND status = ? AND merged = 0 ORDER BY created_at",
+            (case_id, DONE)
+        )
+        finished = [validate_json(CaseFiles, row["result"]) for row in rows]
+        known = {doc.file_id for doc in case_data.documents} | {f.file_id for f in case_data.case_files}
+        new_files = [case_file for case_file in finished if case_file.file_id not in known]
+        if new_files:
+            case_data = case_data.model_copy(update={
+                "documents": [*case_data.documents, *new_files],
+                "case_files": [
+                    *case_data.case_files,
+                    *(case_file.model_copy(update={"file_contents": ""}) for case_file in new_files)
+                ],
+            })
+        return case_data, finished
+
+    def mark_merged(self, case_files: Iterable[CaseFiles]) -> None:
+        """Record that finished jobs were merged into their stored case."""
+        for case_file in case_files:
+            self._execute("UPDATE jobs SET merged = 1 WHERE job_id = ?", (case_file.file_id,))
+
+    def _claim(self) -> Optional[Job]:
+        """Atomically move the next runnable job, or one whose lease expired, to RUNNING."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                """UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ?
+                   WHERE job_id = (
+                       SELECT job_id FROM jobs
+                       WHERE (status = ? AND run_after <= ?) OR (status = ? AND updated_at < ?)
+                       ORDER BY created_at LIMIT 1
+                   )
+                   RETURNING *""",
+                (RUNNING, now, PENDING, now, RUNNING, now - self.lease)
+            ).fetchone()
+        return self._row_to_job(row, with_content=True) if row else None
+
+    def _claim_images(self, case_id: str, limit: int) -> List[Job]:
+        """Atomically move up to `limit` runnable image jobs of a case to RUNNING."""
+        if limit <= 0:
+            return []
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                """UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ?
+                   WHERE job_id IN (
+                       SELECT job_id FROM jobs
+                       WHERE case_id = ? AND status = ? AND run_after <= ? AND file_type LIKE 'image%'
+                       ORDER BY created_at LIMIT ?
+                   )
+                   RETURNING *""",
+                (RUNNING, now, case_id, PENDING, now, limit)
+            ).fetchall()
+        return [self._row_to_job(row, with_content=True) for row in rows]
+
+    def _known_images(self, case_id: str) -> List[KnownImage]:
+        """The images of a case analyzed before, for duplicate detection."""
+        rows = self._execute(
+            "SELECT file_name, image_hash, result FROM jobs WHERE case_id = ? AND status = ? AND image_hash IS NOT NULL",
+            (case_id, DONE)
+        )
+        return [
+            (row["file_name"], int(row["image_hash"], 16), json.loads(row["result"]).get("file_analysis", ""))
+            for row in rows
+        ]
+
+    async def _renew(self, job: Job) -> None:
+        """Keep renewing the lease of a job while it is processed."""
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            self._execute(
+                "UPDATE jobs SET updated_at = ? WHERE job_id = ? AND status = ?",
+                (time.time(), job.job_id, RUNNING)
+            )
+
+    @staticmethod
+    def _release(job: Job) -> None:
+        """Delete the spooled upload of a finished job."""
+        if job.content_path and os.path.exists(job.content_path):
+            os.unlink(job.content_path)
+
+    def _complete(self, job: Job, case_file: CaseFiles, image_hash: Optional[int] = None) -> None:
+        self._execute(
+            """UPDATE jobs SET status = ?, result = ?, image_hash = ?, content = NULL, content_path = NULL,
+               error = NULL, updated_at = ? WHERE job_id = ?""",
+            (DONE, case_file.model_dump_json(), None if image_hash is None else f"{image_hash:016x}",
+             time.time(), job.job_id)
+        )
+        self._release(job)
+
+    def _fail(self, job: Job, error: Exception) -> None:
+        if job.attempts >= self.max_attempts:
+            logger.error(f"Job {job.job_id} ({job.file_name}) failed permanently: {error}")
+            self._execute(
+                """UPDATE jobs SET status = ?, error = ?, content = NULL, content_path = NULL,
+                   updated_at = ? WHERE job_id = ?""",
+                (FAILED, str(error), time.time(), job.job_id)
+            )
+            self._release(job)
+            return
+        delay = self.retry_delay * 2 ** (job.attempts - 1)
+        logger.warning(f"Job {job.job_id} ({job.file_name}) failed, retrying in {delay:.1f}s: {error}")
+        self._execute(
+            "UPDATE jobs SET status = ?, error = ?, run_after = ?, updated_at = ? WHERE job_id = ?",
+            (PENDING, str(error), time.time() + delay, time.time(), job.job_id)
+        )
+
+    async def _worker(self) -> None:
+        while not self._stopping.is_set():
+            job = self._claim()
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            jobs = [job]
+            if self.image_analyzer is not None and is_image(job):
+                jobs.extend(self._claim_images(job.case_id, self.image_batch - 1))
+            renewals = [asyncio.create_task(self._renew(claimed)) for claimed in jobs]
+            try:
+                await self._run(jobs)
+            finally:
+                for renew in renewals:
+                    renew.cancel()
+
+    async def _run(self, jobs: List[Job]) -> None:
+        """Process claimed jobs, then analyze their images together."""
+        results = await asyncio.gather(*(self.processor(job) for job in jobs), return_exceptions=True)
+        done = []
+        for job, result in zip(jobs, results):
+            if isinstance(result, Exception):
+                self._fail(job, result)
+            else:
+                done.append((job, result))
+        images = [(job, case_file) for job, case_file in done if is_image(job)] if self.image_analyzer else []
+        hashes: Dict[str, int] = {}
+        if images:
+            case_id = images[0][0].case_id
+            try:
+                hashes = await self.image_analyzer(
+                    case_id, [case_file for _, case_file in images],
+                    {job.job_id: job.content_path or job.content for job, _ in images},
+                    self._known_images(case_id)
+                )
+            except Exception as e:
+                for job, _ in images:
+                    self._fail(job, e)
+                done = [(job, case_file) for job, case_file in done if not is_image(job)]
+        for job, case_file in done:
+            self._complete(job, case_file, hashes.get(job.job_id))
+
+    async def start(self) -> None:
+        """Start the worker pool on the running event loop."""
+        # Jobs left RUNNING by a crashed process are picked up again once their lease
+        # expired; jobs another live process is working on keep renewing theirs
+        self._execute(
+            "UPDATE jobs SET status = ?, updated_at = ? WHERE status = ? AND updated_at < ?",
+            (PENDING, time.time(), RUNNING, time.time() - self.lease)
+        )
+        self._stopping = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        """Stop the worker pool after the jobs in flight finish."""
+        self._stopping.set()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def start_in_thread(self) -> None:
+        """Run the worker pool on a dedicated background event loop."""
+        if self._thread is not None:
+            return
+        self._loop = asyncio.new_event_loop()
+
+        def run() -> None:
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self.start())
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name="job-queue", daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        """Stop the background loop, if any, and close the database."""
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self.stop(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = self._thread = None
+        with self._lock:
+            self._conn.close()
+
+__all__ = ["JobQueue", "Job", "make_processor", "store_content", "read_content", "content_collection", "file_hash", "is_image"]
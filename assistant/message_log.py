@@ -0,0 +1,137 @@
+"""Append-only, paged log of a case's conversation in the store.
+
+Every message is its own document in `cases/{case_id}/messages`, keyed by a
+zero-padded sequence number so document order is conversation order. A turn's
+new messages and the log head (next sequence number, latest summary) are
+written in one batch, so a turn costs the same no matter how long the
+interview is. Reads page backward from the newest message; resuming reads the
+head, the latest summary and one page.
+
+The log is the full transcript. The interview state only keeps the messages
+after the latest summary: once it holds more than SUMMARY_TRIGGER messages,
+everything but the last SUMMARY_KEEP or so is summarized and dropped from it.
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from langchain_core.messages import BaseMessage, HumanMessage, message_to_dict, messages_from_dict
+from assistant.configuration import FireStore, Memory
+from assistant import telemetry
+
+HEAD_COLLECTION = "message-logs"
+SEQUENCE_WIDTH = 12
+SUMMARY_TRIGGER = 40
+SUMMARY_KEEP = 20
+
+def messages_collection(case_id: str) -> str:
+    return f"cases/{case_id}/messages"
+
+def summaries_collection(case_id: str) -> str:
+    return f"cases/{case_id}/summaries"
+
+def sequence_id(seq: int) -> str:
+    """Document ID of a sequence number, ordered like the number."""
+    return f"{seq:0{SEQUENCE_WIDTH}d}"
+
+def summary_cut(messages: Sequence[BaseMessage], keep: int = SUMMARY_KEEP) -> int:
+    """Index of the first message kept when the ones before it are summarized, 0 for none.
+
+    At least `keep` messages are kept and the kept ones start with a client
+    message, so no tool call is separated from its result.
+    """
+    for index in range(len(messages) - keep, 0, -1):
+        if isinstance(messages[index], HumanMessage):
+            return index
+    return 0
+
+@dataclass
+class Summary:
+    """A summary of the conversation up to and including message `through_seq`."""
+    text: str
+    through_seq: int
+
+@dataclass
+class Resumed:
+    """What a resumed session needs: the latest summary and the newest messages."""
+    messages: List[BaseMessage]
+    cursor: Optional[str]
+    summary: Optional[Summary]
+    total: int
+
+class MessageLog:
+    """Sequenced message documents per case with batched appends and backward paging."""
+
+    def __init__(self, store: FireStore, page_size: int = 50):
+        self.store = store
+        self.page_size = page_size
+
+    async def head(self, case_id: str) -> Dict[str, Any]:
+        """The log head: the next sequence number and the latest summary's position."""
+        memory = await self.store.get((HEAD_COLLECTION, case_id))
+        return memory.data if memory else {"next_seq": 0, "summary_seq": None}
+
+    @staticmethod
+    def _put(batch: Any, collection: str, document_id: str, data: Dict[str, Any]) -> None:
+        batch.set((collection, document_id), Memory(
+            database="default", collection=collection, document_id=document_id, data=data
+        ))
+
+    async def append(self, case_id: str, messages: Sequence[BaseMessage]) -> int:
+        """Append a turn's messages in one batched write and return the next sequence number.
+
+        Callers hold the case lock, the log has a single writer per case.
+        """
+        head = await self.head(case_id)
+        seq = head["next_seq"]
+        if not messages:
+            return seq
+        collection = messages_collection(case_id)
+        with telemetry.span("message_log.append", case_id=case_id, messages=len(messages)):
+            batch = self.store.new_batch()
+            for message in messages:
+                self._put(batch, collection, sequence_id(seq), {"seq": seq, "message": message_to_dict(message)})
+                seq += 1
+            self._put(batch, HEAD_COLLECTION, case_id, {**head, "next_seq": seq})
+            await batch.commit()
+        return seq
+
+    async def page(
+        self, case_id: str, cursor: Optional[str] = None, page_size: Optional[int] = None
+    ) -> Tuple[List[BaseMessage], Optional[str]]:
+        """One page of messages older than `cursor` (newest page without one), oldest first.
+
+        Returns the messages and the cursor of the next older page, None at the
+        start of the conversation.
+        """
+        with telemetry.span("message_log.page", case_id=case_id):
+            items, next_cursor = await self.store.page(
+                messages_collection(case_id), page_size=page_size or self.page_size,
+                cursor=cursor, descending=True
+            )
+        return messages_from_dict([item.data["message"] for item in reversed(items)]), next_cursor
+
+    async def add_summary(self, case_id: str, text: str, through_seq: int) -> None:
+        """Record a summary of the conversation up to message `through_seq`."""
+        head = await self.head(case_id)
+        batch = self.store.new_batch()
+        self._put(batch, summaries_collection(case_id), sequence_id(through_seq), {"text": text, "through_seq": through_seq})
+        self._put(batch, HEAD_COLLECTION, case_id, {**head, "summary_seq": through_seq})
+        await batch.commit()
+
+    async def latest_summary(self, case_id: str, head: Optional[Dict[str, Any]] = None) -> Optional[Summary]:
+        head = head if head is not None else await self.head(case_id)
+        if head.get("summary_seq") is None:
+            return None
+        memory = await self.store.get((summaries_collection(case_id), sequence_id(head["summary_seq"])))
+        return Summary(**memory.data) if memory else None
+
+    async def resume(self, case_id: str, last: Optional[int] = None) -> Resumed:
+        """Load the newest `last` messages and the latest summary of a case."""
+        head = await self.head(case_id)
+        summary = await self.latest_summary(case_id, head)
+        if not head["next_seq"]:
+            return Resumed(messages=[], cursor=None, summary=summary, total=0)
+        messages, cursor = await self.page(case_id, page_size=last)
+        return Resumed(messages=messages, cursor=cursor, summary=summary, total=head["next_seq"])
+
+__all__ = ["MessageLog", "Summary", "Resumed", "messages_collection", "sequence_id", "summary_cut", "SUMMARY_TRIGGER", "SUMMARY_KEEP"]
@@ -0,0 +1,106 @@
+"""Interview planner that asks for simple missing fields from templates.
+
+The interview follows PLAN: contact details, then the narrative of the case,
+then the insurance identifiers. When the next missing field in the plan is a
+simple one and local extraction already captured everything the client just
+said, the next question is rendered from a template instead of asking the LLM.
+Every other turn (narrative fields, free-form answers, uploads) falls back to
+the LLM case manager.
+"""
+
+from dataclasses import dataclass
+from typing import Any, Container, Dict, List, Optional, Tuple
+from langchain_core.messages import AIMessage
+from assistant.state import State
+import threading
+
+@dataclass(frozen=True)
+class Step:
+    """A field of the interview plan; steps without a template need the LLM."""
+    path: Tuple[str, ...]
+    template: Optional[str] = None
+
+    @property
+    def key(self) -> str:
+        return ".".join(self.path)
+
+PLAN: List[Step] = [
+    Step(("user_data", "first_name"), "Thank you. Before we go further, could you tell me your full name?"),
+    Step(("user_data", "email"), "Thanks{name}. What email address should we use to reach you?"),
+    Step(("user_data", "phone"), "Thanks{name}. What is the best phone number to reach you at?"),
+    Step(("user_data", "preferred_contact_method"), "Got it{name}. Would you prefer that we contact you by phone, email or text?"),
+    Step(("user_data", "date_of_birth"), "Thank you{name}. What is your date of birth?"),
+    Step(("case_data", "incident_details", "incident_description")),
+    Step(("case_data", "injury_details", "list_injury_details")),
+    Step(("case_data", "medical_info", "initial_treatment")),
+    Step(("case_data", "insurance_info", "client_insurance", "company_name"), "Thanks{name}. Which insurance company are you insured with?"),
+    Step(("case_data", "insurance_info", "client_insurance", "policy_number"), "Do you have your {company} policy number handy? If so, please share it."),
+    Step(("case_data", "insurance_info", "claim_number"), "Has a claim been opened with {insurer} yet? If so, what is the claim number?"),
+]
+
+def _value(state: State, path: Tuple[str, ...]) -> Any:
+    value: Any = state
+    for name in path:
+        value = getattr(value, name, None)
+        if value is None:
+            return None
+    return value
+
+def next_step(state: State, skip: Container[str] = ()) -> Optional[Step]:
+    """The first step of the plan whose field is still empty."""
+    for step in PLAN:
+        if step.key not in skip and _value(state, step.path) in (None, "", []):
+            return step
+    return None
+
+def plan_question(state: State) -> Optional[Tuple[Step, str]]:
+    """The templated next question, or None when the turn needs the LLM."""
+    if not state.fields_covered:
+        return None
+    # A field the client was already asked for by template is left to the LLM from then on
+    asked = {
+        msg.response_metadata.get("planner_field")
+        for msg in state.messages if isinstance(msg, AIMessage)
+    }
+    step = next_step(state, skip=asked)
+    if step is None or step.template is None:
+        return None
+    first_name = state.user_data.first_name
+    company = _value(state, ("case_data", "insurance_info", "client_insurance", "company_name"))
+    return step, step.template.format(
+        name=f", {first_name}" if first_name else "",
+        company=company or "insurance",
+        insurer=company or "your insurer",
+    )
+
+class PlannerStats:
+    """Counts of turns answered by the planner and by the LLM."""
+
+    def __init__(self):
+        self.planner_turns = 0
+        self.llm_turns = 0
+        self._lock = threading.Lock()
+
+    def record(self, planned: bool) -> None:
+        with self._lock:
+            if planned:
+                self.planner_turns += 1
+            else:
+                self.llm_turns += 1
+
+    @property
+    def ratio(self) -> float:
+        """Share of turns answered without an LLM call."""
+        total = self.planner_turns + self.llm_turns
+        return self.planner_turns / total if total else 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {"planner_turns": self.planner_turns, "llm_turns": self.llm_turns, "planner_ratio": round(self.ratio, 3)}
+
+    def reset(self) -> None:
+        with self._lock:
+            self.planner_turns = self.llm_turns = 0
+
+stats = PlannerStats()
+
+__all__ = ["Step", "PLAN", "next_step", "plan_question", "PlannerStats", "stats"]
@@ -107,4 +107,65 @@ By using this chatbot, you acknowledge and agree to the following:
    - May not reflect the full complexity of your situation
 
 By continuing to use this agent, you consent to these terms and our data practices.
-"""
\ No newline at end of file
+"""
+DOCUMENT_CONTEXT = """
+The following excerpts were retrieved from the documents the client uploaded, because they are
+the most relevant to the current part of the conversation. Use them to ground your questions and
+extractions, refer to the file names when citing them, and do not assume anything they do not state:
+
+{document_excerpts}
+"""
+
+DOCUMENT_ANALYSIS_QUERY = (
+    "date time name phone email address incident accident injury diagnosis treatment "
+    "physician hospital medication insurance policy claim number coverage amount cost "
+    "bill invoice wages payment settlement"
+)
+
+DOCUMENT_ANALYSIS_PROMPT = """
+Analyze these excerpts of the document and extract any relevant case information:
+
+{document_excerpts}
+
+Focus on:
+1. Dates and times
+2. Names and contact information
+3. Incident details
+4. Medical information
+5. Insurance details
+6. Financial information
+"""
+
+CONVERSATION_SUMMARY_PROMPT = """
+Summarize the earlier part of a personal injury client intake interview for the attorney continuing it. Keep every
+fact the client stated (names, dates, places, injuries, treatment, insurance, amounts), what they were asked but did
+not answer, and any corrections they made. Write in the third person, concisely, without adding anything new.
+
+Summary of the interview before this part:
+{summary}
+
+This part of the interview:
+{transcript}
+"""
+
+CONVERSATION_SUMMARY = """
+Earlier messages of this interview are not shown. This is a summary of them:
+
+{summary}
+"""
+
+REPORT_SECTION_PROMPT = """
+You are drafting one section of a personal injury case intake report for the attorneys at Hastings, Cohan & Walsh, LLP.
+Write the "{section_title}" section using only the case information below. Be factual and concise, use short paragraphs
+or bullet points, preserve the client's own account, flag missing or inconsistent information, and do not speculate.
+Do not add a heading, it is added for you.
+
+{section_data}
+"""
+
+VISION_BATCH_PROMPT = """
+Analyze the images a personal injury client uploaded and extract all relevant case information. Focus on visible
+damages, injuries, documents, or other pertinent details. The images are numbered in the order given. Describe every
+image separately and in detail, starting each description on its own line with the header "### Image <number>", and
+do not compare or merge images.
+"""
@@ -0,0 +1,266 @@
+"""Replay historical intake transcripts through the assistant graph.
+
+Usage: python -m assistant.replay transcripts.jsonl [--concurrency 8] [--workers 4] [--store memory|firestore]
+
+Each line of the input is one transcript:
+
+    {"case_id": "...", "messages": [{"role": "user" | "assistant", "content": "..."}],
+     "files": [{"path": "...", "type": "application/pdf", "name": "..."}]}
+
+Transcripts are read lazily and replayed by a fixed number of concurrent
+workers; OCR and PDF parsing of their files run in a process pool. The
+transcripts already hold the assistant's side, so turns only go through the
+extraction nodes (local extraction, then the LLM updates when it did not cover
+the message) and the message log, never the case manager. Every case runs on
+the interview's checkpointed thread and records the number of completed turns
+in the store, so an interrupted replay picks up after the last completed turn;
+replayed messages have IDs derived from their turn, so a turn replayed twice
+replaces its messages. A new case is written to the store once, with its
+extracted documents, before its first turn; the graph writes what each turn
+extracts, so nothing is buffered until the end of the run.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Union
+from langchain_core.messages import AIMessage, HumanMessage
+from assistant.state import CaseData, CaseFiles
+from assistant.utils import extract_text_from_path
+from assistant.search import case_search_index
+import argparse
+import asyncio
+import hashlib
+import logging
+import json
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+# Completed turns per replayed case, keyed by case ID
+PROGRESS_COLLECTION = "replay-progress"
+
+class StageTimer:
+    """Collects wall-clock durations per replay stage."""
+
+    def __init__(self):
+        self.durations: Dict[str, List[float]] = defaultdict(list)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations[name].append(time.perf_counter() - start)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        result = {}
+        for name, values in self.durations.items():
+            ordered = sorted(values)
+            result[name] = {
+                "count": len(values),
+                "total_s": round(sum(values), 3),
+                "mean_ms": round(1000 * sum(values) / len(values), 1),
+                "p50_ms": round(1000 * ordered[len(ordered) // 2], 1),
+                "p95_ms": round(1000 * ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)], 1),
+            }
+        return result
+
+def load_transcripts(path: str) -> Iterator[Dict[str, Any]]:
+    """Read transcripts from a JSONL file, deriving a stable case ID when one is missing."""
+    with open(path, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            transcript = json.loads(line)
+            if not transcript.get("case_id"):
+                digest = hashlib.sha1(f"{path}:{number}".encode()).hexdigest()
+                transcript["case_id"] = f"replay-{digest[:16]}"
+            yield transcript
+
+def user_turns(messages: List[Dict[str, Any]], case_id: str = "replay") -> List[List[Any]]:
+    """Group a transcript into turns: the assistant messages preceding each user message, then the user message.
+
+    Message IDs are derived from the case and the message's position in the transcript.
+    """
+    turns, pending = [], []
+    for number, message in enumerate(messages):
+        message_id = f"{case_id}:{number}"
+        if message.get("role") in ("assistant", "ai"):
+            pending.append(AIMessage(content=message["content"], id=message_id))
+        elif message.get("role") in ("user", "human"):
+            turns.append([*pending, HumanMessage(content=message["content"], id=message_id)])
+            pending = []
+    return turns
+
+def replay_router(state: Any) -> Union[str, List[str]]:
+    """Runs the LLM updates unless local extraction captured everything the turn said."""
+    return "log_messages" if state.fields_covered else ["update_user", "update_case"]
+
+def build_replay_graph() -> Any:
+    """The interview graph without the case manager: extraction, updates and the message log."""
+    from langgraph.graph import END, StateGraph
+    from assistant.state import State
+    from assistant.tools import extract_fields, log_messages, update_case, update_user
+    builder = StateGraph(State)
+    builder.add_node("extract_fields", extract_fields)
+    builder.add_node("update_user", update_user)
+    builder.add_node("update_case", update_case)
+    builder.add_node("log_messages", log_messages)
+    builder.add_edge("__start__", "extract_fields")
+    builder.add_conditional_edges("extract_fields", replay_router, ["update_user", "update_case", "log_messages"])
+    builder.add_edge(["update_user", "update_case"], "log_messages")
+    builder.add_edge("log_messages", END)
+    return builder
+
+class Replayer:
+    """Replays transcripts through the graph with bounded concurrency."""
+
+    def __init__(self, store: Any, concurrency: int = 8, workers: Optional[int] = None):
+        # The store backend is chosen when assistant.configuration is first imported, see main()
+        from assistant.checkpointer import StoreCheckpointer
+        self.store = store
+        self.graph = build_replay_graph().compile(checkpointer=StoreCheckpointer(store))
+        self.concurrency = concurrency
+        self.workers = workers
+        self.timer = StageTimer()
+        self.cases = 0
+        self.failed: Dict[str, str] = {}
+        self.turns = 0
+
+    async def extract_files(self, pool: ProcessPoolExecutor, files: List[Dict[str, Any]]) -> List[CaseFiles]:
+        """Extract the text of a transcript's files in the process pool."""
+        loop = asyncio.get_running_loop()
+        texts = await asyncio.gather(*(
+            loop.run_in_executor(pool, extract_text_from_path, f["path"], f["type"]) for f in files
+        ))
+        return [
+            CaseFiles(
+                file_id=hashlib.sha1(f["path"].encode()).hexdigest(),
+                file_type=f["type"],
+                file_name=f.get("name") or os.path.basename(f["path"]),
+                file_size=os.path.getsize(f["path"]),
+                file_label=f"Uploaded {f['type']} document",
+                uploaded_at=datetime.now(),
+                file_contents=text
+            )
+            for f, text in zip(files, texts)
+        ]
+
+    async def replay(self, transcript: Dict[str, Any], pool: ProcessPoolExecutor) -> None:
+        from assistant.checkpointer import config_for_case
+        case_id = transcript["case_id"]
+        config = config_for_case(case_id)
+        progress = await self.store.get((PROGRESS_COLLECTION, case_id))
+        turns = user_turns(transcript.get("messages", []), case_id)
+
+        done = progress.data["completed"] if progress else 0
+        if not done:
+            # A case interrupted before its first turn is set up again from scratch
+            case_data = CaseData.model_validate({})
+            if files := transcript.get("files"):
+                with self.timer.stage("extract"):
+                    case_data.documents.extend(await self.extract_files(pool, files))
+            # Turns only write the fields they extract, the documents are written here
+            with self.timer.stage("write"):
+                await self.write_case(case_id, case_data, len(turns))
+        else:
+            logger.info(f"Resuming {case_id} after {done} of {len(turns)} turns")
+
+        for index in range(done, len(turns)):
+            payload: Dict[str, Any] = {"messages": turns[index]}
+            if index == 0:
+                payload.update(case_id=case_id, case_data=case_data)
+            with self.timer.stage("graph"):
+                await self.graph.ainvoke(payload, config)
+            await self.record_progress(case_id, index + 1, len(turns))
+            self.turns += 1
+        self.cases += 1
+
+    async def record_progress(self, case_id: str, completed: int, turns: int) -> None:
+        """Record that the first `completed` turns of a case are replayed."""
+        from assistant.configuration import Memory
+        await self.store.set((PROGRESS_COLLECTION, case_id), Memory(
+            database="default", collection=PROGRESS_COLLECTION, document_id=case_id,
+            data={"completed": completed, "turns": turns}
+        ))
+
+    async def write_case(self, case_id: str, case_data: CaseData, turns: int) -> None:
+        """Write a new case and its replay progress in one batch, sections in their subcollections."""
+        from assistant.configuration import Memory
+        batch = self.store.new_batch()
+        data = case_data.model_dump(mode="json")
+        for name, value in list(data.items()):
+            if isinstance(value, dict):
+                collection = f"cases/{case_id}/{name}"
+                batch.set((collection, case_id), Memory(
+                    database="default", collection=collection, document_id=case_id, data=value
+                ))
+                data[name] = f"ref:{case_id}"
+        batch.set(("case-data", case_id), Memory(
+            database="default", collection="case-data", document_id=case_id, data=data
+        ))
+        batch.set((PROGRESS_COLLECTION, case_id), Memory(
+            database="default", collection=PROGRESS_COLLECTION, document_id=case_id,
+            data={"completed": 0, "turns": turns}
+        ))
+        await batch.commit()
+        await case_search_index.update(self.store, case_id, case_data)
+
+    async def run(self, transcripts: Iterator[Dict[str, Any]]) -> Dict[str, Any]:
+        start = time.perf_counter()
+
+        async def worker(pool: ProcessPoolExecutor) -> None:
+            # Workers share the lazy transcript iterator, only `concurrency` transcripts are in flight
+            for transcript in transcripts:
+                try:
+                    with self.timer.stage("case"):
+                        await self.replay(transcript, pool)
+                except Exception as e:
+                    logger.error(f"Replay of {transcript['case_id']} failed: {str(e)}")
+                    self.failed[transcript["case_id"]] = str(e)
+
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            await asyncio.gather(*(worker(pool) for _ in range(self.concurrency)))
+
+        elapsed = time.perf_counter() - start
+        return {
+            "cases": self.cases,
+            "failed": len(self.failed),
+            "turns": self.turns,
+            "elapsed_s": round(elapsed, 3),
+            "cases_per_s": round(self.cases / elapsed, 3) if elapsed else 0.0,
+            "turns_per_s": round(self.turns / elapsed, 3) if elapsed else 0.0,
+            "stages": self.timer.summary(),
+            "errors": self.failed,
+        }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay intake transcripts through the assistant graph.")
+    parser.add_argument("transcripts", help="JSONL file with one transcript per line")
+    parser.add_argument("--concurrency", type=int, default=8, help="transcripts replayed at once")
+    parser.add_argument("--workers", type=int, default=None, help="processes for file extraction")
+    parser.add_argument(
+        "--store", choices=["memory", "firestore"], default=os.getenv("ASSISTANT_STORE", "firestore"),
+        help="store backend; memory replays without Firebase and keeps nothing"
+    )
+    parser.add_argument("--report", help="also write the run report as JSON to this path")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    os.environ["ASSISTANT_STORE"] = args.store
+    from assistant import configuration
+    replayer = Replayer(configuration.store, args.concurrency, args.workers)
+    report = asyncio.run(replayer.run(load_transcripts(args.transcripts)))
+    print(json.dumps(report, indent=2))
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
+
+__all__ = ["Replayer", "StageTimer", "build_replay_graph", "load_transcripts", "user_turns"]
@@ -0,0 +1,134 @@
+"""Incremental case report generation with per-section caching."""
+
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from langchain_core.messages import SystemMessage
+from assistant.state import CaseData
+from assistant import prompts, telemetry
+import functools
+import hashlib
+import asyncio
+import logging
+import json
+
+logger = logging.getLogger(__name__)
+
+REPORT_CACHE = "report-sections"
+NO_INFORMATION = "_No information has been provided for this section yet._"
+
+# Section name -> (title, CaseData fields it is generated from)
+SECTIONS: Dict[str, Tuple[str, List[str]]] = {
+    "incident": ("Incident", ["incident_details", "witness_info"]),
+    "injuries": ("Injuries", ["injury_details"]),
+    "medical": ("Medical Treatment", ["medical_info"]),
+    "insurance": ("Insurance", ["insurance_info"]),
+    "employment": ("Employment", ["employment_info"]),
+    "damages": ("Damages", ["damages_info"]),
+    "legal": ("Legal", ["legal_info"]),
+    "documents": ("Documents", ["documents"]),
+}
+
+def section_data(case_data: CaseData, name: str) -> Dict[str, Any]:
+    """Return the case data a section is generated from."""
+    _, fields = SECTIONS[name]
+    # Document sections use the file analyses, not the raw extracted text
+    exclude = {"documents": {"__all__": {"file_contents", "uploaded_at"}}}
+    data = case_data.model_dump(mode="json", include=set(fields), exclude=exclude)
+    return {k: v for k, v in data.items() if v not in (None, [], {}, "")}
+
+def section_hash(data: Dict[str, Any]) -> str:
+    """Content hash a generated section is cached against."""
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+class ReportBuilder:
+    """Builds the case report section by section, regenerating only stale sections.
+
+    Generated sections are cached in memory and in the store (collection
+    `report-sections`, one document per case and section) against the hash of
+    the data they were generated from. Without an `llm` the configured chat
+    model is used.
+    """
+
+    def __init__(self, llm: Any = None, store: Any = None, concurrency: int = 4):
+        self.llm = llm
+        self.store = store
+        self.concurrency = concurrency
+        self._cache: Dict[Tuple[str, str], Tuple[str, str]] = {}
+
+    def _model(self) -> Any:
+        if self.llm is not None:
+            return self.llm
+        from assistant.configuration import get_llm
+        return get_llm()
+
+    async def _cached(self, case_id: str, name: str, digest: str) -> Optional[str]:
+        if (hit := self._cache.get((case_id, name))) and hit[0] == digest:
+            return hit[1]
+        if self.store is not None:
+            memory = await self.store.get((REPORT_CACHE, f"{case_id}:{name}"))
+            if memory and memory.data.get("hash") == digest:
+                self._cache[(case_id, name)] = (digest, memory.data["text"])
+                return memory.data["text"]
+        return None
+
+    async def _generate(self, case_id: str, name: str, data: Dict[str, Any], digest: str,
+                        semaphore: asyncio.Semaphore) -> str:
+        title, _ = SECTIONS[name]
+        if not data:
+            text = NO_INFORMATION
+        else:
+            async with semaphore:
+                with telemetry.span("llm.report_section", section=name):
+                    response = await self._model().ainvoke([SystemMessage(content=prompts.REPORT_SECTION_PROMPT.format(
+                        section_title=title,
+                        section_data=json.dumps(data, indent=2, default=str)
+                    ))])
+                    telemetry.record_usage(response)
+            text = response.content if hasattr(response, "content") else str(response)
+        self._cache[(case_id, name)] = (digest, text)
+        if self.store is not None:
+            from assistant.configuration import Memory
+            await self.store.set((REPORT_CACHE, f"{case_id}:{name}"), Memory(
+                database="default",
+                collection=REPORT_CACHE,
+                document_id=f"{case_id}:{name}",
+                data={"case_id": case_id, "section": name, "hash": digest, "text": text}
+            ))
+        return text
+
+    async def stream(self, case_id: str, case_data: CaseData) -> AsyncIterator[str]:
+        """Yield the report section by section, in order.
+
+        Cached sections are yielded immediately; stale ones are generated
+        concurrently and yielded as soon as their turn comes.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        pending: Dict[str, Any] = {}
+        for name in SECTIONS:
+            data = section_data(case_data, name)
+            digest = section_hash(data)
+            cached = await self._cached(case_id, name, digest)
+            pending[name] = cached if cached is not None else asyncio.create_task(
+                self._generate(case_id, name, data, digest, semaphore)
+            )
+        stale = [name for name, value in pending.items() if isinstance(value, asyncio.Task)]
+        if stale:
+            logger.info(f"Regenerating report sections for {case_id}: {', '.join(stale)}")
+        try:
+            for name, value in pending.items():
+                text = await value if isinstance(value, asyncio.Task) else value
+                yield f"## {SECTIONS[name][0]}\n\n{text}\n\n"
+        finally:
+            for value in pending.values():
+                if isinstance(value, asyncio.Task):
+                    value.cancel()
+
+    async def build(self, case_id: str, case_data: CaseData) -> str:
+        """Return the assembled report."""
+        return "".join([chunk async for chunk in self.stream(case_id, case_data)]).strip()
+
+@functools.lru_cache(maxsize=None)
+def shared_builder(store: Any) -> ReportBuilder:
+    """The process-wide report builder of a store, so its section cache is shared by every caller."""
+    return ReportBuilder(store=store)
+
+__all__ = ["ReportBuilder", "SECTIONS", "section_data", "section_hash", "shared_builder"]
@@ -0,0 +1,213 @@
+"""Per-case chunk index over extracted document text, used to ground prompts.
+
+Documents are split into overlapping word windows and indexed with BM25.
+When NumPy is installed a vector index over a local hashing embedding is
+kept as well and both rankings are fused.
+"""
+
+from collections import Counter, OrderedDict, defaultdict
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from assistant.state import CaseFiles
+import hashlib
+import logging
+import math
+import re
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.'-][a-z0-9]+)*")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have he her his i in is it its me my "
+    "of on or she that the their them they this to was were will with you your".split()
+)
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens without stopwords."""
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+def estimate_tokens(text: str) -> int:
+    """Rough LLM token count (about four characters per token)."""
+    return len(text) // 4 + 1
+
+@dataclass
+class Chunk:
+    """A window of a document's extracted text."""
+    chunk_id: str
+    file_id: str
+    file_name: str
+    position: int
+    text: str
+    tokens: int
+
+def chunk_text(text: str, chunk_words: int = 180, overlap: int = 30) -> List[str]:
+    """Split text into overlapping windows of words."""
+    words = text.split()
+    if not words:
+        return []
+    step = max(chunk_words - overlap, 1)
+    return [
+        " ".join(words[start:start + chunk_words])
+        for start in range(0, max(len(words) - overlap, 1), step)
+    ]
+
+class BM25Index:
+    """Okapi BM25 over chunk texts."""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self.lengths: List[int] = []
+
+    def add(self, text: str) -> None:
+        doc = len(self.lengths)
+        terms = Counter(tokenize(text))
+        for term, tf in terms.items():
+            self.postings[term][doc] = tf
+        self.lengths.append(sum(terms.values()))
+
+    def search(self, query: str, k: int) -> List[Tuple[int, float]]:
+        if not self.lengths:
+            return []
+        n = len(self.lengths)
+        avg_length = sum(self.lengths) / n or 1.0
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc, tf in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[doc] / avg_length)
+                scores[doc] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+def hashing_embedding(text: str, dim: int = 256) -> "np.ndarray":
+    """Local embedding: signed feature hashing of unigrams and bigrams, L2-normalized."""
+    vector = np.zeros(dim, dtype=np.float32)
+    tokens = tokenize(text)
+    for feature in [*tokens, *(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))]:
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        index = int.from_bytes(digest[:4], "little") % dim
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+class VectorIndex:
+    """Cosine-similarity index over a growing NumPy matrix."""
+
+    def __init__(self, embed: Callable[[str], "np.ndarray"] = hashing_embedding):
+        self.embed = embed
+        self.matrix: Optional["np.ndarray"] = None
+        self.size = 0
+
+    def add(self, text: str) -> None:
+        vector = self.embed(text)
+        if self.matrix is None:
+            self.matrix = np.zeros((16, vector.shape[0]), dtype=np.float32)
+        elif self.size == self.matrix.shape[0]:
+            self.matrix = np.concatenate([self.matrix, np.zeros_like(self.matrix)])
+        self.matrix[self.size] = vector
+        self.size += 1
+
+    def search(self, query: str, k: int) -> List[Tuple[int, float]]:
+        if not self.size:
+            return []
+        scores = self.matrix[:self.size] @ self.embed(query)
+        top = np.argsort(-scores)[:k]
+        return [(int(i), float(scores[i])) for i in top if scores[i] > 0]
+
+class CaseIndex:
+    """Retrieval index over the documents of one case."""
+
+    def __init__(self, use_vectors: bool = True, embed: Optional[Callable[[str], "np.ndarray"]] = None):
+        self.chunks: List[Chunk] = []
+        self.file_ids: set = set()
+        self.bm25 = BM25Index()
+        self.vectors = VectorIndex(embed or hashing_embedding) if use_vectors and np is not None else None
+
+    def add_document(self, case_file: CaseFiles) -> int:
+        """Index a document's extracted text once; returns the number of new chunks."""
+        if case_file.file_id in self.file_ids or not case_file.file_contents:
+            return 0
+        self.file_ids.add(case_file.file_id)
+        pieces = chunk_text(case_file.file_contents)
+        for position, text in enumerate(pieces):
+            chunk = Chunk(
+                chunk_id=f"{case_file.file_id}:{position}",
+                file_id=case_file.file_id,
+                file_name=case_file.file_name,
+                position=position,
+                text=text,
+                tokens=estimate_tokens(text),
+            )
+            self.chunks.append(chunk)
+            self.bm25.add(text)
+            if self.vectors is not None:
+                self.vectors.add(text)
+        return len(pieces)
+
+    def sync(self, documents: Iterable[CaseFiles]) -> None:
+        """Index any documents not indexed yet."""
+        for case_file in documents:
+            self.add_document(case_file)
+
+    def search(self, query: str, k: int = 8, file_id: Optional[str] = None) -> List[Chunk]:
+        """Return the top-k chunks, fusing BM25 and vector rankings by reciprocal rank."""
+        depth = k * 3 if file_id is None else len(self.chunks)
+        rankings = [self.bm25.search(query, depth)]
+        if self.vectors is not None:
+            rankings.append(self.vectors.search(query, depth))
+        fused: Dict[int, float] = defaultdict(float)
+        for ranking in rankings:
+            for rank, (doc, _) in enumerate(ranking):
+                if file_id is None or self.chunks[doc].file_id == file_id:
+                    fused[doc] += 1.0 / (60 + rank)
+        best = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [self.chunks[doc] for doc, _ in best]
+
+    def context(
+        self, query: str, token_budget: int = 1500, k: int = 8, file_id: Optional[str] = None
+    ) -> List[Chunk]:
+        """Return the most relevant chunks that fit in the token budget, in document order."""
+        selected, used = [], 0
+        for chunk in self.search(query, k, file_id):
+            if used + chunk.tokens > token_budget:
+                continue
+            selected.append(chunk)
+            used += chunk.tokens
+        return sorted(selected, key=lambda c: (c.file_id, c.position))
+
+def format_chunks(chunks: List[Chunk]) -> str:
+    """Render chunks as prompt excerpts with their source file."""
+    return "\n\n".join(
+        f"[{chunk.file_name or chunk.file_id}, excerpt {chunk.position + 1}]\n{chunk.text}"
+        for chunk in chunks
+    )
+
+MAX_CASE_INDEXES = 256
+_case_indexes: "OrderedDict[str, CaseIndex]" = OrderedDict()
+
+def get_case_index(case_id: str) -> CaseIndex:
+    """Return the (LRU-cached) retrieval index of a case."""
+    if case_id in _case_indexes:
+        _case_indexes.move_to_end(case_id)
+        return _case_indexes[case_id]
+    index = _case_indexes[case_id] = CaseIndex()
+    if len(_case_indexes) > MAX_CASE_INDEXES:
+        _case_indexes.popitem(last=False)
+    return index
+
+def document_context(case_id: str, documents: Iterable[CaseFiles], query: str, token_budget: int = 1500) -> str:
+    """Sync a case's index with its documents and return the excerpts relevant to a query."""
+    index = get_case_index(case_id)
+    index.sync(documents)
+    return format_chunks(index.context(query, token_budget))
+
+__all__ = ["CaseIndex", "Chunk", "chunk_text", "get_case_index", "document_context", "format_chunks"]
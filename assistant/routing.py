@@ -0,0 +1,67 @@
+"""Per-run case routing and per-case write locks."""
+
+from typing import Any, Optional
+from langchain_core.runnables import RunnableConfig
+import asyncio
+import threading
+import weakref
+
+# Waits between attempts to take a held case lock, doubling up to the maximum
+LOCK_POLL = 0.001
+LOCK_POLL_MAX = 0.05
+
+class CaseLock:
+    """A case's write lock, shared by every thread and event loop of the process.
+
+    `async with` waits without blocking the event loop or tying up an executor
+    thread, so a holder can still run store calls in threads; cancelling a
+    waiter leaves the lock untouched. Threads without a loop use plain `with`.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+
+    def locked(self) -> bool:
+        return self._lock.locked()
+
+    async def __aenter__(self) -> "CaseLock":
+        delay = LOCK_POLL
+        while not self._lock.acquire(blocking=False):
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, LOCK_POLL_MAX)
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        self._lock.release()
+
+    def __enter__(self) -> "CaseLock":
+        self._lock.acquire()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self._lock.release()
+
+# case_id -> lock; a lock disappears once nobody holds or waits on it
+_case_locks: "weakref.WeakValueDictionary[str, CaseLock]" = weakref.WeakValueDictionary()
+_registry_lock = threading.Lock()
+
+def get_case_id(state: Any, config: Optional[RunnableConfig] = None) -> str:
+    """Return the case a run belongs to: the run config's case_id, else the state's."""
+    configurable = (config or {}).get("configurable", {})
+    return configurable.get("case_id") or state.case_id
+
+def case_lock(case_id: str) -> CaseLock:
+    """Return the lock serializing writes to one case across the whole process.
+
+    Sessions run on their own event loops and the job queue on its own
+    threads, they all get the same lock for a case. Different cases get
+    different locks, so their interviews run fully in parallel.
+    """
+    with _registry_lock:
+        lock = _case_locks.get(case_id)
+        if lock is None:
+            lock = CaseLock()
+            _case_locks[case_id] = lock
+        return lock
+
+__all__ = ["get_case_id", "case_lock", "CaseLock"]
@@ -0,0 +1,317 @@
+"""Cross-case search index over CaseData fields and document text.
+
+The index is maintained incrementally: every case write re-indexes only that
+case and stores its search entry (term counts, the terms of each field,
+keywords, dates and amounts) in `case-search`. Text fields go into an inverted
+index, categorical fields (incident type, physicians, insurers) into
+exact-match sets and dates and amounts into sorted lists so range filters are
+binary searches. Only tokens are kept, never the texts. A process loads the
+stored entries on its first search with `load`, one page at a time; `rebuild`
+backfills the entries of cases stored before they had one.
+"""
+
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Any, Dict, List, Optional, Set, Tuple
+from assistant.configuration import Memory
+from assistant.retrieval import tokenize
+import threading
+import asyncio
+import logging
+import math
+
+logger = logging.getLogger(__name__)
+
+# Field label -> path in the CaseData dump; "*" walks a list
+TEXT_FIELDS = {
+    "client": [("user_data", "first_name"), ("user_data", "last_name")],
+    "incident": [
+        ("incident_details", "incident_description"),
+        ("incident_details", "incident_location"),
+        ("incident_details", "incident_type"),
+    ],
+    "injuries": [("injury_details", "list_injury_details"), ("injury_details", "symptom_details")],
+    "medical": [
+        ("medical_info", "initial_treatment"),
+        ("medical_info", "current_treatment"),
+        ("medical_info", "treatment_facilities"),
+        ("medical_info", "treating_physicians"),
+    ],
+    "insurance": [("insurance_info", "client_insurance", "company_name")],
+    "legal": [("legal_info", "prior_attorneys"), ("legal_info", "settlement_offers")],
+    "documents": [
+        ("documents", "*", "file_name"),
+        ("documents", "*", "file_label"),
+        ("documents", "*", "file_analysis"),
+        ("documents", "*", "file_contents"),
+    ],
+}
+KEYWORD_FIELDS = {
+    "incident_type": [("incident_details", "incident_type")],
+    "physician": [("medical_info", "treating_physicians")],
+    "insurer": [("insurance_info", "client_insurance", "company_name")],
+}
+DATE_FIELDS = {
+    "intake_date": ("intake_date",),
+    "incident_date": ("incident_details", "incident_date"),
+}
+AMOUNT_FIELDS = {
+    "medical_expenses": ("damages_info", "medical_expenses"),
+    "property_damage": ("damages_info", "property_damage"),
+    "lost_wages": ("damages_info", "lost_wages"),
+}
+SEARCH_COLLECTION = "case-search"
+
+def _values(data: Any, path: Tuple[str, ...]) -> List[Any]:
+    """Collect the values at a path, flattening lists."""
+    if not path:
+        if isinstance(data, list):
+            return [v for item in data for v in _values(item, ())]
+        return [] if data in (None, "") else [data]
+    if path[0] == "*":
+        return [v for item in data or [] for v in _values(item, path[1:])]
+    if not isinstance(data, dict):
+        return []
+    return _values(data.get(path[0]), path[1:])
+
+def _to_date(value: Any) -> Optional[date]:
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+async def read_sections(store: Any, case_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    """Replace the section references of a stored case document with the section documents."""
+    data = dict(data)
+    refs = [name for name, value in data.items() if isinstance(value, str) and value.startswith("ref:")]
+    sections = await asyncio.gather(*(store.get((f'cases/{case_id}/{name}', case_id)) for name in refs))
+    for name, section in zip(refs, sections):
+        data[name] = section.data if section else None
+    return data
+
+def _pack_entry(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """The stored form of a search entry, term lists as strings the store compresses."""
+    return {
+        "terms": " ".join(f"{term}:{tf}" for term, tf in entry["terms"].items()),
+        "fields": {label: " ".join(sorted(terms)) for label, terms in entry["fields"].items()},
+        "keywords": {name: sorted(values) for name, values in entry["keywords"].items()},
+        "ranges": entry["ranges"],
+    }
+
+def _unpack_entry(data: Dict[str, Any]) -> Dict[str, Any]:
+    terms = {}
+    for item in data["terms"].split():
+        term, _, tf = item.rpartition(":")
+        terms[term] = int(tf)
+    return {
+        "terms": terms,
+        "fields": {label: set(terms.split()) for label, terms in data["fields"].items()},
+        "keywords": {name: set(values) for name, values in data["keywords"].items()},
+        "ranges": data["ranges"],
+    }
+
+@dataclass
+class SearchHit:
+    """A matching case with its score and the matched query terms per field."""
+    case_id: str
+    score: float
+    highlights: Dict[str, List[str]] = field(default_factory=dict)
+
+class CaseSearchIndex:
+    """Incrementally maintained in-process index across all cases."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.loaded = False
+        self.postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self.case_terms: Dict[str, Set[str]] = {}
+        self.case_lengths: Dict[str, int] = {}
+        self.case_fields: Dict[str, Dict[str, Set[str]]] = {}
+        self.keywords: Dict[str, Dict[str, Set[str]]] = {name: defaultdict(set) for name in KEYWORD_FIELDS}
+        self.case_keywords: Dict[str, Dict[str, Set[str]]] = {}
+        self.sorted: Dict[str, List[Tuple[Any, str]]] = {name: [] for name in [*DATE_FIELDS, *AMOUNT_FIELDS, "total_damages"]}
+        self.case_sorted: Dict[str, Dict[str, Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self.case_terms)
+
+    @staticmethod
+    def entry(case_data: Any) -> Dict[str, Any]:
+        """The search entry of a case (a CaseData model or its dump)."""
+        data = case_data.model_dump(mode="json") if hasattr(case_data, "model_dump") else case_data
+        terms: Dict[str, int] = defaultdict(int)
+        fields: Dict[str, Set[str]] = {}
+        for label, paths in TEXT_FIELDS.items():
+            tokens = tokenize("\n".join(str(v) for path in paths for v in _values(data, path)))
+            for term in tokens:
+                terms[term] += 1
+            if tokens:
+                fields[label] = set(tokens)
+        keywords = {
+            name: {str(v).strip().lower() for path in paths for v in _values(data, path)}
+            for name, paths in KEYWORD_FIELDS.items()
+        }
+        ranges: Dict[str, Any] = {}
+        for name, path in DATE_FIELDS.items():
+            if (values := _values(data, path)) and (value := _to_date(values[0])):
+                ranges[name] = value.toordinal()
+        for name, path in AMOUNT_FIELDS.items():
+            if values := _values(data, path):
+                ranges[name] = float(values[0])
+        amounts = [ranges[name] for name in AMOUNT_FIELDS if name in ranges]
+        if amounts:
+            ranges["total_damages"] = sum(amounts)
+        return {"terms": dict(terms), "fields": fields, "keywords": keywords, "ranges": ranges}
+
+    def index_case(self, case_id: str, case_data: Any) -> Dict[str, Any]:
+        """(Re)index one case from a CaseData model or its dump, returning its entry."""
+        entry = self.entry(case_data)
+        self._add(case_id, entry)
+        return entry
+
+    def _add(self, case_id: str, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self.remove_case(case_id)
+            for term, tf in entry["terms"].items():
+                self.postings[term][case_id] = tf
+            self.case_terms[case_id] = set(entry["terms"])
+            self.case_lengths[case_id] = sum(entry["terms"].values())
+            self.case_fields[case_id] = entry["fields"]
+            for name, values in entry["keywords"].items():
+                for value in values:
+                    self.keywords[name][value].add(case_id)
+            self.case_keywords[case_id] = entry["keywords"]
+            for name, value in entry["ranges"].items():
+                insort(self.sorted[name], (value, case_id))
+            self.case_sorted[case_id] = entry["ranges"]
+
+    def remove_case(self, case_id: str) -> None:
+        """Drop every entry of a case."""
+        with self._lock:
+            for term in self.case_terms.pop(case_id, ()):
+                postings = self.postings[term]
+                postings.pop(case_id, None)
+                if not postings:
+                    del self.postings[term]
+            self.case_lengths.pop(case_id, None)
+            self.case_fields.pop(case_id, None)
+            for name, values in self.case_keywords.pop(case_id, {}).items():
+                for value in values:
+                    self.keywords[name][value].discard(case_id)
+            for name, value in self.case_sorted.pop(case_id, {}).items():
+                entries = self.sorted[name]
+                i = bisect_left(entries, (value, case_id))
+                if i < len(entries) and entries[i] == (value, case_id):
+                    del entries[i]
+
+    async def update(self, store: Any, case_id: str, case_data: Any) -> None:
+        """Re-index a written case and store its entry for other processes."""
+        entry = self.index_case(case_id, case_data)
+        await store.set((SEARCH_COLLECTION, case_id), Memory(
+            database="default", collection=SEARCH_COLLECTION, document_id=case_id, data=_pack_entry(entry)
+        ))
+
+    async def load(self, store: Any, page_size: int = 500) -> int:
+        """Load the stored search entries once, on first use; cases indexed since start are kept."""
+        if self.loaded:
+            return 0
+        count = 0
+        async for memory in store.stream(SEARCH_COLLECTION, page_size=page_size):
+            with self._lock:
+                if memory.document_id not in self.case_terms:
+                    self._add(memory.document_id, _unpack_entry(memory.data))
+                    count += 1
+        self.loaded = True
+        logger.info(f"Loaded {count} case search entries")
+        return count
+
+    async def rebuild(self, store: Any, page_size: int = 100) -> int:
+        """Index and store the entry of every stored case, reading each case with its sections.
+
+        A one-off backfill for cases written before they had a search entry,
+        `load` is what a process runs.
+        """
+        count = 0
+        async for memory in store.stream("case-data", page_size=page_size):
+            await self.update(store, memory.document_id, await read_sections(store, memory.document_id, memory.data))
+            count += 1
+        self.loaded = True
+        logger.info(f"Indexed {count} stored cases for search")
+        return count
+
+    def _range(self, name: str, low: Any, high: Any) -> Set[str]:
+        entries = self.sorted[name]
+        start = bisect_left(entries, (low,)) if low is not None else 0
+        end = bisect_right(entries, (high, "\uffff")) if high is not None else len(entries)
+        return {case_id for _, case_id in entries[start:end]}
+
+    def _highlights(self, case_id: str, terms: List[str]) -> Dict[str, List[str]]:
+        highlights = {}
+        for label, field_terms in self.case_fields.get(case_id, {}).items():
+            if matched := [term for term in terms if term in field_terms]:
+                highlights[label] = matched
+        return highlights
+
+    def search(
+        self,
+        text: Optional[str] = None,
+        incident_type: Optional[str] = None,
+        physician: Optional[str] = None,
+        insurer: Optional[str] = None,
+        incident_date: Tuple[Optional[date], Optional[date]] = (None, None),
+        intake_date: Tuple[Optional[date], Optional[date]] = (None, None),
+        amounts: Optional[Dict[str, Tuple[Optional[float], Optional[float]]]] = None,
+        limit: int = 50,
+    ) -> List[SearchHit]:
+        """Return the matching case IDs, ranked by text relevance, with highlights.
+
+        All given filters must match. `amounts` maps an amount field
+        (medical_expenses, property_damage, lost_wages, total_damages) to an
+        inclusive (min, max) range; None leaves a bound open.
+        """
+        with self._lock:
+            candidates: Optional[Set[str]] = None
+
+            def narrow(cases: Set[str]) -> None:
+                nonlocal candidates
+                candidates = set(cases) if candidates is None else candidates & cases
+
+            for name, value in (("incident_type", incident_type), ("physician", physician), ("insurer", insurer)):
+                if value:
+                    narrow(self.keywords[name].get(value.strip().lower(), set()))
+            for name, (low, high) in (("incident_date", incident_date), ("intake_date", intake_date)):
+                if low is not None or high is not None:
+                    narrow(self._range(
+                        name,
+                        low.toordinal() if low else None,
+                        high.toordinal() if high else None
+                    ))
+            for name, (low, high) in (amounts or {}).items():
+                narrow(self._range(name, low, high))
+
+            terms = list(dict.fromkeys(tokenize(text or "")))
+            scores: Dict[str, float] = defaultdict(float)
+            if terms:
+                n = len(self.case_terms) or 1
+                for term in terms:
+                    postings = self.postings.get(term, {})
+                    idf = math.log(1 + n / (1 + len(postings)))
+                    for case_id, tf in postings.items():
+                        if candidates is None or case_id in candidates:
+                            scores[case_id] += idf * tf / (tf + 1.2 * self.case_lengths[case_id] ** 0.25)
+                # every query term has to match somewhere in the case
+                matched = set.intersection(*(set(self.postings.get(t, {})) for t in terms))
+                ranked = sorted(matched & set(scores), key=lambda c: scores[c], reverse=True)
+            else:
+                ranked = sorted(candidates if candidates is not None else self.case_terms)
+
+            return [
+                SearchHit(case_id, scores.get(case_id, 0.0), self._highlights(case_id, terms) if terms else {})
+                for case_id in ranked[:limit]
+            ]
+
+case_search_index = CaseSearchIndex()
+
+__all__ = ["CaseSearchIndex", "SearchHit", "case_search_index", "read_sections"]
@@ -0,0 +1,69 @@
+"""Fast paths for validating and serializing the state models.
+
+Validation goes through cached TypeAdapters, so models and plain types such as
+`List[CaseFiles]` share one entry point; for a model it costs the same as
+`model_validate`. JSON we wrote ourselves (job results, store documents) is
+validated straight from bytes instead of going through `json.loads` first.
+Trusted store data is validated too: building a full case with
+`model_construct` at every nesting level (benchmarks/bench_models.py,
+"model_construct(nested)") is about ten times slower than pydantic-core's
+compiled validator, and a shallow `model_construct` leaves the sections as
+plain dicts. `dump_changed` dumps only the sections of a model that differ
+from a previous version.
+"""
+
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Type, TypeVar, Union
+from pydantic import BaseModel, TypeAdapter
+
+M = TypeVar("M", bound=BaseModel)
+
+@lru_cache(maxsize=None)
+def adapter(tp: Any) -> TypeAdapter:
+    """Return the (cached) TypeAdapter of a type."""
+    return TypeAdapter(tp)
+
+def validate(tp: Type[M], data: Any) -> M:
+    """Validate Python data against a type."""
+    return adapter(tp).validate_python(data)
+
+def validate_json(tp: Type[M], data: Union[str, bytes]) -> M:
+    """Validate a JSON document against a type in a single pass."""
+    return adapter(tp).validate_json(data)
+
+def dump(value: Any, tp: Optional[Any] = None, **kwargs: Any) -> Any:
+    """Dump a value to JSON-compatible Python data."""
+    return adapter(tp or type(value)).dump_python(value, mode="json", **kwargs)
+
+def dump_json(value: Any, tp: Optional[Any] = None, **kwargs: Any) -> bytes:
+    """Dump a value to JSON bytes."""
+    return adapter(tp or type(value)).dump_json(value, **kwargs)
+
+def changed_fields(previous: Optional[BaseModel], current: BaseModel) -> List[str]:
+    """Names of the top-level fields of `current` that differ from `previous`."""
+    if previous is None or type(previous) is not type(current):
+        return list(type(current).model_fields)
+    return [
+        name for name in type(current).model_fields
+        if getattr(previous, name) != getattr(current, name)
+    ]
+
+def dump_fields(model: BaseModel, names: Iterable[str]) -> Dict[str, Any]:
+    """Dump only the given top-level fields of a model."""
+    fields = type(model).model_fields
+    return {name: dump(getattr(model, name), fields[name].annotation) for name in names}
+
+def dump_changed(previous: Optional[BaseModel], current: BaseModel) -> Dict[str, Any]:
+    """Dump only the top-level sections of `current` that changed since `previous`."""
+    return dump_fields(current, changed_fields(previous, current))
+
+__all__ = [
+    "adapter",
+    "validate",
+    "validate_json",
+    "dump",
+    "dump_json",
+    "changed_fields",
+    "dump_fields",
+    "dump_changed",
+]
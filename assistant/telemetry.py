@@ -0,0 +1,360 @@
+"""Lightweight timing spans and counters for graph nodes, store calls and extraction.
+
+Tracing is off until an exporter is configured, either in code with
+`configure(...)` or through the ASSISTANT_TRACE environment variable, a comma
+separated list of `memory`, `jsonl:<path>` and `otlp:<path>`. `collect(exporter)`
+turns it on for one context only, e.g. a single user session. While it is off,
+`span()` returns a shared no-op object and `traced` calls straight through.
+
+    with span("firestore.get", collection="users") as s:
+        ...
+        s.add("bytes_read", size)
+"""
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from langchain_core.callbacks import BaseCallbackHandler
+import functools
+import inspect
+import threading
+import logging
+import json
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class Span:
+    """A finished or running timed operation."""
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str] = None
+    start_ns: int = 0
+    end_ns: int = 0
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    counters: Dict[str, float] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def add(self, counter: str, value: float = 1) -> None:
+        self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "counters": self.counters,
+            "error": self.error,
+        }
+
+class _NoopSpan:
+    """Stands in for a span while tracing is disabled."""
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        return None
+
+    def set(self, **attributes: Any) -> None:
+        pass
+
+    def add(self, counter: str, value: float = 1) -> None:
+        pass
+
+NOOP = _NoopSpan()
+
+class Exporter:
+    """Receives every finished span."""
+
+    def export(self, span: Span) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+class InMemoryExporter(Exporter):
+    """Keeps the most recent spans, grouped by trace, for the debug panel."""
+
+    def __init__(self, max_traces: int = 200):
+        self.max_traces = max_traces
+        self.traces: "OrderedDict[str, List[Span]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        with self._lock:
+            self.traces.setdefault(span.trace_id, []).append(span)
+            self.traces.move_to_end(span.trace_id)
+            while len(self.traces) > self.max_traces:
+                self.traces.popitem(last=False)
+
+    def trace(self, trace_id: str) -> List[Span]:
+        """Spans of a trace in start order."""
+        with self._lock:
+            return sorted(self.traces.get(trace_id, []), key=lambda s: s.start_ns)
+
+    def spans(self) -> List[Span]:
+        with self._lock:
+            return [span for spans in self.traces.values() for span in spans]
+
+    def clear(self) -> None:
+        with self._lock:
+            self.traces.clear()
+
+class JSONLinesExporter(Exporter):
+    """Appends one JSON object per span to a file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+class OTLPJSONExporter(JSONLinesExporter):
+    """Writes spans in the OpenTelemetry OTLP/JSON encoding, one export request per line.
+
+    The file can be ingested by an OpenTelemetry collector (otlpjsonfile
+    receiver) without adding the OpenTelemetry SDK to the app.
+    """
+
+    def __init__(self, path: str, service_name: str = "case-intake-assistant"):
+        super().__init__(path)
+        self.service_name = service_name
+
+    def export(self, span: Span) -> None:
+        attributes = {**span.attributes, **span.counters}
+        record = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 1,
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in attributes.items()],
+            "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+        }
+        if span.parent_id:
+            record["parentSpanId"] = span.parent_id
+        request = {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+            "scopeSpans": [{"scope": {"name": __name__}, "spans": [record]}],
+        }]}
+        line = json.dumps(request)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+_exporters: List[Exporter] = []
+_current: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+# Exporter of the current context only, set by collect()
+_collector: ContextVar[Optional[Exporter]] = ContextVar("span_collector", default=None)
+enabled = False
+
+def configure(*exporters: Exporter) -> None:
+    """Add exporters and turn tracing on."""
+    global enabled
+    _exporters.extend(exporters)
+    enabled = bool(_exporters)
+
+def shutdown() -> None:
+    """Close the exporters and turn tracing off."""
+    global enabled
+    for exporter in _exporters:
+        exporter.close()
+    _exporters.clear()
+    enabled = False
+
+def active() -> bool:
+    """Whether spans are recorded in the current context."""
+    return enabled or _collector.get() is not None
+
+@contextmanager
+def collect(exporter: Optional[Exporter]) -> Iterator[None]:
+    """Record the spans of the block into `exporter`, in this context only.
+
+    Runs and tasks started elsewhere are unaffected; with None the block is
+    traced only if tracing is configured globally.
+    """
+    token = _collector.set(exporter)
+    try:
+        yield
+    finally:
+        _collector.reset(token)
+
+def memory_exporter() -> InMemoryExporter:
+    """Return the configured in-memory exporter, adding one if needed."""
+    for exporter in _exporters:
+        if isinstance(exporter, InMemoryExporter):
+            return exporter
+    exporter = InMemoryExporter()
+    configure(exporter)
+    return exporter
+
+class _ActiveSpan:
+    """Context manager that times a span and exports it on exit."""
+
+    __slots__ = ("span", "_token")
+
+    def __init__(self, name: str, attributes: Dict[str, Any]):
+        parent = _current.get()
+        self.span = Span(
+            name=name,
+            trace_id=parent.trace_id if parent else os.urandom(16).hex(),
+            span_id=os.urandom(8).hex(),
+            parent_id=parent.span_id if parent else None,
+            attributes=attributes,
+        )
+
+    def __enter__(self) -> Span:
+        self._token = _current.set(self.span)
+        self.span.start_ns = time.time_ns()
+        return self.span
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> None:
+        self.span.end_ns = time.time_ns()
+        _current.reset(self._token)
+        if exc is not None:
+            self.span.error = f"{exc_type.__name__}: {exc}"
+        collector = _collector.get()
+        for exporter in [*_exporters, collector] if collector is not None else _exporters:
+            try:
+                exporter.export(self.span)
+            except Exception as e:
+                logger.error(f"Span export failed: {str(e)}")
+
+def span(name: str, **attributes: Any) -> Any:
+    """Time a block as a child of the current span."""
+    if not active():
+        return NOOP
+    return _ActiveSpan(name, attributes)
+
+def current_span() -> Any:
+    """The innermost running span, or the no-op span."""
+    return (_current.get() or NOOP) if active() else NOOP
+
+def count(counter: str, value: float = 1) -> None:
+    """Add to a counter of the current span."""
+    if active() and (running := _current.get()) is not None:
+        running.add(counter, value)
+
+def record_usage(message: Any) -> None:
+    """Count the LLM tokens reported on a chat model response."""
+    if not active():
+        return
+    usage = getattr(message, "usage_metadata", None) or {}
+    count("tokens_in", usage.get("input_tokens", 0))
+    count("tokens_out", usage.get("output_tokens", 0))
+
+class _UsageCallback(BaseCallbackHandler):
+    """Counts token usage of model calls made inside runnables (e.g. trustcall extractors)."""
+
+    def on_llm_end(self, response: Any, **kwargs: Any) -> None:
+        for generations in response.generations:
+            for generation in generations:
+                record_usage(getattr(generation, "message", None))
+
+_usage_callback = _UsageCallback()
+
+def callbacks() -> List[Any]:
+    """Callbacks to pass in a runnable config so nested model calls are counted."""
+    return [_usage_callback] if active() else []
+
+def traced(name: str) -> Callable[[Callable], Callable]:
+    """Decorate a sync or async function so each call runs in a span."""
+    def decorator(fn: Callable) -> Callable:
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                if not active():
+                    return await fn(*args, **kwargs)
+                with _ActiveSpan(name, {}):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not active():
+                return fn(*args, **kwargs)
+            with _ActiveSpan(name, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def summarize(spans: List[Span]) -> Dict[str, Dict[str, float]]:
+    """Total time, calls and counters per span name."""
+    summary: Dict[str, Dict[str, float]] = {}
+    for s in spans:
+        entry = summary.setdefault(s.name, {"calls": 0, "total_ms": 0.0})
+        entry["calls"] += 1
+        entry["total_ms"] += s.duration_ms
+        for counter, value in s.counters.items():
+            entry[counter] = entry.get(counter, 0) + value
+    return summary
+
+def _configure_from_env() -> None:
+    for entry in filter(None, (e.strip() for e in os.getenv("ASSISTANT_TRACE", "").split(","))):
+        kind, _, path = entry.partition(":")
+        if kind == "memory":
+            memory_exporter()
+        elif kind == "jsonl":
+            configure(JSONLinesExporter(path or "spans.jsonl"))
+        elif kind == "otlp":
+            configure(OTLPJSONExporter(path or "spans.otlp.jsonl"))
+        else:
+            logger.warning(f"Unknown trace exporter: {entry}")
+
+_configure_from_env()
+
+__all__ = [
+    "Span",
+    "Exporter",
+    "InMemoryExporter",
+    "JSONLinesExporter",
+    "OTLPJSONExporter",
+    "configure",
+    "shutdown",
+    "active",
+    "collect",
+    "memory_exporter",
+    "span",
+    "current_span",
+    "count",
+    "record_usage",
+    "callbacks",
+    "traced",
+    "summarize",
+]
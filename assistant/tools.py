@@ -1,222 +1,493 @@
 import uuid
 from langchain_core.tools import tool
 from langchain_core.messages import ToolMessage
-from langchain_core.prompts import SystemMessage
-from langchain_core.pydantic_v1 import BaseModel
+from langchain_core.messages import AnyMessage, SystemMessage, AIMessage, HumanMessage, RemoveMessage
+from langchain_core.runnables import RunnableConfig
 from trustcall import create_extractor
-from assistant.graph import CASE_ID, LLM
-from assistant.state import State, CaseData, UserData, get_schema_json, CaseFiles
-from assistant.prompts import prompts
-from assistant.configuration import Configuration, FireStore, Memory, store
+from assistant.state import State, CaseData, UserData, get_schema_json, CaseFiles, PROMPT_EXCLUDE
+from assistant import extraction, prompts, telemetry
+from assistant import configuration
+from assistant.configuration import Configuration, DocumentMissing, FireStore, Memory
+from assistant.routing import get_case_id, case_lock
+from assistant.checkpointer import config_for_case
+from assistant.jobs import JobQueue, make_processor, read_content
+from assistant.diff import apply_changes, diff, split_sections
+from assistant.serialization import changed_fields, dump_fields, validate
+from assistant.retrieval import CaseIndex, document_context, get_case_index, format_chunks
+from assistant.search import case_search_index, read_sections
+from assistant.message_log import SUMMARY_TRIGGER, MessageLog, summary_cut
+from assistant.utils import KnownImage, analyze_case_images, prompt_messages
 from typing import List, Dict, Any, Optional
-from PIL import Image
-import pytesseract
-import fitz  # PyMuPDF
-import io
 import json
 from datetime import datetime
 
-async def update_case(state: State, store: FireStore = store) -> dict:
+async def analyze_upload(text: str) -> str:
+    """Analyze the text of an uploaded file, sending only its excerpts most relevant to a case."""
+    index = CaseIndex(use_vectors=False)
+    index.add_document(CaseFiles(file_id="upload", file_contents=text))
+    excerpts = format_chunks(index.context(prompts.DOCUMENT_ANALYSIS_QUERY, token_budget=3000, k=16))
+    with telemetry.span("llm.analyze_upload"):
+        analysis = await configuration.get_llm().ainvoke([
+            SystemMessage(content=prompts.DOCUMENT_ANALYSIS_PROMPT.format(document_excerpts=excerpts))
+        ])
+        telemetry.record_usage(analysis)
+    return analysis.content
+
+async def analyze_upload_images(
+    case_id: str, case_files: List[CaseFiles], sources: Dict[str, Any], known: List[KnownImage]
+) -> Dict[str, int]:
+    """Analyze a case's uploaded images in shared vision requests and store their analyses."""
+    hashes = await analyze_case_images(case_files, sources, configuration.get_llm(), known)
+    # The processor stored the files before the image stage analyzed them, only their metadata changes
+    for case_file in case_files:
+        metadata = case_file.model_dump(mode="json")
+        try:
+            await configuration.store.update(("files", case_file.file_id), {("metadata",): metadata})
+        except DocumentMissing:
+            await configuration.store.set(("files", case_file.file_id), Memory(
+                database="default", collection="files", document_id=case_file.file_id,
+                data={"case_id": case_id, "metadata": metadata}
+            ))
+    return hashes
+
+_job_queue: Optional[JobQueue] = None
+
+def get_job_queue() -> JobQueue:
+    """Return the process-wide upload queue, opened on first use."""
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = JobQueue(
+            processor=make_processor(analyzer=analyze_upload, store=configuration.store),
+            image_analyzer=analyze_upload_images
+        )
+    return _job_queue
+
+async def _create_case(store: FireStore, case_id: str, data: Dict[str, Any]) -> None:
+    """Write a whole case in one batch, sections in their subcollections."""
+    data = dict(data)
+    batch = store.new_batch()
+    for name, value in list(data.items()):
+        if isinstance(value, dict):
+            collection = f'cases/{case_id}/{name}'
+            batch.set((collection, case_id), Memory(
+                database="default", collection=collection, document_id=case_id, data=value
+            ))
+            data[name] = f"ref:{case_id}"
+    batch.set(('case-data', case_id), Memory(
+        database="default", collection='case-data', document_id=case_id, data=data
+    ))
+    await batch.commit()
+
+async def _write_case(
+    store: FireStore, case_id: str, previous: Optional[Dict[str, Any]], case_data: CaseData, changed: List[str]
+) -> Optional[Dict[str, Any]]:
+    """Create a case that is not stored yet, or write the changed sections of a stored one.
+
+    Returns the new dump of the case, None when nothing changed.
+    """
+    if previous is None:
+        data = case_data.model_dump(mode="json")
+        await _create_case(store, case_id, data)
+        return data
+    if not changed:
+        return None
+    data = {**previous, **dump_fields(case_data, changed)}
+    changes = diff({name: previous.get(name) for name in changed}, {name: data[name] for name in changed})
+    if not changes:
+        return None
+    sections = [name for name, value in data.items() if isinstance(value, dict)]
+    main_changes, section_changes = split_sections(changes, sections)
+
+    # Handle nested models: only the subcollection documents of changed sections are written
+    for field_name, field_changes in section_changes.items():
+        collection = f'cases/{case_id}/{field_name}'
+        try:
+            await store.update((collection, case_id), field_changes)
+        except DocumentMissing:
+            # The section document was never written or got lost, write the section whole
+            await store.set((collection, case_id), Memory(
+                database="default", collection=collection, document_id=case_id, data=data[field_name]
+            ))
+    for path, value in list(main_changes.items()):
+        if len(path) != 1:
+            continue
+        collection = f'cases/{case_id}/{path[0]}'
+        if isinstance(value, dict):
+            # New section, store in subcollection
+            subcoll_memory = Memory(
+                database="default",
+                collection=collection,
+                document_id=case_id,
+                data=value
+            )
+            await store.set((subcoll_memory.collection, subcoll_memory.document_id), subcoll_memory)
+            main_changes[path] = f"ref:{case_id}"
+        elif isinstance(previous.get(path[0]), dict):
+            # Cleared section, its subcollection document must not outlive the reference
+            await store.delete((collection, case_id))
+
+    # Update main document
+    if main_changes:
+        await store.update(('case-data', case_id), main_changes)
+    return data
+
+async def _write_user(store: FireStore, case_id: str, existing: Optional[Dict[str, Any]], user_data: Dict[str, Any]) -> None:
+    """Create the user document, or write only its changed fields."""
+    if existing is None:
+        user_data_memory = Memory(
+            database="default",
+            collection='users',
+            document_id=case_id,
+            data=user_data
+        )
+        await store.set((user_data_memory.collection, user_data_memory.document_id), user_data_memory)
+    elif changes := diff(existing, user_data):
+        await store.update(('users', case_id), changes)
+
+def _tool_results(state: State, name: str, content: str) -> List[ToolMessage]:
+    """Answer every call of tool `name` in the case manager's last message."""
+    calls = getattr(state.messages[-1], "tool_calls", None) or []
+    return [
+        ToolMessage(content=content, name=name, tool_call_id=call["id"])
+        for call in calls if call["name"] == name
+    ]
+
+def _extraction_messages(state: State) -> List[AnyMessage]:
+    """The conversation an extraction reads, without the case manager's message requesting it.
+
+    Replays run the update nodes right after a user turn, there is no such message then.
+    """
+    requested = getattr(state.messages[-1], "tool_calls", None)
+    return prompt_messages(state.messages[:-1] if requested else state.messages)
+
+async def _read_case(store: FireStore, case_id: str) -> Optional[Dict[str, Any]]:
+    """The stored case document with its sections read from their subcollections."""
+    case_doc = await store.get(('case-data', case_id))
+    return await read_sections(store, case_id, case_doc.data) if case_doc else None
+
+async def _merge_case(store: FireStore, case_id: str, base: CaseData, case_data: CaseData) -> Optional[CaseData]:
+    """Apply the edits that turned `base` into `case_data` to the stored case and write them.
+
+    Callers hold the case lock. The stored case is read again, so fields written
+    since `base` was read are kept; a case that is not stored yet is created
+    whole from `base` and the edits. Returns the merged case, None when there
+    were no edits.
+    """
+    changed = changed_fields(base, case_data)
+    edits = diff(dump_fields(base, changed), dump_fields(case_data, changed)) if changed else {}
+    if not edits:
+        return None
+    stored = await _read_case(store, case_id)
+    merged = validate(CaseData, apply_changes(stored if stored is not None else base.model_dump(mode="json"), edits))
+    await _write_case(store, case_id, stored, merged, changed)
+    await case_search_index.update(store, case_id, merged)
+    return merged
+
+def _with_file_contents(case_data: CaseData, source: CaseData) -> CaseData:
+    """Put the file texts left out of an extraction back onto its result, matched by file ID."""
+    update = {}
+    for name in ("documents", "case_files"):
+        contents = {f.file_id: f.file_contents for f in getattr(source, name) if f.file_contents}
+        files = getattr(case_data, name)
+        if any(f.file_id in contents and not f.file_contents for f in files):
+            update[name] = [
+                f.model_copy(update={"file_contents": contents[f.file_id]})
+                if f.file_id in contents and not f.file_contents else f
+                for f in files
+            ]
+    return case_data.model_copy(update=update) if update else case_data
+
+async def _merge_user(store: FireStore, case_id: str, base: Dict[str, Any], user_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Apply the edits that turned `base` into `user_data` to the stored user document.
+
+    Callers hold the case lock. Returns the merged user data, None when there
+    were no edits.
+    """
+    edits = diff(base, user_data)
+    if not edits:
+        return None
+    user_doc = await store.get(('users', case_id))
+    stored = user_doc.data if user_doc else None
+    merged = apply_changes(stored or {}, edits)
+    await _write_user(store, case_id, stored, merged)
+    return merged
+
+@telemetry.traced("node.update_case")
+async def update_case(state: State, config: RunnableConfig, store: Optional[FireStore] = None) -> dict:
     """Updates case data in Firestore."""
-    # Get existing case data
-    case_docs = await store.get(('cases', CASE_ID))
-    existing_case_data = case_docs.data if case_docs else {}
+    store = store or configuration.store
+    case_id = get_case_id(state, config)
+    # Document texts stay out of the extraction, trustcall would paste them into its prompt
+    previous_case_data = state.case_data.model_dump(mode="json", exclude=PROMPT_EXCLUDE)
     
     case_trustcall = create_extractor(
-        llm=LLM,
+        llm=configuration.get_llm(),
         tools=[CaseData],
         tool_choice="CaseData",
-        enable_insert=True
+        enable_inserts=True
     )
     case_trustcall_prompt = prompts.TRUSTCALL_INSTRUCTION.format(
         data_schema=get_schema_json(CaseData),
-        existing_data=State.case_data.model_dump_json(indent=2),
+        existing_data=state.case_data.model_dump_json(indent=2, exclude=PROMPT_EXCLUDE),
     )
     updated_messages = [
         SystemMessage(content=case_trustcall_prompt),
-        *state.messages[:-1]
+        *_extraction_messages(state)
     ]
-    updated_case_data = await case_trustcall.ainvoke({
-        "messages": updated_messages, 
-        "existing": existing_case_data
-    })  
-    
-    await store.batch()
-    for r, rmeta in zip(updated_case_data["responses"], updated_case_data["response_metadata"]):
-        data = r.model_dump(mode="json")
-        doc_id = rmeta.get("doc_id", str(uuid.uuid4()))
+    query = " ".join(str(msg.content) for msg in state.messages[-3:])
+    if excerpts := document_context(case_id, state.case_data.documents, query):
+        updated_messages.insert(1, SystemMessage(
+            content=prompts.DOCUMENT_CONTEXT.format(document_excerpts=excerpts)
+        ))
+    with telemetry.span("trustcall.case_data"):
+        updated_case_data = await case_trustcall.ainvoke({
+            "messages": updated_messages, 
+            "existing": {"CaseData": previous_case_data}
+        }, config={"callbacks": telemetry.callbacks()})  
     
-        # Handle nested models
-        for field_name, field_value in data.items():
-            if isinstance(field_value, dict) and hasattr(CaseData, field_name):
-                field_type = getattr(CaseData, field_name).type_
-                if issubclass(field_type, BaseModel):
-                    # Store in subcollection
-                    subcoll_memory = Memory(
-                        collection=f'cases/{CASE_ID}/{field_name}',
-                        document_id=doc_id,
-                        data=field_value
-                    )
-                    await store.set((subcoll_memory.collection, subcoll_memory.document_id), subcoll_memory)
-                    data[field_name] = f"ref:{doc_id}"
-        
-        # Store main document
-        case_data_memory = Memory(
-            collection='case-data',
-            document_id=CASE_ID,
-            data=data
-        )
-        await store.set((case_data_memory.collection, case_data_memory.document_id), case_data_memory)
+    case_data = state.case_data
+    # Writes to one case are serialized, other cases proceed in parallel. The extraction's
+    # edits are merged into the case as stored when the lock is taken, not as it was read.
+    async with case_lock(case_id):
+        for r in updated_case_data["responses"]:
+            r = _with_file_contents(r, state.case_data)
+            if merged := await _merge_case(store, case_id, state.case_data, r):
+                case_data = merged
     
-    await store.commit()
-    return {"messages": [
-        ToolMessage(
-            content="Case data updated", 
-            tool_call_id=str(uuid.uuid4())
-        )
-    ]}
+    return {
+        "case_data": case_data,
+        "messages": _tool_results(state, "CaseData", "Case data updated")
+    }
 
-@tool('update_user')
-async def update_user(state: State, store: FireStore = store) -> dict:
+@telemetry.traced("node.update_user")
+async def update_user(state: State, config: RunnableConfig, store: Optional[FireStore] = None) -> dict:
     """Updates user data in Firestore."""
+    store = store or configuration.store
+    case_id = get_case_id(state, config)
     # Get existing user data
-    user_docs = await store.get(('users', CASE_ID))
+    user_docs = await store.get(('users', case_id))
     existing_user_data = user_docs.data if user_docs else {}
     
     user_trustcall = create_extractor(
-        llm=LLM,
+        llm=configuration.get_llm(),
         tools=[UserData],
         tool_choice="UserData",
-        enable_insert=True
+        enable_inserts=True
     )
     user_trustcall_prompt = prompts.TRUSTCALL_INSTRUCTION.format(
-        data_schema=get_schema_json(State.user),
+        data_schema=get_schema_json(UserData),
+        existing_data=existing_user_data,
     )
     updated_messages = [
         SystemMessage(content=user_trustcall_prompt),
-        *state.messages[:-1]
+        *_extraction_messages(state)
     ]
-    extracted_user_data = await user_trustcall.ainvoke({
-        "messages": updated_messages, 
-        "existing": existing_user_data
-    })  
+    with telemetry.span("trustcall.user_data"):
+        extracted_user_data = await user_trustcall.ainvoke({
+            "messages": updated_messages, 
+            "existing": {"UserData": existing_user_data} if existing_user_data else None
+        }, config={"callbacks": telemetry.callbacks()})  
     
-    # Create and store user memory
-    user_data_memory = Memory(
-        collection='users',
-        document_id=CASE_ID,
-        data=extracted_user_data["responses"][0].model_dump(mode='json')
-    )
-    await store.set((user_data_memory.collection, user_data_memory.document_id), user_data_memory)
+    # Only the fields the extraction changed are merged into the stored user document
+    extracted_user = extracted_user_data["responses"][0]
+    async with case_lock(case_id):
+        merged = await _merge_user(store, case_id, existing_user_data, extracted_user.model_dump(mode='json'))
+    if merged is not None:
+        extracted_user = validate(UserData, merged)
     
-    return {"messages": [
-        ToolMessage(
-            content="User data updated", 
-            tool_call_id=str(uuid.uuid4())
+    return {"user_data": extracted_user, "messages": _tool_results(state, "UserData", "User data updated")}
+
+def _new_messages(state: State) -> List[HumanMessage]:
+    """The user messages sent since the assistant last spoke."""
+    new = []
+    for msg in reversed(state.messages):
+        if isinstance(msg, AIMessage):
+            break
+        if isinstance(msg, HumanMessage) and isinstance(msg.content, str):
+            new.append(msg)
+    return new[::-1]
+
+@telemetry.traced("node.extract_fields")
+async def extract_fields(state: State, config: RunnableConfig, store: Optional[FireStore] = None) -> dict:
+    """Fills the fields recognizable without an LLM from new messages and documents."""
+    store = store or configuration.store
+    case_id = get_case_id(state, config)
+    messages = _new_messages(state)
+    message_matches = [extraction.extract(msg.content) for msg in messages]
+    documents = [
+        doc for doc in state.case_data.documents
+        if doc.file_id not in state.scanned_files and doc.file_contents
+    ]
+    matches = [m for found in message_matches for m in found]
+    for doc in documents:
+        matches.extend(extraction.extract(doc.file_contents, source=f"file:{doc.file_id}"))
+
+    update: Dict[str, Any] = {}
+    if documents:
+        update["scanned_files"] = [*state.scanned_files, *(doc.file_id for doc in documents)]
+    case_data, user_data, filled = state.case_data, state.user_data, {}
+    if matches:
+        # The user document is read, merged and written under the lock so no other write lands in between
+        async with case_lock(case_id):
+            user_docs = None
+            if any(m.path[0] == "user_data" for m in matches):
+                # The user document is the source of truth the LLM extraction also starts from
+                user_docs = await store.get(('users', case_id))
+                if user_docs:
+                    user_data = validate(UserData, user_docs.data)
+            case_data, user_data, filled = extraction.apply(case_data, user_data, matches, state.field_confidence)
+            if any(key.startswith("case_data.") for key in filled):
+                if merged := await _merge_case(store, case_id, state.case_data, case_data):
+                    case_data = merged
+            if any(key.startswith("user_data.") for key in filled):
+                await _write_user(store, case_id, user_docs.data if user_docs else None, user_data.model_dump(mode="json"))
+    telemetry.count("fields_filled", len(filled))
+
+    if filled:
+        update.update({
+            "case_data": case_data,
+            "user_data": user_data,
+            "field_confidence": {**state.field_confidence, **filled},
+        })
+    # Messages fully captured here need no LLM extraction pass
+    update["fields_covered"] = bool(messages) and all(
+        extraction.covers(msg.content, found)
+        and all(extraction.holds(case_data, user_data, m) for m in found)
+        for msg, found in zip(messages, message_matches)
+    )
+    return update
+
+async def merge_processed_files(graph: Any, case_id: str, store: Optional[FireStore] = None) -> Optional[CaseData]:
+    """Merge a case's finished uploads into its stored case and its interview checkpoint.
+
+    `graph` is the assistant compiled with a checkpointer. Returns the updated
+    case data, None when no upload finished since the last merge.
+    """
+    store = store or configuration.store
+    config = config_for_case(case_id)
+    async with case_lock(case_id):
+        snapshot = await graph.aget_state(config)
+        base = snapshot.values.get("case_data") or CaseData()
+        job_queue = get_job_queue()
+        case_data, finished = job_queue.merge_results(base, case_id)
+        if not finished:
+            return None
+        if case_data is not base:
+            case_data = await _merge_case(store, case_id, base, case_data) or case_data
+            # The next turn starts from the checkpoint, so the documents must be in it
+            await graph.aupdate_state(config, {"case_data": case_data}, as_node="log_messages")
+        job_queue.mark_merged(finished)
+    return case_data
+
+async def store_report(store: FireStore, case_id: str, case_data: CaseData, report: str) -> CaseData:
+    """Write a built report and its status to the stored case, returning the updated case.
+
+    Callers hold the case lock.
+    """
+    updated = case_data.model_copy(update={"case_report": report, "report_status": "Generated"})
+    return await _merge_case(store, case_id, case_data, updated) or updated
+
+async def save_report(graph: Any, case_id: str, report: str, store: Optional[FireStore] = None) -> CaseData:
+    """Store a report built outside the graph with the case and in its interview checkpoint."""
+    store = store or configuration.store
+    config = config_for_case(case_id)
+    async with case_lock(case_id):
+        snapshot = await graph.aget_state(config)
+        case_data = await store_report(store, case_id, snapshot.values.get("case_data") or CaseData(), report)
+        await graph.aupdate_state(config, {"case_data": case_data}, as_node="log_messages")
+    return case_data
+
+async def summarize_messages(summary: str, messages: List[AnyMessage]) -> str:
+    """Fold messages into the running summary of an interview."""
+    transcript = "\n".join(
+        f"{'Client' if isinstance(msg, HumanMessage) else 'Attorney'}: {msg.content}"
+        for msg in messages
+        if isinstance(msg, HumanMessage) or (isinstance(msg, AIMessage) and msg.content and not msg.tool_calls)
+    )
+    with telemetry.span("llm.summarize", messages=len(messages)):
+        result = await configuration.get_llm().ainvoke([SystemMessage(
+            content=prompts.CONVERSATION_SUMMARY_PROMPT.format(summary=summary or "None.", transcript=transcript)
+        )])
+        telemetry.record_usage(result)
+    return result.content
+
+@telemetry.traced("node.log_messages")
+async def log_messages(state: State, config: RunnableConfig, store: Optional[FireStore] = None) -> dict:
+    """Appends the turn's new messages to the case's message log in one batch.
+
+    Once the state holds more than SUMMARY_TRIGGER messages, the older ones
+    are summarized and removed from it, so prompts and checkpoints stay the
+    same size however long the interview gets. They stay in the log.
+    """
+    store = store or configuration.store
+    case_id = get_case_id(state, config)
+    new_messages = state.messages[state.logged_messages:]
+    if not new_messages:
+        return {}
+    message_log = MessageLog(store)
+    async with case_lock(case_id):
+        next_seq = await message_log.append(case_id, new_messages)
+    update: Dict[str, Any] = {"logged_messages": len(state.messages)}
+    cut = summary_cut(state.messages) if len(state.messages) > SUMMARY_TRIGGER else 0
+    if cut:
+        summarized = state.messages[:cut]
+        summary = await summarize_messages(state.summary, summarized)
+        # The state holds the newest logged messages, the summarized ones end `len - cut` before the head
+        through_seq = next_seq - len(state.messages) + cut - 1
+        async with case_lock(case_id):
+            await message_log.add_summary(case_id, summary, through_seq)
+        update.update(
+            summary=summary,
+            messages=[RemoveMessage(id=msg.id) for msg in summarized],
+            logged_messages=len(state.messages) - cut,
         )
-    ]}
+    return update
 
 @tool("process_files")
-async def process_files(state: State, files: List[Dict[str, Any]]) -> Dict[str, Any]:
-    """Process uploaded files and extract relevant information."""
-    processed_files = []
-    
-    for file in files:
-        try:
-            file_id = str(uuid.uuid4())
-            file_content = file.get("content")
-            file_type = file.get("type", "")
-            file_name = file.get("name", "")
-            
-            # Extract text based on file type
-            extracted_text = ""
-            if file_type.startswith('image'):
-                image = Image.open(io.BytesIO(file_content))
-                extracted_text = pytesseract.image_to_string(image)
-            elif file_type == 'application/pdf':
-                pdf = fitz.open(stream=file_content, filetype="pdf")
-                for page in pdf:
-                    extracted_text += page.get_text()
-                pdf.close()
-            else:
-                extracted_text = file_content.decode('utf-8')
-            
-            # Create file metadata
-            file_metadata = CaseFiles(
-                file_id=file_id,
-                file_type=file_type,
-                file_name=file_name,
-                file_size=len(file_content),
-                file_label=f"Uploaded {file_type} document",
-                uploaded_at=datetime.now(),
-                file_contents=extracted_text
-            )
-            
-            # Store file in database
-            await store.set(
-                ('files', file_id),
-                {
-                    "metadata": file_metadata.model_dump(),
-                    "content": file_content
-                }
-            )
-            
-            processed_files.append(file_metadata)
-            
-            # Update case data with new file
-            if state.case_data.documents is None:
-                state.case_data.documents = []
-            state.case_data.documents.append(file_metadata)
-            
-        except Exception as e:
-            return {"error": f"Error processing file {file_name}: {str(e)}"}
-    
+async def process_files(state: State, files: List[Dict[str, Any]], config: RunnableConfig = None) -> Dict[str, Any]:
+    """Queue uploaded files for background extraction and analysis."""
+    case_id = get_case_id(state, config)
+    # Processing happens in the job queue workers, the turn only acknowledges the upload
+    job_queue = get_job_queue()
+    jobs = job_queue.submit(case_id, files)
+    # Finished uploads are stored and marked merged by merge_processed_files
+    case_data, finished = job_queue.merge_results(state.case_data, case_id)
     return {
-        "processed_files": [f.model_dump() for f in processed_files],
-        "case_data": state.case_data
+        "queued_files": [job.progress() for job in jobs],
+        "processed_files": [f.model_dump() for f in finished],
+        "case_data": case_data
     }
 
 @tool("analyze_document")
-async def analyze_document(state: State, file_id: str) -> Dict[str, Any]:
+async def analyze_document(state: State, file_id: str, config: RunnableConfig = None) -> Dict[str, Any]:
     """Analyze a document to extract case-relevant information."""
+    store = configuration.store
     try:
         # Get file from database
         file_data = await store.get(('files', file_id))
         if not file_data:
             return {"error": "File not found"}
         
-        file_metadata = CaseFiles(**file_data["metadata"])
-        
-        # Analyze content with LLM
-        analysis_prompt = f"""
-        Analyze this document and extract any relevant case information:
-        
-        {file_metadata.file_contents}
+        file_metadata = validate(CaseFiles, file_data.data["metadata"])
         
-        Focus on:
-        1. Dates and times
-        2. Names and contact information
-        3. Incident details
-        4. Medical information
-        5. Insurance details
-        6. Financial information
-        """
+        # Only the excerpts relevant to the analysis focus are sent, not the whole text
+        index = get_case_index(get_case_id(state, config))
+        index.add_document(file_metadata)
+        excerpts = format_chunks(index.context(
+            prompts.DOCUMENT_ANALYSIS_QUERY, token_budget=3000, k=16, file_id=file_id
+        ))
         
-        analysis_result = await state.llm.ainvoke([
-            SystemMessage(content=analysis_prompt)
-        ])
+        # Analyze content with LLM
+        analysis_prompt = prompts.DOCUMENT_ANALYSIS_PROMPT.format(document_excerpts=excerpts)
         
-        # Update file metadata with analysis
-        file_metadata.file_analysis = analysis_result.content
+        with telemetry.span("llm.analyze_document", file_id=file_id):
+            analysis_result = await configuration.get_llm().ainvoke([
+                SystemMessage(content=analysis_prompt)
+            ])
+            telemetry.record_usage(analysis_result)
         
-        # Store updated metadata
-        await store.set(
-            ('files', file_id),
-            {
-                "metadata": file_metadata.model_dump(),
-                "content": file_data["content"]
-            }
-        )
+        # Only the analysis field of the file's metadata is written, not its text again
+        await store.update(('files', file_id), {("metadata", "file_analysis"): analysis_result.content})
         
         return {
             "file_id": file_id,
@@ -229,14 +500,15 @@ async def analyze_document(state: State, file_id: str) -> Dict[str, Any]:
 @tool("get_document")
 async def get_document(state: State, file_id: str) -> Dict[str, Any]:
     """Retrieve a document from the database."""
+    store = configuration.store
     try:
         file_data = await store.get(('files', file_id))
         if not file_data:
             return {"error": "File not found"}
             
         return {
-            "metadata": file_data["metadata"],
-            "content": file_data["content"]
+            "metadata": file_data.data["metadata"],
+            "content": await read_content(store, file_id)
         }
         
     except Exception as e:
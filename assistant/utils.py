@@ -1,17 +1,29 @@
 """Utility functions used in our graph."""
 
-from typing import List, Dict, Any
-from configuration import Memory, db, conf
+from typing import List, Dict, Any, Sequence, Tuple
 import uuid     
-from datetime import datetime
-from langchain.schema import SystemMessage, HumanMessage
+from langchain_core.messages import AIMessage, BaseMessage, SystemMessage, HumanMessage, ToolMessage
 from PIL import Image
 import pytesseract
 import fitz 
+from assistant import prompts, telemetry
+from assistant.state import CaseFiles
+import asyncio
+import base64
+import mmap
 import io
+import os
+import re
 import json
 
-from memory_agent import configuration
+# Vision requests: images per request, encoded bytes per request, longest image side sent
+VISION_MAX_IMAGES = int(os.getenv("VISION_MAX_IMAGES", 10))
+VISION_MAX_REQUEST_BYTES = int(os.getenv("VISION_MAX_REQUEST_BYTES", 15 * 1024 * 1024))
+VISION_MAX_SIDE = int(os.getenv("VISION_MAX_SIDE", 1568))
+VISION_CONCURRENCY = int(os.getenv("VISION_CONCURRENCY", 4))
+# Images whose perceptual hashes differ in at most this many of 64 bits are treated as duplicates
+DUPLICATE_DISTANCE = int(os.getenv("VISION_DUPLICATE_DISTANCE", 6))
+IMAGE_HEADER = re.compile(r"^\s*(?:#+|\*\*)\s*image\s+(\d+)\b.*$", re.IGNORECASE | re.MULTILINE)
 
 def split_model_and_provider(fully_specified_name: str) -> dict:
     """Initialize the configured chat model."""
@@ -23,52 +35,222 @@ def split_model_and_provider(fully_specified_name: str) -> dict:
     return {"model": model, "provider": provider}
 
 
-async def file_analysis(file: Dict[str, Any], model: Any) -> Dict[str, Any]:
-    """Extract text and analyze content from different file types"""
-    
-    content = file.get("content")
-    file_type = file.get("type")
-    
-    if not content:
-        return {"error": "No content provided"}
+def prompt_messages(messages: Sequence[BaseMessage]) -> List[BaseMessage]:
+    """The conversation as a model prompt: user and assistant turns with their answered tool calls.
 
+    Tool calls without a result for every call, e.g. from checkpoints written
+    before tool results carried the call IDs, are stripped from their message,
+    and results without a matching call are dropped.
+    """
+    answered = {msg.tool_call_id for msg in messages if isinstance(msg, ToolMessage)}
+    called = set()
+    prompt: List[BaseMessage] = []
+    for msg in messages:
+        if isinstance(msg, HumanMessage):
+            prompt.append(msg)
+        elif isinstance(msg, AIMessage):
+            ids = {call["id"] for call in msg.tool_calls}
+            if ids and ids <= answered:
+                called |= ids
+                prompt.append(msg)
+            elif msg.content:
+                prompt.append(AIMessage(content=msg.content, id=msg.id) if ids else msg)
+        elif isinstance(msg, ToolMessage) and msg.tool_call_id in called:
+            prompt.append(msg)
+    return prompt
+
+
+def _extract_step(file_type: str) -> str:
+    if file_type.startswith('image'):
+        return "extract.ocr"
+    return "extract.pdf" if file_type == 'application/pdf' else "extract.text"
+
+
+def extract_text(content: bytes, file_type: str) -> str:
+    """Extract the raw text from an uploaded file (OCR for images, text layer for PDFs)."""
     extracted_text = ""
-    try:
+    with telemetry.span(_extract_step(file_type), file_type=file_type) as span:
+        span.add("bytes_read", len(content))
         if file_type.startswith('image'):
-            # Handle image files
-            if isinstance(content, Image.Image):
-                # Extract text from image using OCR
-                extracted_text = pytesseract.image_to_string(content)
-                
-                # Get image analysis from vision model
-                vision_response = await model.ainvoke([
-                    SystemMessage(content="Analyze this image and extract all relevant case information. Focus on visible damages, injuries, documents, or other pertinent details."),
-                    HumanMessage(content=[
-                        {"type": "text", "text": "describe the image in detail?"},
-                        {"type": "image_url", "image_url": content}
-                    ])
-                ])
-                extracted_text += f"\nImage Analysis: {vision_response.content}"
-                
+            image = Image.open(io.BytesIO(content))
+            extracted_text = pytesseract.image_to_string(image)
         elif file_type == 'application/pdf':
-            # Handle PDF files
-            pdf_doc = fitz.open(stream=content, filetype="pdf")
-            for page in pdf_doc:
+            pdf = fitz.open(stream=content, filetype="pdf")
+            for page in pdf:
                 extracted_text += page.get_text()
-            pdf_doc.close()
-            
+            span.add("pages", pdf.page_count)
+            pdf.close()
+        else:
+            extracted_text = content.decode('utf-8')
+        span.add("chars", len(extracted_text))
+    return extracted_text
+
+
+def extract_text_from_path(path: str, file_type: str) -> str:
+    """Extract the raw text of a spooled upload without reading it into memory first."""
+    extracted_text = ""
+    with telemetry.span(_extract_step(file_type), file_type=file_type) as span:
+        span.add("bytes_read", os.path.getsize(path))
+        if file_type.startswith('image'):
+            with Image.open(path) as image:
+                extracted_text = pytesseract.image_to_string(image)
+        elif file_type == 'application/pdf':
+            # PyMuPDF parses straight from the memory-mapped file, pages are faulted in on demand
+            with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                pdf = fitz.open(stream=view, filetype="pdf")
+                for page in pdf:
+                    extracted_text += page.get_text()
+                span.add("pages", pdf.page_count)
+                pdf.close()
+                view.release()
+        else:
+            with open(path, 'r', encoding='utf-8') as f:
+                extracted_text = f.read()
+        span.add("chars", len(extracted_text))
+    return extracted_text
+
+
+def load_image(content: Any) -> Image.Image:
+    """Open an image given as a PIL image, bytes or a file path."""
+    if isinstance(content, Image.Image):
+        return content
+    if isinstance(content, (bytes, bytearray)):
+        return Image.open(io.BytesIO(content))
+    return Image.open(content)
+
+def perceptual_hash(image: Image.Image) -> int:
+    """64-bit difference hash: near-identical photos get hashes a few bits apart."""
+    pixels = list(image.convert("L").resize((9, 8), Image.LANCZOS).getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return bits
+
+def image_data_url(image: Image.Image, max_side: int = VISION_MAX_SIDE) -> str:
+    """Downscale an image to the model's useful resolution and encode it as a JPEG data URL."""
+    image = image.convert("RGB")
+    if max(image.size) > max_side:
+        image = image.copy()
+        image.thumbnail((max_side, max_side))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=85)
+    return "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+def split_image_analyses(text: str, count: int) -> Dict[int, str]:
+    """Split a multi-image response on its "### Image <n>" headers, keyed by 1-based image number."""
+    headers = list(IMAGE_HEADER.finditer(text))
+    sections = {}
+    for header, following in zip(headers, [*headers[1:], None]):
+        number = int(header.group(1))
+        body = text[header.end():following.start() if following else len(text)].strip()
+        if 1 <= number <= count and body:
+            sections[number] = body
+    return sections
+
+def batch_images(urls: Sequence[str], max_images: int = VISION_MAX_IMAGES, max_bytes: int = VISION_MAX_REQUEST_BYTES) -> List[List[int]]:
+    """Group image indexes into requests capped by image count and encoded size."""
+    batches: List[List[int]] = []
+    size = 0
+    for index, url in enumerate(urls):
+        if not batches or len(batches[-1]) >= max_images or size + len(url) > max_bytes:
+            batches.append([])
+            size = 0
+        batches[-1].append(index)
+        size += len(url)
+    return batches
+
+async def _describe_images(urls: List[str], labels: List[str], model: Any) -> Dict[int, str]:
+    """One vision request for several images, split back per image (0-based)."""
+    content: List[Dict[str, Any]] = []
+    for number, (url, label) in enumerate(zip(urls, labels), start=1):
+        content.append({"type": "text", "text": f"Image {number}: {label}"})
+        content.append({"type": "image_url", "image_url": {"url": url}})
+    with telemetry.span("llm.vision_batch", images=len(urls)):
+        response = await model.ainvoke([
+            SystemMessage(content=prompts.VISION_BATCH_PROMPT),
+            HumanMessage(content=content)
+        ])
+        telemetry.record_usage(response)
+    if len(urls) == 1:
+        sections = split_image_analyses(response.content, 1)
+        return {0: sections.get(1, response.content.strip())}
+    return {number - 1: body for number, body in split_image_analyses(response.content, len(urls)).items()}
+
+# An image analyzed earlier in the same case: display name, perceptual hash, analysis
+KnownImage = Tuple[str, int, str]
+
+async def _analyze_loaded(
+    loaded: List[Tuple[str, Image.Image]], hashes: List[int], model: Any,
+    names: Dict[str, str], known: Sequence[KnownImage]
+) -> Dict[str, str]:
+    """Describe images with as few vision requests as the limits allow.
+
+    Near-duplicate photos (by perceptual hash), among `loaded` or of a `known`
+    image, are not sent and share the analysis of the first copy. Images a
+    batched response did not cover are retried one per request.
+    """
+    def near(a: int, b: int) -> bool:
+        return bin(a ^ b).count("1") <= DUPLICATE_DISTANCE
+
+    unique: List[int] = []
+    duplicate_of: Dict[int, int] = {}
+    known_duplicates: Dict[int, KnownImage] = {}
+    for index, digest in enumerate(hashes):
+        earlier = next((image for image in known if near(image[1], digest)), None)
+        original = next((u for u in unique if near(hashes[u], digest)), None)
+        if earlier is not None:
+            known_duplicates[index] = earlier
+        elif original is None:
+            unique.append(index)
         else:
-            # Handle text-based documents
-            if isinstance(content, bytes):
-                extracted_text = content.decode('utf-8')
-            else:
-                extracted_text = str(content)
-    
-    except Exception as e:
-        return {"error": f"Error processing file: {str(e)}"}
-
-    return {
-        "extracted_text": extracted_text,
-        "file_type": file_type,
-        "processed_at": datetime.now().isoformat()
-    }
+            duplicate_of[index] = original
+    telemetry.count("images_deduplicated", len(duplicate_of) + len(known_duplicates))
+
+    urls = await asyncio.to_thread(lambda: [image_data_url(loaded[i][1]) for i in unique])
+    keys = [loaded[i][0] for i in unique]
+    labels = [names.get(key, key) for key in keys]
+    semaphore = asyncio.Semaphore(VISION_CONCURRENCY)
+
+    async def run(batch: List[int]) -> Dict[int, str]:
+        async with semaphore:
+            described = await _describe_images([urls[i] for i in batch], [labels[i] for i in batch], model)
+        return {batch[i]: text for i, text in described.items()}
+
+    results: Dict[int, str] = {}
+    for described in await asyncio.gather(*(run(batch) for batch in batch_images(urls))):
+        results.update(described)
+    if missing := [i for i in range(len(unique)) if i not in results]:
+        for described in await asyncio.gather(*(run([i]) for i in missing)):
+            results.update(described)
+
+    analyses = {keys[i]: results.get(i, "") for i in range(len(unique))}
+    for index, original in duplicate_of.items():
+        first = loaded[original][0]
+        analyses[loaded[index][0]] = f"Near-duplicate of {names.get(first, first)}. {analyses[first]}"
+    for index, (name, _, analysis) in known_duplicates.items():
+        analyses[loaded[index][0]] = f"Near-duplicate of {name}. {analysis}"
+    return analyses
+
+async def analyze_case_images(
+    case_files: List[CaseFiles], sources: Dict[str, Any], model: Any, known: Sequence[KnownImage] = ()
+) -> Dict[str, int]:
+    """Fill in `file_analysis` of a case's image files from shared vision requests.
+
+    `sources` maps file_id to the image bytes or path; files without a source
+    or that are not images are left unchanged. `known` are the case's images
+    analyzed before, whose near-duplicates are not sent again. Returns the
+    perceptual hash of every analyzed file by file_id.
+    """
+    images = [f for f in case_files if f.file_type.startswith('image') and f.file_id in sources]
+    if not images:
+        return {}
+    loaded = await asyncio.to_thread(lambda: [(f.file_id, load_image(sources[f.file_id])) for f in images])
+    hashes = [perceptual_hash(image) for _, image in loaded]
+    analyses = await _analyze_loaded(
+        loaded, hashes, model, {f.file_id: f.file_name for f in images if f.file_name}, known
+    )
+    for case_file in images:
+        case_file.file_analysis = analyses[case_file.file_id]
+    return {f.file_id: digest for f, digest in zip(images, hashes)}
@@ -0,0 +1,93 @@
+"""Benchmark the Memory payload codecs on a realistic full case.
+
+Usage: python -m benchmarks.bench_codecs [--documents 5] [--pages 40] [--rounds 20]
+"""
+
+from assistant.codecs import COMPRESSORS, PayloadCodec
+from assistant.state import CaseData
+import argparse
+import json
+import random
+import time
+
+WORDS = (
+    "patient presented emergency department pain lumbar cervical strain MRI "
+    "impression mild disc bulge L4-L5 prescribed ibuprofen physical therapy "
+    "follow-up weeks insurance claim policy adjuster collision intersection "
+    "vehicle rear-ended police report witness statement date time location "
+    "diagnosis treatment plan restrictions lifting work note invoice total due"
+).split()
+
+def make_case(documents: int, pages: int, seed: int = 7) -> dict:
+    """Build a full case dump with OCR-sized document text."""
+    rng = random.Random(seed)
+    files = []
+    for i in range(documents):
+        text = "\n".join(
+            " ".join(rng.choice(WORDS) for _ in range(350)) for _ in range(pages)
+        )
+        files.append({
+            "file_id": f"file-{i}",
+            "file_type": "application/pdf",
+            "file_name": f"medical_record_{i}.pdf",
+            "file_size": len(text) * 3,
+            "file_label": "Medical record",
+            "file_analysis": " ".join(rng.choice(WORDS) for _ in range(400)),
+            "file_contents": text,
+        })
+    case = CaseData.model_validate({
+        "user_data": {"first_name": "Jane", "last_name": "Doe", "email": "jane@example.com", "phone": "555-123-4567"},
+        "incident_details": {
+            "incident_date": "2024-03-02T10:30:00",
+            "incident_location": "5th Ave & Main St",
+            "incident_description": "Rear-ended at a red light",
+            "incident_type": "car accident",
+        },
+        "damages_info": {"medical_expenses": 12500.5, "lost_wages": 3200.0},
+        "documents": files,
+    })
+    return case.model_dump(mode="json")
+
+def stored_size(value) -> int:
+    """Approximate stored size of a packed payload, blobs counted at their length."""
+    if isinstance(value, dict):
+        return sum(len(str(k)) + stored_size(v) for k, v in value.items())
+    if isinstance(value, list):
+        return sum(stored_size(v) for v in value)
+    if isinstance(value, bytes):
+        return len(value)
+    return len(json.dumps(value).encode("utf-8"))
+
+def measure(fn, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - start) / rounds
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--documents", type=int, default=5)
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    payload = make_case(args.documents, args.pages)
+    raw_size = len(json.dumps(payload).encode("utf-8"))
+    print(f"case payload: {raw_size / 1e6:.2f} MB as plain JSON")
+    print(f"{'codec':<18}{'pack MB/s':>12}{'unpack MB/s':>12}{'stored bytes':>14}{'ratio':>8}")
+    # Field-level packing as used by FireStore.set
+    for compressor in COMPRESSORS.values():
+        codec = PayloadCodec(compressor=compressor)
+        packed = codec.pack(payload)
+        assert codec.unpack(packed) == payload
+        pack_s = measure(lambda: codec.pack(payload), args.rounds)
+        unpack_s = measure(lambda: codec.unpack(packed), args.rounds)
+        stored = stored_size(packed)
+        print(
+            f"{'fields+' + compressor.name:<18}"
+            f"{raw_size / pack_s / 1e6:>12.1f}{raw_size / unpack_s / 1e6:>12.1f}"
+            f"{stored:>14}{raw_size / stored:>8.1f}"
+        )
+
+if __name__ == "__main__":
+    main()
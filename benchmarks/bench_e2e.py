@@ -0,0 +1,314 @@
+"""End-to-end benchmark and load test of the compiled assistant graph.
+
+Runs without Firebase or provider keys: the store is the in-memory backend
+(ASSISTANT_STORE=memory) and the chat model is the scripted FakeChatModel from
+benchmarks.fakes, so everything except the model itself runs for real.
+
+Usage: python -m benchmarks.bench_e2e [--scenarios turns,growth,ingest,load]
+       [--sessions 10] [--turns 8] [--latency-ms 300] [--output results.json] [--baseline old.json]
+
+Scenarios:
+  turns   turn latency of a single interview, with the per-node breakdown
+  growth  extraction cost (time and prompt tokens) as the conversation grows
+  ingest  file-ingestion throughput for PDFs and images through the job queue
+  load    N concurrent sessions, p50/p95/p99 turn latency and throughput
+
+Results are written as JSON; with --baseline the run is compared against an
+earlier result file metric by metric.
+"""
+
+import os
+
+os.environ.setdefault("ASSISTANT_STORE", "memory")
+
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+from langchain_core.messages import HumanMessage
+from assistant import configuration, planner, telemetry
+from assistant.checkpointer import StoreCheckpointer, config_for_case
+from assistant.jobs import JobQueue, make_processor
+from benchmarks.fakes import FakeChatModel
+import argparse
+import asyncio
+import platform
+import tempfile
+import shutil
+import random
+import json
+import time
+import io
+
+SCRIPT = [
+    "I was rear-ended at a red light on Main Street last Tuesday around 5pm.",
+    "My name is Jane Doe and my phone number is 555-123-4567.",
+    "My neck and lower back have hurt ever since, and I get headaches most afternoons.",
+    "I went to the emergency room at Memorial Hospital that night and they took x-rays.",
+    "I've been doing physical therapy twice a week with Dr. Smith.",
+    "My insurance is with Acme Mutual, the claim number is CLM-998877.",
+    "I missed three weeks of work at the warehouse, about $3,200 in wages.",
+    "The other driver's insurer offered $5,000 but I haven't signed anything.",
+    "A neighbor, Mary Wilson, saw the whole thing and gave a statement to the police.",
+    "My car needed $4,100 of repairs to the rear bumper and trunk.",
+]
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    """Nearest-rank p50/p95/p99, mean and max, rounded to 0.1 ms."""
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def rank(p: float) -> float:
+        return ordered[min(max(int(round(p / 100 * len(ordered) + 0.5)) - 1, 0), len(ordered) - 1)]
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered), 1),
+        "p50_ms": round(rank(50), 1),
+        "p95_ms": round(rank(95), 1),
+        "p99_ms": round(rank(99), 1),
+        "max_ms": round(ordered[-1], 1),
+    }
+
+def user_message(session: int, turn: int) -> str:
+    return SCRIPT[(session + turn) % len(SCRIPT)]
+
+class Harness:
+    """Compiles the graph once against the in-memory store and the fake model."""
+
+    def __init__(self, model: FakeChatModel):
+        from assistant.graph import builder
+        configuration.set_llm(model)
+        self.model = model
+        self.store = configuration.store
+        self.graph = builder.compile(checkpointer=StoreCheckpointer(self.store))
+        self.spans = telemetry.memory_exporter()
+
+    async def turn(self, case_id: str, text: str, **attributes: Any) -> float:
+        """Run one user turn; returns its latency in ms."""
+        start = time.perf_counter()
+        with telemetry.span("turn", case_id=case_id, **attributes):
+            await self.graph.ainvoke(
+                {"messages": [HumanMessage(content=text)], "case_id": case_id},
+                config_for_case(case_id)
+            )
+        return (time.perf_counter() - start) * 1000
+
+    async def interview(self, case_id: str, session: int, turns: int, latencies: List[float]) -> None:
+        for turn in range(turns):
+            latencies.append(await self.turn(case_id, user_message(session, turn), turn=turn))
+
+async def bench_turns(harness: Harness, args: argparse.Namespace) -> Dict[str, Any]:
+    harness.spans.clear()
+    latencies: List[float] = []
+    await harness.interview("bench-turns", 0, args.turns, latencies)
+    breakdown = telemetry.summarize(harness.spans.spans())
+    return {
+        "latency": percentiles(latencies),
+        "per_turn_ms": [round(v, 1) for v in latencies],
+        "breakdown": {
+            name: {k: round(v, 1) for k, v in entry.items()}
+            for name, entry in sorted(breakdown.items())
+        },
+    }
+
+async def bench_growth(harness: Harness, args: argparse.Namespace) -> Dict[str, Any]:
+    harness.spans.clear()
+    latencies: List[float] = []
+    await harness.interview("bench-growth", 0, args.growth_turns, latencies)
+    turns = {
+        s.trace_id: s.attributes["turn"] for s in harness.spans.spans() if s.name == "turn"
+    }
+    points: Dict[int, Dict[str, float]] = {}
+    for s in harness.spans.spans():
+        if s.name in ("trustcall.case_data", "trustcall.user_data", "node.case_manager") and s.trace_id in turns:
+            point = points.setdefault(turns[s.trace_id], {"extraction_ms": 0.0, "case_manager_ms": 0.0})
+            if s.name == "node.case_manager":
+                point["case_manager_ms"] += round(s.duration_ms, 1)
+            else:
+                point["extraction_ms"] += round(s.duration_ms, 1)
+                point["extraction_tokens_in"] = point.get("extraction_tokens_in", 0) + s.counters.get("tokens_in", 0)
+    return {
+        "turn_latency_ms": [round(v, 1) for v in latencies],
+        "by_turn": {str(turn): points[turn] for turn in sorted(points)},
+    }
+
+def make_pdf(pages: int, rng: random.Random) -> bytes:
+    import fitz
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page()
+        text = "\n".join(" ".join(rng.choice(SCRIPT).split()[:12]) for _ in range(40))
+        page.insert_text((40, 40), text, fontsize=9)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+def make_image(rng: random.Random) -> bytes:
+    from PIL import Image, ImageDraw
+    image = Image.new("RGB", (1200, 800), "white")
+    draw = ImageDraw.Draw(image)
+    for line in range(20):
+        draw.text((30, 30 + line * 36), rng.choice(SCRIPT), fill="black")
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+async def bench_ingest(harness: Harness, args: argparse.Namespace) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    kinds: Dict[str, Callable[[], bytes]] = {"pdf": lambda: make_pdf(args.pdf_pages, rng)}
+    results: Dict[str, Any] = {}
+    if shutil.which("tesseract"):
+        kinds["image"] = lambda: make_image(rng)
+    else:
+        results["image"] = {"skipped": "tesseract is not installed"}
+
+    for kind, make in kinds.items():
+        files = [
+            {
+                "name": f"{kind}-{i}.{'pdf' if kind == 'pdf' else 'png'}",
+                "type": "application/pdf" if kind == "pdf" else "image/png",
+                "content": make(),
+            }
+            for i in range(args.files)
+        ]
+        total_bytes = sum(len(f["content"]) for f in files)
+        workdir = tempfile.mkdtemp(prefix="bench-ingest-")
+        processor = make_processor(store=harness.store)
+        finished: List[float] = []
+
+        async def timed(job: Any) -> Any:
+            result = await processor(job)
+            finished.append(time.perf_counter())
+            return result
+
+        queue = JobQueue(
+            path=os.path.join(workdir, "jobs.db"),
+            processor=timed,
+            workers=args.workers,
+            spool_dir=os.path.join(workdir, "spool"),
+            poll_interval=0.01,
+        )
+        case_id = f"bench-ingest-{kind}"
+        try:
+            start = time.perf_counter()
+            queue.submit(case_id, files)
+            await queue.start()
+            while queue.pending_count(case_id) and time.perf_counter() - start < args.ingest_timeout:
+                await asyncio.sleep(0.01)
+            elapsed = time.perf_counter() - start
+            await queue.stop()
+            progress = queue.progress(case_id)
+            results[kind] = {
+                "files": len(files),
+                "mb": round(total_bytes / 1e6, 2),
+                "done": sum(job["status"] == "done" for job in progress),
+                "failed": sum(job["status"] == "failed" for job in progress),
+                "elapsed_s": round(elapsed, 3),
+                "files_per_s": round(len(finished) / elapsed, 2),
+                "mb_per_s": round(total_bytes / elapsed / 1e6, 2),
+                "completion": percentiles([(t - start) * 1000 for t in finished]),
+            }
+        finally:
+            queue.close()
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+async def bench_load(harness: Harness, args: argparse.Namespace) -> Dict[str, Any]:
+    latencies: List[float] = []
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        harness.interview(f"bench-load-{session}", session, args.turns, latencies)
+        for session in range(args.sessions)
+    ))
+    elapsed = time.perf_counter() - start
+    return {
+        "sessions": args.sessions,
+        "turns_per_session": args.turns,
+        "elapsed_s": round(elapsed, 3),
+        "turns_per_s": round(len(latencies) / elapsed, 2),
+        "latency": percentiles(latencies),
+    }
+
+SCENARIOS = {"turns": bench_turns, "growth": bench_growth, "ingest": bench_ingest, "load": bench_load}
+
+def flatten(data: Any, prefix: str = "") -> Dict[str, float]:
+    """Numeric leaves of a result, keyed by dotted path."""
+    if isinstance(data, dict):
+        return {k: v for key, value in data.items() for k, v in flatten(value, f"{prefix}{key}.").items()}
+    if isinstance(data, (int, float)) and not isinstance(data, bool):
+        return {prefix.rstrip("."): float(data)}
+    return {}
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """Lines comparing every metric present in both runs."""
+    current, previous = flatten(results["scenarios"]), flatten(baseline.get("scenarios", {}))
+    lines = []
+    for key in sorted(current.keys() & previous.keys()):
+        if previous[key]:
+            change = (current[key] - previous[key]) / previous[key] * 100
+            lines.append(f"{key:<60}{previous[key]:>12.1f}{current[key]:>12.1f}{change:>+9.1f}%")
+    return lines
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    model = FakeChatModel(
+        latency_ms=args.latency_ms,
+        jitter=args.jitter,
+        distribution=args.distribution,
+        tokens_per_s=args.tokens_per_s,
+        prefill_tokens_per_s=args.prefill_tokens_per_s,
+        output_tokens=args.output_tokens,
+        seed=args.seed,
+    )
+    harness = Harness(model)
+    results: Dict[str, Any] = {
+        "started_at": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "parameters": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+        "scenarios": {},
+    }
+    for name in args.scenarios.split(","):
+        start = time.perf_counter()
+        print(f"running {name}...", flush=True)
+        results["scenarios"][name] = await SCENARIOS[name](harness, args)
+        results["scenarios"][name]["scenario_s"] = round(time.perf_counter() - start, 3)
+    results["model"] = {"calls": model.calls, "input_tokens": model.input_tokens, **planner.stats.as_dict()}
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="End-to-end benchmark with a fake chat model and in-memory store.")
+    parser.add_argument("--scenarios", default="turns,growth,ingest,load")
+    parser.add_argument("--sessions", type=int, default=10, help="concurrent sessions in the load scenario")
+    parser.add_argument("--turns", type=int, default=8, help="user turns per session")
+    parser.add_argument("--growth-turns", type=int, default=20, help="turns of the growth scenario")
+    parser.add_argument("--files", type=int, default=20, help="files per type in the ingest scenario")
+    parser.add_argument("--pdf-pages", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=4, help="job queue workers in the ingest scenario")
+    parser.add_argument("--ingest-timeout", type=float, default=300.0)
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="mean base latency of a model call")
+    parser.add_argument("--jitter", type=float, default=0.25, help="relative spread of the base latency")
+    parser.add_argument("--distribution", choices=["fixed", "normal", "lognormal"], default="lognormal")
+    parser.add_argument("--tokens-per-s", type=float, default=200.0, help="simulated output token rate")
+    parser.add_argument("--prefill-tokens-per-s", type=float, default=50000.0, help="simulated prompt token rate")
+    parser.add_argument("--output-tokens", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="result file (default benchmarks/results/e2e-<timestamp>.json)")
+    parser.add_argument("--baseline", help="earlier result file to compare against")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    output = args.output or os.path.join(
+        os.path.dirname(__file__), "results", f"e2e-{datetime.now():%Y%m%d-%H%M%S}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results["scenarios"], indent=2))
+    print(f"results written to {output}")
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"{'metric':<60}{'baseline':>12}{'current':>12}{'change':>10}")
+        print("\n".join(compare(results, baseline)))
+
+if __name__ == "__main__":
+    main()
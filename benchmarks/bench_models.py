@@ -0,0 +1,83 @@
+"""Benchmark validation and serialization of the state models on a realistic full case.
+
+Usage: python -m benchmarks.bench_models [--documents 5] [--pages 40] [--rounds 50]
+"""
+
+from assistant.serialization import dump_changed, dump_json, validate, validate_json
+from assistant.state import CaseData
+from benchmarks.bench_codecs import make_case, measure
+from pydantic import BaseModel
+from typing import Any, List, Union, get_args, get_origin
+import argparse
+import json
+import warnings
+
+def full_case(documents: int, pages: int) -> dict:
+    """A case with every section filled in, on top of the codec benchmark's documents."""
+    data = make_case(documents, pages)
+    data.update({
+        "witness_info": {"name": "Mary Wilson", "contact_info": "(555) 987-6543", "relationship": "Neighbor", "statement": "I saw the truck run the light"},
+        "injury_details": {"list_injury_details": ["whiplash", "lumbar strain"], "symptom_details": ["neck pain", "headaches"], "injury_severity": "moderate"},
+        "medical_info": {"initial_treatment": "Went to ER", "treatment_facilities": ["Memorial Hospital"], "treating_physicians": ["Dr. Smith"], "medications": ["Ibuprofen"]},
+        "insurance_info": {"client_insurance": {"company_name": "Acme Mutual", "policy_number": "PN-123456", "policy_start_date": "2023-01-01"}, "insurance_notified": True, "claim_number": "CLM-998877"},
+        "employment_info": {"current_employer": {"company_name": "XYZ Corp."}, "position": "Warehouse associate", "work_missed": "3 weeks"},
+        "legal_info": {"prior_attorneys": "None", "desired_outcome": "Cover medical bills and lost wages"},
+    })
+    return CaseData.model_validate(data).model_dump(mode="json")
+
+def construct(tp: Any, data: Any) -> Any:
+    """Build a model tree from trusted data with `model_construct` at every level, no validation."""
+    origin = get_origin(tp)
+    if origin is Union:
+        args = [arg for arg in get_args(tp) if arg is not type(None)]
+        return construct(args[0], data) if data is not None and len(args) == 1 else data
+    if origin in (list, List):
+        (item,) = get_args(tp)
+        return [construct(item, value) for value in data]
+    if isinstance(tp, type) and issubclass(tp, BaseModel) and isinstance(data, dict):
+        fields = tp.model_fields
+        return tp.model_construct(**{
+            name: construct(fields[name].annotation, value) if name in fields else value
+            for name, value in data.items()
+        })
+    return data
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--documents", type=int, default=5)
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    data = full_case(args.documents, args.pages)
+    raw = json.dumps(data).encode()
+    case = CaseData.model_validate(data)
+    assert validate_json(CaseData, raw) == case
+    edited = case.model_copy(update={"medical_info": case.medical_info.model_copy(update={"current_treatment": "Physical therapy"})})
+    assert list(dump_changed(case, edited)) == ["medical_info"]
+    with warnings.catch_warnings():
+        # model_construct leaves dates as the strings it was given, the dump warns about them
+        warnings.simplefilter("ignore", UserWarning)
+        assert construct(CaseData, data).model_dump(mode="json") == data
+
+    print(f"case payload: {len(raw) / 1e6:.2f} MB as JSON")
+    results = [
+        ("model_validate(dict)", lambda: CaseData.model_validate(data)),
+        ("validate(dict)", lambda: validate(CaseData, data)),
+        ("model_construct(shallow)", lambda: CaseData.model_construct(**data)),
+        ("model_construct(nested)", lambda: construct(CaseData, data)),
+        ("model_validate_json", lambda: CaseData.model_validate_json(raw)),
+        ("json.loads+validate", lambda: CaseData.model_validate(json.loads(raw))),
+        ("validate_json", lambda: validate_json(CaseData, raw)),
+        ("model_dump(json)", lambda: case.model_dump(mode="json")),
+        ("model_dump_json", lambda: case.model_dump_json()),
+        ("dump_json", lambda: dump_json(case)),
+        ("dump_changed(1 section)", lambda: dump_changed(case, edited)),
+    ]
+    print(f"{'operation':<26}{'ms/op':>10}{'ops/s':>10}")
+    for name, fn in results:
+        seconds = measure(fn, args.rounds)
+        print(f"{name:<26}{seconds * 1000:>10.3f}{1 / seconds:>10.0f}")
+
+if __name__ == "__main__":
+    main()
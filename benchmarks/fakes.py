@@ -0,0 +1,159 @@
+"""Deterministic stand-ins for the chat model used by the end-to-end benchmarks.
+
+`FakeChatModel` answers with scripted text and tool calls, sleeps for a
+simulated provider latency (base latency from a seeded distribution plus
+prompt and output tokens at configurable rates) and reports token usage like a
+real provider, so graph, trustcall, store and serialization costs are measured
+for real while the model is not.
+"""
+
+from typing import Any, Dict, List, Optional, Sequence
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import ConfigDict, PrivateAttr
+import asyncio
+import hashlib
+import random
+import time
+import uuid
+
+FILLER = (
+    "Thank you for sharing that. Could you tell me a little more about what happened next, "
+    "including when you first noticed the pain and whether anyone helped you at the scene?"
+).split()
+
+USER_KEYWORDS = ("name", "email", "phone", "born", "address")
+
+# Case sections the scripted extraction fills, one per turn in rotation
+SECTION_PATCHES = [
+    ("incident_details", lambda text: {"incident_description": text, "incident_type": "car accident"}),
+    ("injury_details", lambda text: {"list_injury_details": [text[:60]], "injury_severity": "moderate"}),
+    ("medical_info", lambda text: {"initial_treatment": text[:80], "treatment_facilities": ["Memorial Hospital"]}),
+    ("damages_info", lambda text: {"medical_expenses": float(len(text) * 10), "lost_wages": 1200.0}),
+    ("insurance_info", lambda text: {"client_insurance": {"company_name": "Acme Mutual"}, "claim_number": "CLM-1"}),
+    ("legal_info", lambda text: {"desired_outcome": text[:80]}),
+]
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+class FakeChatModel(BaseChatModel):
+    """Scripted chat model with simulated latency and token accounting.
+
+    Latency per call is `latency_ms` drawn from `distribution` ("fixed",
+    "normal" or "lognormal", with `jitter` as the relative spread), plus the
+    prompt tokens at `prefill_tokens_per_s` and the output tokens at
+    `tokens_per_s`. Draws come from a generator seeded with `seed`.
+    """
+
+    latency_ms: float = 300.0
+    jitter: float = 0.25
+    distribution: str = "lognormal"
+    tokens_per_s: float = 80.0
+    prefill_tokens_per_s: float = 8000.0
+    output_tokens: int = 60
+    seed: int = 7
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    _rng: random.Random = PrivateAttr()
+    calls: int = 0
+    input_tokens: int = 0
+
+    def model_post_init(self, __context: Any) -> None:
+        self._rng = random.Random(self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    def bind_tools(self, tools: Sequence[Any], *, tool_choice: Optional[str] = None, **kwargs: Any) -> Any:
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], tool_choice=tool_choice, **kwargs)
+
+    def _base_latency(self) -> float:
+        mean = self.latency_ms / 1000
+        if self.distribution == "fixed" or mean <= 0:
+            return max(mean, 0.0)
+        if self.distribution == "normal":
+            return max(self._rng.gauss(mean, mean * self.jitter), 0.0)
+        return self._rng.lognormvariate(0, self.jitter) * mean
+
+    def _respond(self, messages: List[BaseMessage], tools: Optional[List[Dict[str, Any]]]) -> tuple:
+        prompt = "\n".join(str(m.content) for m in messages)
+        input_tokens = estimate_tokens(prompt)
+        human = [m for m in messages if isinstance(m, HumanMessage)]
+        text = str(human[-1].content) if human else ""
+        turn = len(human)
+        names = [t["function"]["name"] for t in tools or []]
+
+        tool_calls = []
+        if "PatchDoc" in names:
+            target = next(name for name in names if name != "PatchDoc")
+            if target == "CaseData":
+                section, build = SECTION_PATCHES[turn % len(SECTION_PATCHES)]
+                patches = [{"op": "add", "path": f"/{section}", "value": build(text)}]
+            else:
+                patches = [{"op": "add", "path": "/phone", "value": f"555-01{turn % 100:02d}"}]
+            tool_calls.append({"name": "PatchDoc", "args": {
+                "json_doc_id": target, "planned_edits": "scripted", "patches": patches
+            }})
+        elif "UserData" in names and "CaseData" not in names:
+            tool_calls.append({"name": "UserData", "args": {"first_name": "Jane", "last_name": "Doe"}})
+        elif "CaseData" in names and "UserData" not in names:
+            section, build = SECTION_PATCHES[turn % len(SECTION_PATCHES)]
+            tool_calls.append({"name": "CaseData", "args": {section: build(text)}})
+        elif names:
+            # The case manager: extract user details when they come up, case details otherwise
+            name = "UserData" if any(k in text.lower() for k in USER_KEYWORDS) else "CaseData"
+            tool_calls.append({"name": name, "args": {}})
+        for call in tool_calls:
+            call["id"] = f"call_{uuid.UUID(int=self._rng.getrandbits(128)).hex[:12]}"
+
+        digest = int(hashlib.sha1(text.encode()).hexdigest(), 16)
+        words = [FILLER[(digest + i) % len(FILLER)] for i in range(self.output_tokens)]
+        content = "" if tool_calls and "PatchDoc" in names else " ".join(words)
+        message = AIMessage(
+            content=content,
+            tool_calls=tool_calls,
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": self.output_tokens,
+                "total_tokens": input_tokens + self.output_tokens,
+            },
+        )
+        delay = (
+            self._base_latency()
+            + input_tokens / self.prefill_tokens_per_s
+            + self.output_tokens / self.tokens_per_s
+        )
+        self.calls += 1
+        self.input_tokens += input_tokens
+        return message, delay
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        message, delay = self._respond(messages, tools)
+        time.sleep(delay)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        message, delay = self._respond(messages, tools)
+        await asyncio.sleep(delay)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+__all__ = ["FakeChatModel"]
@@ -0,0 +1,4 @@
+import os
+
+# The tests run against the in-memory store, never Firebase
+os.environ.setdefault("ASSISTANT_STORE", "memory")
@@ -0,0 +1,116 @@
+import asyncio
+from typing import Annotated, TypedDict
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.graph import END, START, StateGraph, add_messages
+
+from assistant.checkpointer import DELTAS, SNAPSHOTS, WRITES, StoreCheckpointer, config_for_case
+from assistant.configuration import MemoryStore
+from assistant.state import CaseData
+
+class Interview(TypedDict, total=False):
+    messages: Annotated[list, add_messages]
+    case_data: CaseData
+
+def reply(state: Interview) -> dict:
+    turn = len(state["messages"])
+    case_data = state.get("case_data") or CaseData()
+    return {
+        "messages": [AIMessage(f"answer {turn}")],
+        "case_data": case_data.model_copy(update={"case_report": f"turn {turn}"}),
+    }
+
+def build(store, **kwargs):
+    checkpointer = StoreCheckpointer(store, **kwargs)
+    builder = StateGraph(Interview)
+    builder.add_node("reply", reply)
+    builder.add_edge(START, "reply")
+    builder.add_edge("reply", END)
+    return builder.compile(checkpointer=checkpointer), checkpointer
+
+async def run_turns(graph, case_id, count):
+    for turn in range(count):
+        await graph.ainvoke({"messages": [HumanMessage(f"question {turn}")]}, config_for_case(case_id))
+
+async def state_of(graph, case_id):
+    return (await graph.aget_state(config_for_case(case_id))).values
+
+def test_resume_from_store():
+    store = MemoryStore()
+    graph, _ = build(store)
+    asyncio.run(run_turns(graph, "case-1", 3))
+    resumed, _ = build(store)
+    values = asyncio.run(state_of(resumed, "case-1"))
+    assert [m.content for m in values["messages"]] == [
+        "question 0", "answer 1", "question 1", "answer 3", "question 2", "answer 5"
+    ]
+    assert values["case_data"].case_report == "turn 5"
+
+def test_compaction_keeps_state_and_drops_old_deltas():
+    store = MemoryStore()
+    graph, _ = build(store, compact_every=4)
+    asyncio.run(run_turns(graph, "case-1", 5))
+    assert "case-1" in store.collections[SNAPSHOTS]
+    # The latest compacted delta stays, followed by the ones written since
+    assert len(store.collections[DELTAS]) <= 4
+    resumed, _ = build(store)
+    values = asyncio.run(state_of(resumed, "case-1"))
+    assert len(values["messages"]) == 10
+    assert values["case_data"].case_report == "turn 9"
+
+def test_heads_are_bounded():
+    store = MemoryStore()
+    graph, checkpointer = build(store, max_heads=1)
+
+    async def interleave():
+        for _ in range(2):
+            await run_turns(graph, "case-1", 1)
+            await run_turns(graph, "case-2", 1)
+        return await state_of(graph, "case-1"), await state_of(graph, "case-2")
+
+    first, second = asyncio.run(interleave())
+    assert len(checkpointer._heads) == 1
+    assert len(first["messages"]) == len(second["messages"]) == 4
+
+def test_pending_writes_are_section_deltas_and_pruned():
+    store = MemoryStore()
+    _, checkpointer = build(store)
+    config = config_for_case("case-1")
+
+    async def put_with_writes():
+        checkpoint = empty_checkpoint()
+        checkpoint["channel_values"] = {"case_data": CaseData()}
+        saved = await checkpointer.aput(config, checkpoint, {}, {"case_data": 1})
+        await checkpointer.aput_writes(saved, [("case_data", CaseData(case_report="draft"))], "task-1")
+        pending = (await checkpointer.aget_tuple(saved)).pending_writes
+        stored = [m.data["value"] for m in await store.query(WRITES, [])]
+        child = empty_checkpoint()
+        child["channel_values"] = {"case_data": CaseData(case_report="draft")}
+        await checkpointer.aput(saved, child, {}, {"case_data": 2})
+        return pending, stored
+
+    pending, stored = asyncio.run(put_with_writes())
+    assert pending == [("task-1", "case_data", CaseData(case_report="draft"))]
+    assert [(value["op"], list(value["sections"])) for value in stored] == [("sections", ["case_report"])]
+    assert not store.collections.get(WRITES)
+
+def test_delete_thread_then_get():
+    store = MemoryStore()
+    _, checkpointer = build(store)
+    configs = [config_for_case("case/1"), config_for_case("case/1", "inner"), config_for_case("case/10")]
+
+    async def delete_and_get():
+        for config in configs:
+            checkpoint = empty_checkpoint()
+            checkpoint["channel_values"] = {"case_data": CaseData()}
+            saved = await checkpointer.aput(config, checkpoint, {}, {"case_data": 1})
+            await checkpointer.aput_writes(saved, [("case_data", CaseData(case_report="x"))], "task-1")
+        await checkpointer.adelete_thread("case/1")
+        _, fresh = build(store)
+        return [await fresh.aget_tuple(config) for config in configs]
+
+    deleted, namespaced, other = asyncio.run(delete_and_get())
+    assert deleted is None and namespaced is None
+    assert other is not None
+    assert {m.data["thread"] for c in (DELTAS, WRITES) for m in asyncio.run(store.query(c, []))} == {"case_10"}
@@ -0,0 +1,99 @@
+from datetime import date
+
+import pytest
+
+from assistant import extraction
+from assistant.state import CaseData, UserData
+
+POLICY = "case_data.insurance_info.client_insurance.policy_number"
+
+def values(matches):
+    return {m.key: m.value for m in matches}
+
+@pytest.mark.parametrize("text, expected", [
+    ("My email is jane@example.com", {"user_data.email": "jane@example.com"}),
+    ("you can reach me at (555) 123-4567", {"user_data.phone": "(555) 123-4567"}),
+    ("I was born on March 3, 1985", {"user_data.date_of_birth": date(1985, 3, 3)}),
+    ("policy no. PN-48213", {POLICY: "PN-48213"}),
+    (
+        "the accident happened on 2024-05-01 and my ER bill was $1,250.50",
+        {
+            "case_data.incident_details.incident_date": date(2024, 5, 1),
+            "case_data.damages_info.medical_expenses": 1250.5,
+        },
+    ),
+])
+def test_extract_assigns_fields_from_context(text, expected):
+    assert values(extraction.extract(text)) == expected
+
+def test_extract_skips_other_parties_contact_details():
+    assert extraction.extract("my witness's number is 555-123-4567") == []
+
+def test_extract_without_values():
+    assert extraction.extract("I hurt my back at work") == []
+
+def test_covers_message_of_values_and_filler():
+    text = "My email is jane@example.com, policy no. PN-48213"
+    assert extraction.covers(text, extraction.extract(text))
+
+def test_covers_rejects_unmatched_content():
+    text = "the accident happened on 2024-05-01 and my ER bill was $1,250.50"
+    assert not extraction.covers(text, extraction.extract(text))
+
+def test_covers_requires_a_match():
+    assert not extraction.covers("thanks", [])
+
+def test_covers_rejects_low_confidence_matches():
+    # Ten bare digits may be an account number
+    text = "5551234567"
+    matches = extraction.extract(text)
+    assert matches and not extraction.covers(text, matches)
+
+def test_apply_fills_empty_fields():
+    matches = extraction.extract("My email is jane@example.com, policy no. PN-48213")
+    case_data, user_data, filled = extraction.apply(CaseData(), UserData(), matches, {})
+    assert user_data.email == "jane@example.com"
+    assert case_data.insurance_info.client_insurance.policy_number == "PN-48213"
+    assert filled == {"user_data.email": 0.95, POLICY: 0.9}
+
+def test_apply_keeps_values_from_llm_extraction():
+    user_data = UserData(email="x@example.org")
+    case_data, updated, filled = extraction.apply(CaseData(), user_data, extraction.extract("jane@example.com"), {})
+    assert updated.email == "x@example.org"
+    assert filled == {}
+
+def test_apply_replaces_local_value_with_correction():
+    _, user_data, confidence = extraction.apply(CaseData(), UserData(), extraction.extract("jane@example.com"), {})
+    _, user_data, filled = extraction.apply(CaseData(), user_data, extraction.extract("my email is jane@other.com"), confidence)
+    assert user_data.email == "jane@other.com"
+    assert filled == {"user_data.email": 0.95}
+
+def test_apply_ignores_matches_below_threshold():
+    case_data, user_data = CaseData(), UserData()
+    matches = extraction.extract("5551234567")
+    assert extraction.apply(case_data, user_data, matches, {}) == (case_data, user_data, {})
+
+def test_apply_document_does_not_override_client():
+    case_data, _, confidence = extraction.apply(CaseData(), UserData(), extraction.extract("policy no. PN-48213"), {})
+    from_file = extraction.extract("policy no. PN-99999", source="file:1")
+    case_data, _, filled = extraction.apply(case_data, UserData(), from_file, confidence)
+    assert case_data.insurance_info.client_insurance.policy_number == "PN-48213"
+    assert filled == {}
+
+BILL = (
+    "MEMORIAL HOSPITAL - 40 Temple St, New Haven CT. Questions about this bill? "
+    "Call (203) 555-0199 or email billing@memorialhospital.org\n"
+    "Patient DOB: 03/03/1985\n"
+    "Policy no. PN-48213\n"
+)
+
+def test_extract_document_fills_only_case_fields():
+    assert values(extraction.extract(BILL, source="file:bill")) == {POLICY: "PN-48213"}
+
+def test_apply_document_leaves_client_details_to_the_interview():
+    case_data, user_data, filled = extraction.apply(
+        CaseData(), UserData(), extraction.extract(BILL, source="file:bill"), {}
+    )
+    assert user_data == UserData()
+    assert case_data.insurance_info.client_insurance.policy_number == "PN-48213"
+    assert list(filled) == [POLICY]
@@ -0,0 +1,69 @@
+import asyncio
+
+from assistant.configuration import MemoryStore
+from assistant.jobs import DONE, FAILED, RUNNING, JobQueue, make_processor, read_content
+from assistant.state import CaseData
+
+NOTE = b"ER visit on 2024-03-02, diagnosed with cervical strain."
+
+def queue(tmp_path, **kwargs):
+    kwargs.setdefault("poll_interval", 0.01)
+    return JobQueue(path=str(tmp_path / "jobs.db"), spool_dir=str(tmp_path / "spool"), **kwargs)
+
+async def drain(jobs, case_id):
+    await jobs.start()
+    while jobs.pending_count(case_id):
+        await asyncio.sleep(0.01)
+    await jobs.stop()
+
+def test_upload_round_trip(tmp_path):
+    store = MemoryStore()
+    jobs = queue(tmp_path, processor=make_processor(store=store))
+    (job,) = jobs.submit("case-1", [{"name": "er.txt", "type": "text/plain", "content": NOTE}])
+    asyncio.run(drain(jobs, "case-1"))
+
+    assert [p["status"] for p in jobs.progress("case-1")] == [DONE]
+    case_data, finished = jobs.merge_results(CaseData(), "case-1")
+    assert [f.file_id for f in finished] == [job.job_id]
+    assert case_data.documents[0].file_contents == NOTE.decode()
+    assert case_data.case_files[0].file_contents == ""
+    # The queue drops its copy, the bytes are kept in the store
+    assert asyncio.run(read_content(store, job.job_id)) == NOTE
+    jobs.mark_merged(finished)
+    assert jobs.merge_results(case_data, "case-1")[1] == []
+    # The same file uploaded again is the same job
+    assert jobs.submit("case-1", [{"name": "copy.txt", "type": "text/plain", "content": NOTE}])[0].job_id == job.job_id
+    jobs.close()
+
+def test_resume_after_restart(tmp_path):
+    crashed = queue(tmp_path)
+    crashed.submit("case-1", [
+        {"name": "a.txt", "type": "text/plain", "content": NOTE},
+        {"name": "b.txt", "type": "text/plain", "content": NOTE + b" Follow-up in two weeks."},
+    ])
+    # One job was claimed when the process died, the other never started
+    claimed = crashed._claim()
+    assert claimed.status == RUNNING
+    crashed.close()
+
+    restarted = queue(tmp_path, lease=0, processor=make_processor())
+    asyncio.run(drain(restarted, "case-1"))
+    assert [p["status"] for p in restarted.progress("case-1")] == [DONE, DONE]
+    assert len(restarted.merge_results(CaseData(), "case-1")[0].documents) == 2
+    restarted.close()
+
+def test_failed_upload_is_queued_again(tmp_path):
+    async def broken(job):
+        raise RuntimeError("OCR unavailable")
+
+    jobs = queue(tmp_path, processor=broken, max_attempts=1)
+    (job,) = jobs.submit("case-1", [{"name": "er.txt", "type": "text/plain", "content": NOTE}])
+    asyncio.run(drain(jobs, "case-1"))
+    assert [p["status"] for p in jobs.progress("case-1")] == [FAILED]
+
+    jobs.processor = make_processor()
+    (again,) = jobs.submit("case-1", [{"name": "er.txt", "type": "text/plain", "content": NOTE}])
+    assert again.job_id == job.job_id and again.status != FAILED
+    asyncio.run(drain(jobs, "case-1"))
+    assert [p["status"] for p in jobs.progress("case-1")] == [DONE]
+    jobs.close()
@@ -0,0 +1,56 @@
+import asyncio
+
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from assistant import configuration
+from assistant.configuration import MemoryStore
+from assistant.message_log import SUMMARY_KEEP, SUMMARY_TRIGGER, MessageLog, summary_cut
+from assistant.state import State
+from assistant.tools import log_messages
+
+def conversation(turns, start=0):
+    messages = []
+    for turn in range(start, start + turns):
+        messages += [HumanMessage(f"question {turn}", id=f"h{turn}"), AIMessage(f"answer {turn}", id=f"a{turn}")]
+    return messages
+
+def test_append_then_resume_and_page_back():
+    log = MessageLog(MemoryStore(), page_size=4)
+    messages = conversation(5)
+    assert asyncio.run(log.append("case-1", messages[:6])) == 6
+    assert asyncio.run(log.append("case-1", messages[6:])) == 10
+    resumed = asyncio.run(log.resume("case-1", 4))
+    assert resumed.total == 10 and resumed.summary is None
+    assert [m.content for m in resumed.messages] == ["question 3", "answer 3", "question 4", "answer 4"]
+    older, cursor = asyncio.run(log.page("case-1", resumed.cursor))
+    assert [m.id for m in older] == ["h1", "a1", "h2", "a2"]
+    oldest, cursor = asyncio.run(log.page("case-1", cursor))
+    assert [m.id for m in oldest] == ["h0", "a0"]
+    assert cursor is None
+
+def test_summary_cut_keeps_whole_turns():
+    messages = conversation(3)
+    messages[3:3] = [AIMessage("", id="call", tool_calls=[{"name": "update_case", "args": {}, "id": "t1"}]),
+                     ToolMessage("done", tool_call_id="t1", id="tool")]
+    cut = summary_cut(messages, keep=4)
+    assert isinstance(messages[cut], HumanMessage) and len(messages) - cut >= 4
+    assert summary_cut(messages, keep=len(messages)) == 0
+
+def test_log_messages_summarizes_older_turns(monkeypatch):
+    store = MemoryStore()
+    monkeypatch.setattr(configuration, "get_llm", lambda: FakeListChatModel(responses=["the client hurt their neck"]))
+    messages = conversation(SUMMARY_TRIGGER // 2 + 1)
+    update = asyncio.run(log_messages(State(case_id="case-1", messages=messages), {}, store=store))
+    removed = [m.id for m in update["messages"]]
+    kept = messages[len(removed):]
+    assert removed == [m.id for m in messages[:len(removed)]]
+    assert len(kept) >= SUMMARY_KEEP and isinstance(kept[0], HumanMessage)
+    assert update["logged_messages"] == len(kept)
+    assert update["summary"] == "the client hurt their neck"
+    # The log keeps the whole transcript, resuming reads the summary and the newest page only
+    resumed = asyncio.run(MessageLog(store).resume("case-1", len(kept)))
+    assert resumed.total == len(messages)
+    assert resumed.summary.text == "the client hurt their neck"
+    assert resumed.summary.through_seq == len(removed) - 1
+    assert [m.id for m in resumed.messages] == [m.id for m in kept]
@@ -0,0 +1,44 @@
+import asyncio
+import threading
+import time
+
+from assistant.routing import case_lock
+
+def test_case_lock_is_shared_across_threads_and_loops():
+    holders, overlaps = [], []
+
+    def hold():
+        holders.append(1)
+        if len(holders) > 1:
+            overlaps.append(len(holders))
+        time.sleep(0.002)
+        holders.pop()
+
+    async def session():
+        for _ in range(5):
+            async with case_lock("case-1"):
+                hold()
+
+    def worker():
+        for _ in range(5):
+            with case_lock("case-1"):
+                hold()
+
+    threads = [threading.Thread(target=asyncio.run, args=(session(),)) for _ in range(3)]
+    threads.append(threading.Thread(target=worker))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not overlaps
+
+def test_cancelled_waiter_leaves_the_lock_free():
+    async def main():
+        async with case_lock("case-1"):
+            waiter = asyncio.create_task(case_lock("case-1").__aenter__())
+            await asyncio.sleep(0.01)
+            waiter.cancel()
+            await asyncio.gather(waiter, return_exceptions=True)
+        assert not case_lock("case-1").locked()
+
+    asyncio.run(main())
@@ -0,0 +1,28 @@
+import asyncio
+
+from assistant.configuration import MemoryStore
+from assistant.search import SEARCH_COLLECTION, CaseSearchIndex
+from assistant.state import CaseData
+
+def case(description, expenses):
+    return CaseData.model_validate({
+        "incident_details": {"incident_description": description, "incident_type": "car accident"},
+        "damages_info": {"medical_expenses": expenses},
+        "documents": [{"file_id": "f1", "file_name": "er.pdf", "file_contents": "MRI shows lumbar strain. " * 500}],
+    })
+
+def test_entries_are_stored_on_write_and_loaded_on_first_search():
+    store = MemoryStore()
+    writer = CaseSearchIndex()
+    asyncio.run(writer.update(store, "case-1", case("rear-ended at a red light", 1200.0)))
+    asyncio.run(writer.update(store, "case-2", case("slipped on a wet floor", 80.0)))
+    # Only tokens are kept, the stored entry holds no document text
+    assert "MRI shows" not in str(asyncio.run(store.get((SEARCH_COLLECTION, "case-1"))).data)
+
+    reader = CaseSearchIndex()
+    assert asyncio.run(reader.load(store)) == 2
+    assert asyncio.run(reader.load(store)) == 0
+    hits = reader.search("lumbar red light", amounts={"medical_expenses": (1000.0, None)})
+    assert [hit.case_id for hit in hits] == ["case-1"]
+    assert hits[0].highlights == {"incident": ["red", "light"], "documents": ["lumbar"]}
+    assert [hit.case_id for hit in reader.search(incident_type="Car Accident")] == ["case-1", "case-2"]